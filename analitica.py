@@ -0,0 +1,247 @@
+# analitica.py
+"""
+Registro asíncrono de búsquedas en MongoDB.
+
+Cada búsqueda de /api/buscar se encola en memoria y un hilo en segundo plano
+la escribe por lotes (insert_many) en una colección capped. Si la cola está
+llena el registro se descarta: la analítica nunca debe frenar una búsqueda.
+"""
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from pymongo import MongoClient
+from pymongo.errors import CollectionInvalid
+
+COLECCION_BUSQUEDAS = os.getenv("MONGO_COLECCION_BUSQUEDAS", "busquedas_log")
+# Tamaño máximo de la colección capped (bytes) y de la cola en memoria
+TAMANO_CAPPED = int(os.getenv("ANALITICA_TAMANO_CAPPED", str(50 * 1024 * 1024)))
+TAMANO_COLA = int(os.getenv("ANALITICA_TAMANO_COLA", "10000"))
+TAMANO_LOTE = int(os.getenv("ANALITICA_TAMANO_LOTE", "200"))
+INTERVALO_FLUSH = float(os.getenv("ANALITICA_INTERVALO_FLUSH", "2"))
+# Búsquedas (las más recientes de la ventana) sobre las que se calculan percentiles
+MAX_MUESTRAS_PERCENTILES = int(os.getenv("ANALITICA_MAX_MUESTRAS_PERCENTILES", "100000"))
+
+
+class AnaliticaBusquedas:
+    """
+    Sink de analítica de búsquedas: cola acotada + hilo que escribe por lotes.
+    """
+
+    def __init__(self, uri: str, db_name: str,
+                 collection_name: str = COLECCION_BUSQUEDAS,
+                 tamano_cola: int = TAMANO_COLA,
+                 tamano_lote: int = TAMANO_LOTE,
+                 intervalo_flush: float = INTERVALO_FLUSH):
+        self.uri = uri
+        self.db_name = db_name
+        self.collection_name = collection_name
+        self.tamano_lote = tamano_lote
+        self.intervalo_flush = intervalo_flush
+
+        self._cola: "queue.Queue[dict]" = queue.Queue(maxsize=tamano_cola)
+        self._hilo: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._client: Optional[MongoClient] = None
+
+        self.descartados = 0
+        self.escritos = 0
+
+    # ------------------------------------------------------------------
+    # Conexión / colección
+    # ------------------------------------------------------------------
+    def _coleccion(self):
+        if self._client is None:
+            self._client = MongoClient(self.uri, serverSelectionTimeoutMS=5000)
+        return self._client[self.db_name][self.collection_name]
+
+    def asegurar_coleccion(self):
+        """
+        Crea la colección capped (si no existe) y los índices de consulta.
+        """
+        db = self._coleccion().database
+        try:
+            db.create_collection(self.collection_name, capped=True, size=TAMANO_CAPPED)
+        except CollectionInvalid:
+            pass  # ya existe
+        coleccion = db[self.collection_name]
+        coleccion.create_index("fecha")
+        coleccion.create_index("q_normalizada")
+        return coleccion
+
+    # ------------------------------------------------------------------
+    # Productor (hilo de la petición)
+    # ------------------------------------------------------------------
+    def _asegurar_hilo(self):
+        # Tras un fork (gunicorn) el hilo del proceso padre no existe en el hijo
+        if self._hilo is not None and self._pid == os.getpid() and self._hilo.is_alive():
+            return
+        with self._lock:
+            if self._hilo is not None and self._pid == os.getpid() and self._hilo.is_alive():
+                return
+            if self._pid != os.getpid():
+                self._client = None
+                self._cola = queue.Queue(maxsize=self._cola.maxsize)
+            self._pid = os.getpid()
+            self._hilo = threading.Thread(
+                target=self._bucle, name="analitica-busquedas", daemon=True
+            )
+            self._hilo.start()
+
+    def registrar(self, q: str, tipo: str, hits: Optional[int], took_ms: Optional[int],
+                  latencia_ms: float, cache_hit: bool = False, **extra) -> bool:
+        """
+        Encola una búsqueda. Nunca bloquea: si la cola está llena se descarta.
+        `hits` es None cuando no se conoce (respuesta 304 desde la caché del navegador).
+        """
+        self._asegurar_hilo()
+        registro = {
+            "fecha": datetime.now(timezone.utc),
+            "q": q,
+            "q_normalizada": q.strip().lower(),
+            "tipo": tipo or "",
+            "hits": None if hits is None else int(hits),
+            "took_ms": took_ms,
+            "latencia_ms": round(float(latencia_ms), 2),
+            "cache_hit": bool(cache_hit),
+        }
+        registro.update(extra)
+        try:
+            self._cola.put_nowait(registro)
+            return True
+        except queue.Full:
+            self.descartados += 1
+            return False
+
+    # ------------------------------------------------------------------
+    # Consumidor (hilo en segundo plano)
+    # ------------------------------------------------------------------
+    def _tomar_lote(self) -> List[dict]:
+        lote = []
+        limite = time.monotonic() + self.intervalo_flush
+        while len(lote) < self.tamano_lote:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                lote.append(self._cola.get(timeout=restante))
+            except queue.Empty:
+                break
+        return lote
+
+    def _bucle(self):
+        try:
+            coleccion = self.asegurar_coleccion()
+        except Exception as e:
+            print("[ANALITICA] No se pudo preparar la colección:", repr(e))
+            coleccion = None
+
+        while True:
+            lote = self._tomar_lote()
+            if not lote:
+                continue
+            try:
+                if coleccion is None:
+                    coleccion = self.asegurar_coleccion()
+                coleccion.insert_many(lote, ordered=False)
+                self.escritos += len(lote)
+            except Exception as e:
+                # Mongo caído o lento: se pierde el lote, no la petición
+                self.descartados += len(lote)
+                print("[ANALITICA] Error escribiendo lote de búsquedas:", repr(e))
+
+    # ------------------------------------------------------------------
+    # Consultas agregadas
+    # ------------------------------------------------------------------
+    def _filtro_desde(self, horas: Optional[float]) -> Dict:
+        if not horas:
+            return {}
+        desde = datetime.now(timezone.utc).timestamp() - horas * 3600
+        return {"fecha": {"$gte": datetime.fromtimestamp(desde, timezone.utc)}}
+
+    def top_consultas(self, limite: int = 20, horas: Optional[float] = 24) -> List[dict]:
+        """
+        Consultas más frecuentes con su promedio de hits y latencia.
+        """
+        pipeline = [
+            {"$match": self._filtro_desde(horas)},
+            {"$group": {
+                "_id": "$q_normalizada",
+                "veces": {"$sum": 1},
+                "hits_promedio": {"$avg": "$hits"},
+                "latencia_promedio_ms": {"$avg": "$latencia_ms"},
+                "cache_hits": {"$sum": {"$cond": ["$cache_hit", 1, 0]}},
+            }},
+            {"$sort": {"veces": -1}},
+            {"$limit": int(limite)},
+        ]
+        return [
+            {
+                "q": d["_id"],
+                "veces": d["veces"],
+                "hits_promedio": round(d["hits_promedio"] or 0, 2),
+                "latencia_promedio_ms": round(d["latencia_promedio_ms"] or 0, 2),
+                "cache_hits": d["cache_hits"],
+            }
+            for d in self._coleccion().aggregate(pipeline)
+        ]
+
+    def consultas_sin_resultados(self, limite: int = 20, horas: Optional[float] = 24) -> List[dict]:
+        """
+        Consultas que devolvieron 0 hits, de la más a la menos frecuente.
+        """
+        filtro = self._filtro_desde(horas)
+        filtro["hits"] = 0
+        pipeline = [
+            {"$match": filtro},
+            {"$group": {"_id": "$q_normalizada", "veces": {"$sum": 1},
+                        "ultima": {"$max": "$fecha"}}},
+            {"$sort": {"veces": -1}},
+            {"$limit": int(limite)},
+        ]
+        return [
+            {"q": d["_id"], "veces": d["veces"], "ultima": d["ultima"].isoformat()}
+            for d in self._coleccion().aggregate(pipeline)
+        ]
+
+    def percentiles_latencia(self, horas: Optional[float] = 24,
+                             percentiles=(50, 90, 95, 99)) -> Dict:
+        """
+        Percentiles de latencia total y de `took` de Elastic.
+        Mongo entrega solo las MAX_MUESTRAS_PERCENTILES búsquedas más recientes
+        de la ventana (usa el índice de `fecha`); el orden por valor y los
+        percentiles se calculan en Python sobre esa muestra.
+        """
+        cursor = self._coleccion().aggregate([
+            {"$match": self._filtro_desde(horas)},
+            {"$sort": {"fecha": -1}},
+            {"$limit": MAX_MUESTRAS_PERCENTILES},
+            {"$project": {"_id": 0, "latencia_ms": 1, "took_ms": 1}},
+        ])
+        latencias, tooks = [], []
+        for d in cursor:
+            latencias.append(d.get("latencia_ms") or 0)
+            if d.get("took_ms") is not None:
+                tooks.append(d["took_ms"])
+
+        return {
+            "muestras": len(latencias),
+            "latencia_ms": _percentiles(latencias, percentiles),
+            "took_ms": _percentiles(tooks, percentiles),
+            "descartados_proceso": self.descartados,
+        }
+
+
+def _percentiles(valores: List[float], percentiles) -> Dict[str, float]:
+    if not valores:
+        return {f"p{p}": None for p in percentiles}
+    valores = sorted(valores)
+    n = len(valores)
+    return {
+        f"p{p}": valores[min(n - 1, max(0, int(round(p / 100 * n)) - 1))]
+        for p in percentiles
+    }
@@ -0,0 +1,95 @@
+# benchmarks/bench_arranque.py
+"""
+Benchmark de arranque de gunicorn con gunicorn.conf.py.
+
+Levanta el servidor con y sin --preload, espera a que todos los workers
+reporten su línea "[INICIO]" (tiempo desde el fork hasta estar listos y
+memoria residente) y muestra el resumen por configuración.
+
+Uso:
+    python benchmarks/bench_arranque.py --workers 2 4 --hilos 8
+"""
+import argparse
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINEA_INICIO = re.compile(r"\[INICIO\] Worker (\d+) listo en ([\d.]+|None) ms, ([\d.]+|None) MB")
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def medir(workers: int, hilos: int, preload: bool, espera: float) -> dict:
+    puerto = _puerto_libre()
+    env = dict(
+        os.environ,
+        GUNICORN_BIND=f"127.0.0.1:{puerto}",
+        WEB_CONCURRENCY=str(workers),
+        GUNICORN_HILOS=str(hilos),
+        GUNICORN_PRELOAD="1" if preload else "0",
+        SALUD_TIMEOUT="1",
+        PYTHONUNBUFFERED="1",
+    )
+    t0 = time.perf_counter()
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+        cwd=RAIZ, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+    )
+    arranques, memorias = [], []
+    listo = threading.Event()
+
+    def leer():
+        for linea in proceso.stdout:
+            m = LINEA_INICIO.search(linea)
+            if m:
+                if m.group(2) != "None":
+                    arranques.append(float(m.group(2)))
+                if m.group(3) != "None":
+                    memorias.append(float(m.group(3)))
+                if len(arranques) >= workers:
+                    listo.set()
+
+    threading.Thread(target=leer, daemon=True).start()
+    listo.wait(espera)
+    total = time.perf_counter() - t0
+    proceso.terminate()
+    proceso.wait(timeout=30)
+    return {
+        "preload": preload,
+        "workers": workers,
+        "listos": len(arranques),
+        "hasta_todos_listos_s": round(total, 2),
+        "arranque_ms_mediana": round(statistics.median(arranques), 1) if arranques else None,
+        "memoria_mb_mediana": round(statistics.median(memorias), 1) if memorias else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--hilos", type=int, default=8)
+    parser.add_argument("--espera", type=float, default=60, help="segundos máximos por configuración")
+    args = parser.parse_args()
+
+    print(f"{'preload':>8} {'workers':>8} {'listos':>7} {'todos listos (s)':>17} "
+          f"{'arranque (ms)':>14} {'memoria (MB)':>13}")
+    for workers in args.workers:
+        for preload in (False, True):
+            r = medir(workers, args.hilos, preload, args.espera)
+            print(f"{str(r['preload']):>8} {r['workers']:>8} {r['listos']:>7} "
+                  f"{r['hasta_todos_listos_s']:>17} {str(r['arranque_ms_mediana']):>14} "
+                  f"{str(r['memoria_mb_mediana']):>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,465 @@
+# benchmarks/bench_carga.py
+"""
+Prueba de carga de la app Flask sin servicios externos.
+
+- Elastic: servidor HTTP falso en un puerto local con latencia configurable
+  (--latencia-ms ± --variacion-ms) que responde a _search con hits enlatados
+  de lenguaje_controlado y acepta _bulk, PUT de índices y _delete_by_query.
+- Mongo: mongomock en memoria (dependencia solo del benchmark:
+  pip install mongomock) con un usuario administrador sembrado.
+- La app se sirve con el servidor de werkzeug con hilos y se le pega con
+  --concurrencia clientes (cada uno con su requests.Session) durante
+  --segundos por escenario: /api/buscar, /login, /api/usuarios y la carga de
+  JSON por /admin/carga-archivos.
+
+Por escenario se informa peticiones/s, errores y latencia p50/p95/p99; el
+resultado completo se guarda en JSON (--salida) y con --comparar se muestran
+las diferencias contra una corrida anterior.
+
+Uso:
+    python benchmarks/bench_carga.py --concurrencia 8 --segundos 10 --latencia-ms 20
+    python benchmarks/bench_carga.py --escenarios buscar --comparar benchmarks/resultados/carga_anterior.json
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+USUARIO = "bench"
+PASSWORD = "clave-de-prueba"
+TERMINOS = [
+    "violencia", "género", "equidad", "igualdad", "mujer", "derechos",
+    "participación", "autonomía", "cuidado", "discriminación", "paridad", "brecha",
+]
+
+
+# ----------------------------------------------------------------------
+# Elastic falso
+# ----------------------------------------------------------------------
+def hits_enlatados(cantidad: int) -> list:
+    """Hits con la forma de los documentos de lenguaje_controlado."""
+    hits = []
+    for i in range(cantidad):
+        termino = TERMINOS[i % len(TERMINOS)]
+        hits.append({
+            "_index": "lenguaje_controlado",
+            "_id": f"termino-{i}",
+            "_score": round(10.0 - i * 0.1, 3),
+            "_source": {
+                "term_parent": termino.capitalize(),
+                "term_child": f"{termino} {i}",
+                "related_terms": ", ".join(random.sample(TERMINOS, 3)),
+                "definition": (f"Definición de prueba del término {termino}. " * 8).strip(),
+                "fuente_1": "Secretaría Distrital de la Mujer",
+                "source_urls": [f"https://www.funcionpublica.gov.co/eva/gestornormativo/norma.php?i={i}"],
+            },
+        })
+    return hits
+
+
+class ElasticFalso:
+    """
+    Servidor HTTP con las rutas de Elastic que usa la app. Cada respuesta
+    espera latencia ± variación (segundos) antes de contestar.
+    """
+
+    def __init__(self, latencia: float, variacion: float, hits: int):
+        self.latencia = latencia
+        self.variacion = variacion
+        self.cuerpo_busqueda = {
+            "timed_out": False,
+            "hits": {"total": {"value": hits, "relation": "eq"}, "max_score": 10.0,
+                     "hits": hits_enlatados(hits)},
+        }
+        self.peticiones = 0
+        self._lock = threading.Lock()
+        self.servidor = ThreadingHTTPServer(("127.0.0.1", 0), self._manejador())
+        self.servidor.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.servidor.server_address[1]}"
+
+    def iniciar(self):
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+        return self
+
+    def detener(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+    def _esperar(self) -> float:
+        espera = max(0.0, self.latencia + random.uniform(-self.variacion, self.variacion))
+        time.sleep(espera)
+        return espera
+
+    def responder(self, metodo: str, ruta: str, cuerpo: bytes):
+        with self._lock:
+            self.peticiones += 1
+        ruta = ruta.split("?", 1)[0]
+        espera = self._esperar()
+        if ruta.endswith("/_search"):
+            return 200, dict(self.cuerpo_busqueda, took=int(espera * 1000))
+        if ruta == "/_bulk":
+            # Cada documento ocupa dos líneas (acción + fuente)
+            lineas = [l for l in cuerpo.split(b"\n") if l.strip()]
+            items = []
+            for accion in lineas[::2]:
+                datos = next(iter(json.loads(accion).values()))
+                items.append({"index": {"_index": datos.get("_index"),
+                                        "_id": datos.get("_id") or f"auto-{random.getrandbits(48):x}",
+                                        "status": 201, "result": "created"}})
+            return 200, {"took": int(espera * 1000), "errors": False, "items": items}
+        if ruta.endswith("/_delete_by_query"):
+            return 200, {"took": int(espera * 1000), "deleted": 0, "failures": []}
+        if "/_doc/" in ruta:
+            return 404, {"found": False}
+        if metodo == "PUT":
+            return 200, {"acknowledged": True, "index": ruta.strip("/")}
+        if ruta == "/":
+            return 200, {"name": "elastic-falso", "version": {"number": "8.0.0"}}
+        return 200, {}
+
+    def _manejador(self):
+        elastic = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Encabezados y cuerpo salen en dos escrituras: con Nagle + ACK
+            # retrasado cada respuesta sumaría ~40 ms que Elastic no tiene
+            disable_nagle_algorithm = True
+
+            def _atender(self):
+                largo = int(self.headers.get("Content-Length") or 0)
+                cuerpo = self.rfile.read(largo) if largo else b""
+                estado, datos = elastic.responder(self.command, self.path, cuerpo)
+                salida = json.dumps(datos).encode("utf-8")
+                self.send_response(estado)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(salida)))
+                self.end_headers()
+                self.wfile.write(salida)
+
+            do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _atender
+
+            def log_message(self, *args):
+                pass
+
+        return Manejador
+
+
+# ----------------------------------------------------------------------
+# App con Mongo en memoria
+# ----------------------------------------------------------------------
+def preparar_entorno(url_elastic: str, carpeta: str):
+    """
+    Variables de entorno que la app lee al importarse: Elastic falso, bcrypt
+    barato, límites altos (se mide la app, no las cubetas) y bases SQLite
+    temporales.
+    """
+    os.environ.update({
+        "ELASTIC_URL": url_elastic,
+        "ELASTIC_API_KEY": "bench",
+        "BCRYPT_ROUNDS": os.getenv("BCRYPT_ROUNDS", "4"),
+        "LIMITE_BUSQUEDA_RAFAGA": "1000000",
+        "LIMITE_BUSQUEDA_POR_SEGUNDO": "1000000",
+        "ELASTIC_MAX_CONCURRENTES": "1000",
+        "METRICAS_MUESTRA_LOG": "0",
+        "METRICAS_DIR": os.path.join(carpeta, "metricas"),
+        "GENERACIONES_DIR": os.path.join(carpeta, "generaciones"),
+        "MANIFIESTO_DB": os.path.join(carpeta, "manifiesto.sqlite"),
+        "DUPLICADOS_DB": os.path.join(carpeta, "duplicados.sqlite"),
+        "TRABAJOS_DB": os.path.join(carpeta, "trabajos.sqlite"),
+        "SIMILARES_DIR": os.path.join(carpeta, "similares"),
+        "LIMITE_DB": os.path.join(carpeta, "limites.sqlite"),
+    })
+
+
+def preparar_app():
+    """
+    Importa la app y reemplaza los clientes de Mongo por mongomock con un
+    usuario administrador.
+    """
+    try:
+        import mongomock
+    except ImportError:
+        sys.exit("Este benchmark necesita mongomock: pip install mongomock")
+
+    import app as modulo_app
+    import mongo
+    import seguridad
+
+    cliente = mongomock.MongoClient()
+    mongo._get_client = lambda uri, timeout_ms=5000: cliente
+    busquedas = cliente[modulo_app.MONGO_DB][modulo_app.analitica.collection_name]
+    modulo_app.analitica._coleccion = lambda: busquedas
+    # mongomock no soporta colecciones capped
+    modulo_app.analitica.asegurar_coleccion = lambda: busquedas
+    usuarios = cliente[modulo_app.MONGO_DB][modulo_app.MONGO_COLECCION]
+    usuarios.insert_one({
+        "usuario": USUARIO,
+        "password": seguridad.hashear_password(PASSWORD),
+        "rol": "Admin",
+        "correo": "bench@example.com",
+        "permisos": {"admin_usuarios": True, "admin_data_elastic": True},
+    })
+    for i in range(50):
+        usuarios.insert_one({"usuario": f"usuario{i}", "password": "x", "rol": "Usuario",
+                             "correo": f"usuario{i}@example.com", "permisos": {}})
+    return modulo_app.app
+
+
+def servir(app):
+    import logging
+
+    from werkzeug.serving import make_server
+
+    # Una línea de log por petición distorsiona la medición
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    servidor = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_port}"
+
+
+# ----------------------------------------------------------------------
+# Escenarios
+# ----------------------------------------------------------------------
+def _iniciar_sesion(sesion, base: str):
+    r = sesion.post(f"{base}/login", data={"usuario": USUARIO, "password": PASSWORD},
+                    allow_redirects=False, timeout=30)
+    if r.status_code != 302:
+        raise RuntimeError(f"Login falló ({r.status_code})")
+
+
+def _json_carga(documentos: int) -> bytes:
+    docs = [{
+        "term_parent": random.choice(TERMINOS),
+        "term_child": f"{random.choice(TERMINOS)} {random.getrandbits(40):x}",
+        "definition": " ".join(random.choices(TERMINOS, k=40)),
+    } for _ in range(documentos)]
+    return json.dumps(docs, ensure_ascii=False).encode("utf-8")
+
+
+def escenario_buscar(sesion, base, n, _opciones):
+    # Consulta distinta en cada petición: sin ETag repetido no hay 304
+    q = f"{TERMINOS[n % len(TERMINOS)]} {n}"
+    return sesion.get(f"{base}/api/buscar", params={"q": q}, timeout=30)
+
+
+def escenario_login(sesion, base, _n, _opciones):
+    return sesion.post(f"{base}/login", data={"usuario": USUARIO, "password": PASSWORD},
+                       allow_redirects=False, timeout=30)
+
+
+def escenario_usuarios(sesion, base, _n, _opciones):
+    return sesion.get(f"{base}/api/usuarios", timeout=30)
+
+
+def escenario_carga(sesion, base, n, opciones):
+    archivo = (f"bench_{n}.json", _json_carga(opciones.docs_por_carga), "application/json")
+    return sesion.post(
+        f"{base}/admin/carga-archivos",
+        data={"metodo": "json_suelto", "indice_destino": "bench_carga"},
+        files={"archivos_json": archivo},
+        headers={"Accept": "application/json"},
+        allow_redirects=False, timeout=60,
+    )
+
+
+# Nombre -> (función, estados esperados, ¿requiere sesión?)
+ESCENARIOS = {
+    "buscar": (escenario_buscar, {200}, False),
+    "login": (escenario_login, {302}, False),
+    "usuarios": (escenario_usuarios, {200}, True),
+    "carga": (escenario_carga, {202}, True),
+}
+
+
+def percentil(ordenadas: list, p: float):
+    if not ordenadas:
+        return None
+    return ordenadas[min(len(ordenadas) - 1, max(0, int(round(p / 100 * len(ordenadas))) - 1))]
+
+
+def correr_escenario(nombre: str, base: str, opciones) -> dict:
+    import requests
+
+    funcion, esperados, con_sesion = ESCENARIOS[nombre]
+    contador = itertools.count()
+    fin = time.perf_counter() + opciones.segundos
+
+    def cliente(_):
+        sesion = requests.Session()
+        if con_sesion:
+            _iniciar_sesion(sesion, base)
+        latencias, estados, trabajos = [], {}, []
+        while time.perf_counter() < fin:
+            t0 = time.perf_counter()
+            try:
+                r = funcion(sesion, base, next(contador), opciones)
+                estado = r.status_code
+                if estado == 202:
+                    trabajos.append(r.json()["job_id"])
+            except requests.RequestException as e:
+                estado = type(e).__name__
+            latencias.append(time.perf_counter() - t0)
+            estados[str(estado)] = estados.get(str(estado), 0) + 1
+        return latencias, estados, trabajos
+
+    latencias, estados, trabajos = [], {}, []
+    t_inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=opciones.concurrencia) as ex:
+        for propias, propios, ids in ex.map(cliente, range(opciones.concurrencia)):
+            latencias.extend(propias)
+            trabajos.extend(ids)
+            for estado, n in propios.items():
+                estados[estado] = estados.get(estado, 0) + n
+    duracion = time.perf_counter() - t_inicio
+
+    latencias.sort()
+    errores = sum(n for estado, n in estados.items()
+                  if not (estado.isdigit() and int(estado) in esperados))
+    resultado = {
+        "escenario": nombre,
+        "peticiones": len(latencias),
+        "errores": errores,
+        "estados": estados,
+        "duracion_s": round(duracion, 2),
+        "peticiones_por_segundo": round(len(latencias) / duracion, 2) if duracion else None,
+        **{f"p{p}_ms": round(percentil(latencias, p) * 1000, 1) if latencias else None
+           for p in (50, 95, 99)},
+        "media_ms": round(sum(latencias) / len(latencias) * 1000, 1) if latencias else None,
+    }
+    if trabajos:
+        # El POST solo encola: la ingesta sigue en segundo plano y se espera
+        # aquí para que no se mezcle con el escenario siguiente
+        resultado["trabajos"] = esperar_trabajos(base, trabajos, opciones.espera_trabajos)
+    return resultado
+
+
+def esperar_trabajos(base: str, ids: list, espera_max: float) -> dict:
+    """
+    Consulta /api/jobs/<id> hasta que todos los trabajos terminen (o se agote
+    espera_max) y resume estados, documentos indexados y tiempo de vaciado.
+    """
+    import requests
+
+    sesion = requests.Session()
+    _iniciar_sesion(sesion, base)
+    t0 = time.perf_counter()
+    pendientes, terminados = set(ids), {}
+    while pendientes and time.perf_counter() - t0 < espera_max:
+        for job_id in list(pendientes):
+            trabajo = sesion.get(f"{base}/api/jobs/{job_id}", timeout=30).json()
+            if not trabajo.get("activo", False):
+                terminados[job_id] = trabajo
+                pendientes.discard(job_id)
+        if pendientes:
+            time.sleep(0.2)
+    estados = {}
+    for trabajo in terminados.values():
+        estados[trabajo.get("estado")] = estados.get(trabajo.get("estado"), 0) + 1
+    if pendientes:
+        estados["sin_terminar"] = len(pendientes)
+    return {
+        "enviados": len(ids),
+        "estados": estados,
+        "docs_indexados": sum(t.get("docs_indexados", 0) for t in terminados.values()),
+        "vaciado_s": round(time.perf_counter() - t0, 2),
+    }
+
+
+def comparar(actuales: list, ruta_anterior: str):
+    with open(ruta_anterior, encoding="utf-8") as f:
+        anteriores = {r["escenario"]: r for r in json.load(f)["resultados"]}
+    print(f"\nComparación con {ruta_anterior}:")
+    print(f"{'escenario':>10} {'pet/s':>16} {'p50 ms':>16} {'p95 ms':>16} {'p99 ms':>16}")
+    for r in actuales:
+        antes = anteriores.get(r["escenario"])
+        if not antes:
+            continue
+
+        def delta(clave):
+            a, b = antes.get(clave), r.get(clave)
+            if not a or b is None:
+                return "-"
+            return f"{b} ({(b - a) / a * 100:+.0f}%)"
+
+        print(f"{r['escenario']:>10} {delta('peticiones_por_segundo'):>16} {delta('p50_ms'):>16} "
+              f"{delta('p95_ms'):>16} {delta('p99_ms'):>16}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--escenarios", nargs="+", choices=list(ESCENARIOS), default=list(ESCENARIOS))
+    parser.add_argument("--concurrencia", type=int, default=8, help="clientes simultáneos")
+    parser.add_argument("--segundos", type=float, default=10.0, help="duración de cada escenario")
+    parser.add_argument("--latencia-ms", type=float, default=20.0, help="latencia del Elastic falso")
+    parser.add_argument("--variacion-ms", type=float, default=5.0, help="± aleatorio sobre la latencia")
+    parser.add_argument("--hits", type=int, default=10, help="hits por respuesta de _search")
+    parser.add_argument("--docs-por-carga", type=int, default=200, help="documentos por JSON subido")
+    parser.add_argument("--espera-trabajos", type=float, default=300,
+                        help="segundos máximos esperando que terminen las cargas encoladas")
+    parser.add_argument("--salida", help="archivo JSON de resultados "
+                        "(por defecto benchmarks/resultados/carga_<fecha>.json)")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior")
+    args = parser.parse_args()
+
+    elastic = ElasticFalso(args.latencia_ms / 1000, args.variacion_ms / 1000, args.hits).iniciar()
+    carpeta = tempfile.mkdtemp(prefix="bench_carga_")
+    preparar_entorno(elastic.url, carpeta)
+    servidor, base = servir(preparar_app())
+
+    print(f"App en {base}, Elastic falso en {elastic.url} "
+          f"({args.latencia_ms} ± {args.variacion_ms} ms), {args.concurrencia} clientes, "
+          f"{args.segundos}s por escenario")
+    print(f"{'escenario':>10} {'peticiones':>11} {'errores':>8} {'pet/s':>9} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    resultados = []
+    try:
+        for nombre in args.escenarios:
+            r = correr_escenario(nombre, base, args)
+            resultados.append(r)
+            print(f"{r['escenario']:>10} {r['peticiones']:>11} {r['errores']:>8} "
+                  f"{str(r['peticiones_por_segundo']):>9} {str(r['p50_ms']):>8} "
+                  f"{str(r['p95_ms']):>8} {str(r['p99_ms']):>8}")
+            if "trabajos" in r:
+                t = r["trabajos"]
+                print(f"{'':>10} {t['enviados']} cargas encoladas, {t['docs_indexados']} documentos "
+                      f"indexados, cola vacía en {t['vaciado_s']}s {t['estados']}")
+    finally:
+        servidor.shutdown()
+        elastic.detener()
+
+    salida = args.salida or os.path.join(
+        RAIZ, "benchmarks", "resultados", f"carga_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump({
+            "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "configuracion": {k: v for k, v in vars(args).items() if k not in ("salida", "comparar")},
+            "sistema": {"python": platform.python_version(), "plataforma": platform.platform(),
+                        "cpus": os.cpu_count()},
+            "peticiones_elastic": elastic.peticiones,
+            "resultados": resultados,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"Resultados guardados en {salida}")
+
+    if args.comparar:
+        comparar(resultados, args.comparar)
+
+
+if __name__ == "__main__":
+    main()
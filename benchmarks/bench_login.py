@@ -0,0 +1,74 @@
+# benchmarks/bench_login.py
+"""
+Benchmark de login con bcrypt.
+
+Mide cuántos logins por segundo puede verificar UN worker (un proceso) con
+cada costo de bcrypt, usando el mismo pool de hilos que usa la app.
+
+Uso:
+    python benchmarks/bench_login.py --costos 10 11 12 13 --segundos 5 --clientes 8
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import seguridad  # noqa: E402
+
+
+def medir_costo(costo: int, segundos: float, clientes: int) -> dict:
+    """
+    Lanza `clientes` hilos que hacen login en bucle durante `segundos`.
+    """
+    password = "clave-de-prueba"
+    hash_guardado = seguridad.hashear_password(password, rounds=costo)
+    latencias = []
+    fin = time.perf_counter() + segundos
+
+    def cliente():
+        propias = []
+        while time.perf_counter() < fin:
+            t0 = time.perf_counter()
+            assert seguridad.verificar_password(password, hash_guardado)
+            propias.append(time.perf_counter() - t0)
+        return propias
+
+    t_inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clientes) as ex:
+        for propias in ex.map(lambda _: cliente(), range(clientes)):
+            latencias.extend(propias)
+    duracion = time.perf_counter() - t_inicio
+
+    latencias.sort()
+    return {
+        "costo": costo,
+        "logins": len(latencias),
+        "logins_por_segundo": round(len(latencias) / duracion, 2),
+        "latencia_p50_ms": round(statistics.median(latencias) * 1000, 1),
+        "latencia_p95_ms": round(latencias[int(len(latencias) * 0.95) - 1] * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de login con bcrypt")
+    parser.add_argument("--costos", type=int, nargs="+", default=[10, 11, 12, 13])
+    parser.add_argument("--segundos", type=float, default=5.0)
+    parser.add_argument("--clientes", type=int, default=8,
+                        help="logins concurrentes contra el worker")
+    args = parser.parse_args()
+
+    print(f"Pool bcrypt: {seguridad.BCRYPT_MAX_HILOS} hilos por worker "
+          f"(BCRYPT_MAX_HILOS), {args.clientes} clientes concurrentes")
+    print(f"{'costo':>5} {'logins/s':>10} {'p50 ms':>9} {'p95 ms':>9}")
+    for costo in args.costos:
+        r = medir_costo(costo, args.segundos, args.clientes)
+        print(f"{r['costo']:>5} {r['logins_por_segundo']:>10} "
+              f"{r['latencia_p50_ms']:>9} {r['latencia_p95_ms']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+# benchmarks/bench_micro.py
+"""
+Micro-benchmarks de los caminos calientes de la ingesta, con línea base.
+
+Casos (cada uno con fixtures sintéticos generados aquí, en tres tamaños):
+- ndjson_bulks: armado del cuerpo NDJSON en ElasticSearch.indexar_bulks.
+- ndjson_lotes: ElasticSearch.indexar_en_lotes con _id (lotes por tamaño/bytes).
+- json_zip: ingesta.iterar_documentos_zip sobre un ZIP con varios JSON.
+- pdf_texto: extraccion_pdf.iterar_texto_paginas (PyPDF2, en el proceso).
+- links_html: webscraping_helper.extraer_links (BeautifulSoup).
+- csv_compacto: functions.leer_csv_compacto sin caché Parquet.
+
+Nada sale a la red: _enviar_bulk se reemplaza por una respuesta vacía.
+Por caso y tamaño se repite la ejecución durante --segundos; las unidades/s
+(docs, páginas, enlaces o filas) salen de la corrida más rápida y el pico de
+memoria de otra corrida aparte con tracemalloc. Con --guardar-base los
+resultados quedan como línea base; en las demás corridas se comparan contra
+ella y el proceso termina con código 1 si algún caso pierde más de
+--tolerancia de velocidad o crece más de --tolerancia-memoria en memoria.
+
+Uso:
+    python benchmarks/bench_micro.py --guardar-base
+    python benchmarks/bench_micro.py --casos json_zip csv_compacto --tamanos chico mediano
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import extraccion_pdf  # noqa: E402
+import ingesta  # noqa: E402
+from elastic import ElasticSearch  # noqa: E402
+from functions import leer_csv_compacto  # noqa: E402
+from webscraping_helper import extraer_links  # noqa: E402
+
+LINEA_BASE = os.path.join(RAIZ, "benchmarks", "linea_base_micro.json")
+TAMANOS = ("chico", "mediano", "grande")
+PALABRAS = (
+    "violencia género equidad igualdad mujer derechos participación autonomía "
+    "cuidado discriminación paridad brecha política pública enfoque diferencial "
+    "territorio salud educación empleo justicia protección prevención atención"
+).split()
+
+
+# ----------------------------------------------------------------------
+# Fixtures sintéticos (semilla fija: mismos datos en cada corrida)
+# ----------------------------------------------------------------------
+def _texto(rnd: random.Random, palabras: int) -> str:
+    return " ".join(rnd.choices(PALABRAS, k=palabras))
+
+
+def documentos(n: int, semilla: int = 42) -> list:
+    """Documentos con la forma de lenguaje_controlado."""
+    rnd = random.Random(semilla)
+    return [{
+        "term_parent": rnd.choice(PALABRAS).capitalize(),
+        "term_child": f"{rnd.choice(PALABRAS)} {i}",
+        "related_terms": ", ".join(rnd.sample(PALABRAS, 4)),
+        "definition": _texto(rnd, 60),
+        "fuente_1": "Secretaría Distrital de la Mujer",
+        "source_urls": [f"https://www.funcionpublica.gov.co/eva/gestornormativo/norma.php?i={i}"],
+    } for i in range(n)]
+
+
+def zip_json(carpeta: str, n: int, por_miembro: int = 500) -> str:
+    """ZIP con los documentos repartidos en varios JSON (arreglo y NDJSON)."""
+    ruta = os.path.join(carpeta, f"docs_{n}.zip")
+    docs = documentos(n)
+    with zipfile.ZipFile(ruta, "w", zipfile.ZIP_DEFLATED) as z:
+        for parte, i in enumerate(range(0, n, por_miembro)):
+            bloque = docs[i:i + por_miembro]
+            if parte % 2:
+                contenido = "\n".join(json.dumps(d, ensure_ascii=False) for d in bloque)
+                z.writestr(f"parte_{parte}.jsonl", contenido)
+            else:
+                z.writestr(f"parte_{parte}.json", json.dumps(bloque, ensure_ascii=False))
+    return ruta
+
+
+def _escapar_pdf(texto: str) -> str:
+    return texto.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def pdf_sintetico(paginas: int, lineas_por_pagina: int = 40, semilla: int = 42) -> bytes:
+    """
+    PDF mínimo con texto real (Helvetica, ASCII) armado a mano: no hace falta
+    ninguna librería para generarlo.
+    """
+    rnd = random.Random(semilla)
+    ascii_ = [p.encode("ascii", "ignore").decode() for p in PALABRAS]
+    objetos = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Pages: se completa al final con los hijos
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    hijos = []
+    for _ in range(paginas):
+        lineas = [_escapar_pdf(" ".join(rnd.choices(ascii_, k=12))) for _ in range(lineas_por_pagina)]
+        flujo = ("BT /F1 10 Tf 14 TL 50 800 Td " + " ".join(f"({l}) Tj T*" for l in lineas) + " ET").encode()
+        objetos.append(b"<< /Length %d >>\nstream\n" % len(flujo) + flujo + b"\nendstream")
+        contenido = len(objetos)
+        objetos.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % contenido)
+        hijos.append(len(objetos))
+    objetos[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % h for h in hijos), len(hijos))
+
+    salida = bytearray(b"%PDF-1.4\n")
+    posiciones = []
+    for numero, objeto in enumerate(objetos, start=1):
+        posiciones.append(len(salida))
+        salida += b"%d 0 obj\n" % numero + objeto + b"\nendobj\n"
+    xref = len(salida)
+    salida += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    for pos in posiciones:
+        salida += b"%010d 00000 n \n" % pos
+    salida += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, xref)
+    return bytes(salida)
+
+
+def html_con_links(n: int, semilla: int = 42) -> str:
+    """Página con `n` enlaces (relativos, absolutos, anclas y repetidos) entre párrafos."""
+    rnd = random.Random(semilla)
+    partes = ["<html><head><title>Normatividad</title></head><body><div class='contenido'>"]
+    for i in range(n):
+        tipo = i % 5
+        if tipo == 0:
+            href = f"/documentos/norma_{i}.pdf"
+        elif tipo == 1:
+            href = f"https://www.funcionpublica.gov.co/eva/gestornormativo/norma.php?i={i}"
+        elif tipo == 2:
+            href = f"#seccion-{i}"
+        elif tipo == 3:
+            href = f"../anexos/anexo_{i // 2}.pdf"
+        else:
+            href = f"pagina.aspx?id={rnd.randint(0, n // 3)}"
+        partes.append(f"<p>{_texto(rnd, 15)} <a href=\"{href}\" class=\"enlace\">{_texto(rnd, 3)}</a></p>")
+    partes.append("</div></body></html>")
+    return "\n".join(partes)
+
+
+COLUMNAS_CSV = [
+    "Departamento", "Municipio", "Código de la entidad", "Género", "Grupo etario",
+    "Tipo de afiliado", "Estado del afiliado", "Condición del beneficiario",
+    "Régimen", "Zona de Afiliación", "Cantidad de registros",
+]
+
+
+def csv_bdua(carpeta: str, filas: int, semilla: int = 42) -> str:
+    """CSV sin encabezado, ; y latin-1, como los de datos.gov.co."""
+    rnd = random.Random(semilla)
+    ruta = os.path.join(carpeta, f"bdua_{filas}.csv")
+    valores = [
+        [f"DEPARTAMENTO {i}" for i in range(33)],
+        [f"MUNICIPIO {i}" for i in range(300)],
+        [f"EPS{i:03d}" for i in range(45)],
+        ["FEMENINO", "MASCULINO"],
+        ["0-4", "5-14", "15-24", "25-44", "45-64", "65+"],
+        ["COTIZANTE", "BENEFICIARIO", "ADICIONAL"],
+        ["ACTIVO", "SUSPENDIDO", "RETIRADO"],
+        ["CÓNYUGE", "HIJO", "PADRE", "OTRO", "NO APLICA"],
+        ["CONTRIBUTIVO", "SUBSIDIADO"],
+        ["URBANA", "RURAL"],
+    ]
+    with open(ruta, "w", encoding="latin-1", newline="") as f:
+        for _ in range(filas):
+            f.write(";".join([rnd.choice(v) for v in valores] + [str(rnd.randint(1, 5000))]) + "\n")
+    return ruta
+
+
+# ----------------------------------------------------------------------
+# Casos: tamaños, preparación (fuera de la medición) y ejecución
+# ----------------------------------------------------------------------
+def _elastic_sin_red() -> ElasticSearch:
+    elastic = ElasticSearch("http://127.0.0.1:9", "bench")
+    elastic._enviar_bulk = lambda cuerpo: {"errors": False, "items": []}
+    return elastic
+
+
+def _preparar_bulks(n, _carpeta):
+    return _elastic_sin_red(), documentos(n)
+
+
+def _ejecutar_bulks(fixture):
+    elastic, docs = fixture
+    elastic.indexar_bulks("bench", docs)
+    return len(docs)
+
+
+def _preparar_lotes(n, _carpeta):
+    docs = documentos(n)
+    for i, doc in enumerate(docs):
+        doc["_id"] = f"doc-{i}"
+    return _elastic_sin_red(), docs
+
+
+def _ejecutar_lotes(fixture):
+    elastic, docs = fixture
+    return elastic.indexar_en_lotes("bench", iter(docs), tamano_lote=500)["enviados"]
+
+
+def _ejecutar_zip(ruta):
+    return sum(1 for _ in ingesta.iterar_documentos_zip(ruta))
+
+
+def _ejecutar_pdf(contenido):
+    return sum(1 for _ in extraccion_pdf.iterar_texto_paginas(contenido))
+
+
+def _ejecutar_links(html):
+    extraer_links(html, "https://www.sdmujer.gov.co/normatividad/")
+    return html.count("<a ")
+
+
+def _ejecutar_csv(ruta):
+    df, _stats = leer_csv_compacto(ruta, COLUMNAS_CSV, usar_cache=False)
+    return len(df)
+
+
+# Nombre -> (unidad, {tamaño: n}, preparar(n, carpeta), ejecutar(fixture) -> unidades)
+CASOS = {
+    "ndjson_bulks": ("docs", {"chico": 500, "mediano": 5000, "grande": 20000},
+                     _preparar_bulks, _ejecutar_bulks),
+    "ndjson_lotes": ("docs", {"chico": 500, "mediano": 5000, "grande": 20000},
+                     _preparar_lotes, _ejecutar_lotes),
+    "json_zip": ("docs", {"chico": 500, "mediano": 5000, "grande": 20000},
+                 lambda n, carpeta: zip_json(carpeta, n), _ejecutar_zip),
+    "pdf_texto": ("páginas", {"chico": 5, "mediano": 40, "grande": 150},
+                  lambda n, _carpeta: pdf_sintetico(n), _ejecutar_pdf),
+    "links_html": ("enlaces", {"chico": 100, "mediano": 1000, "grande": 5000},
+                   lambda n, _carpeta: html_con_links(n), _ejecutar_links),
+    "csv_compacto": ("filas", {"chico": 10000, "mediano": 100000, "grande": 300000},
+                     lambda n, carpeta: csv_bdua(carpeta, n), _ejecutar_csv),
+}
+
+
+def medir_caso(nombre: str, tamano: str, carpeta: str, segundos: float, min_corridas: int) -> dict:
+    unidad, tamanos, preparar, ejecutar = CASOS[nombre]
+    fixture = preparar(tamanos[tamano], carpeta)
+    ejecutar(fixture)  # calentamiento (imports perezosos, cachés de PyPDF2/pandas)
+
+    tiempos = []
+    fin = time.perf_counter() + segundos
+    while len(tiempos) < min_corridas or time.perf_counter() < fin:
+        t0 = time.perf_counter()
+        unidades = ejecutar(fixture)
+        tiempos.append(time.perf_counter() - t0)
+
+    # tracemalloc hace todo más lento: la memoria se mide en una corrida aparte
+    tracemalloc.start()
+    try:
+        ejecutar(fixture)
+        _actual, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # ops/s con la corrida más rápida (como timeit): el ruido de la máquina
+    # solo suma tiempo, así que el mínimo es lo más estable entre corridas
+    mejor = min(tiempos)
+    return {
+        "caso": nombre,
+        "tamano": tamano,
+        "n": tamanos[tamano],
+        "unidad": unidad,
+        "corridas": len(tiempos),
+        "mediana_ms": round(statistics.median(tiempos) * 1000, 3),
+        "mejor_ms": round(mejor * 1000, 3),
+        "ops_por_segundo": round(unidades / mejor, 1) if mejor > 0 else None,
+        "memoria_pico_mb": round(pico / (1024 * 1024), 3),
+    }
+
+
+def comparar_con_base(resultados: list, base: dict, tolerancia: float,
+                      tolerancia_memoria: float) -> list:
+    """
+    Regresiones respecto a la línea base: menos ops/s que base * (1 - tolerancia)
+    o más memoria que base * (1 + tolerancia_memoria). Devuelve (caso, tamaño,
+    descripción) por cada una.
+    """
+    anteriores = {(r["caso"], r["tamano"]): r for r in base.get("resultados", [])}
+    regresiones = []
+    for r in resultados:
+        antes = anteriores.get((r["caso"], r["tamano"]))
+        if not antes:
+            r["vs_base"] = None
+            continue
+        velocidad = r["ops_por_segundo"] / antes["ops_por_segundo"] - 1
+        memoria = (r["memoria_pico_mb"] / antes["memoria_pico_mb"] - 1) if antes["memoria_pico_mb"] else 0.0
+        r["vs_base"] = {"ops_por_segundo": round(velocidad * 100, 1), "memoria_pico": round(memoria * 100, 1)}
+        if velocidad < -tolerancia:
+            regresiones.append((r["caso"], r["tamano"],
+                                f"{velocidad * 100:+.1f}% ops/s ({antes['ops_por_segundo']} -> "
+                                f"{r['ops_por_segundo']} {r['unidad']}/s)"))
+        if memoria > tolerancia_memoria:
+            regresiones.append((r["caso"], r["tamano"],
+                                f"{memoria * 100:+.1f}% memoria ({antes['memoria_pico_mb']} -> "
+                                f"{r['memoria_pico_mb']} MB)"))
+    return regresiones
+
+
+def _imprimir(r: dict):
+    print(f"{r['caso']:>13} {r['tamano']:>8} {r['n']:>7} {r['corridas']:>9} "
+          f"{r['mediana_ms']:>11} {r['mejor_ms']:>9} {r['ops_por_segundo']:>12} "
+          f"{r['memoria_pico_mb']:>11}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--casos", nargs="+", choices=list(CASOS), default=list(CASOS))
+    parser.add_argument("--tamanos", nargs="+", choices=TAMANOS, default=list(TAMANOS))
+    parser.add_argument("--segundos", type=float, default=1.0, help="tiempo mínimo de medición por caso")
+    parser.add_argument("--min-corridas", type=int, default=3)
+    parser.add_argument("--base", default=LINEA_BASE, help="JSON de la línea base")
+    parser.add_argument("--guardar-base", action="store_true", help="guardar esta corrida como línea base")
+    parser.add_argument("--tolerancia", type=float, default=0.25,
+                        help="pérdida de ops/s permitida (0.25 = 25%%)")
+    parser.add_argument("--tolerancia-memoria", type=float, default=0.25,
+                        help="aumento de memoria pico permitido (0.25 = 25%%)")
+    parser.add_argument("--reintentos", type=int, default=2,
+                        help="veces que se vuelve a medir un caso que parece haber empeorado")
+    parser.add_argument("--salida", help="guardar también los resultados de esta corrida en JSON")
+    args = parser.parse_args()
+
+    base = None
+    if not args.guardar_base and os.path.exists(args.base):
+        with open(args.base, encoding="utf-8") as f:
+            base = json.load(f)
+
+    resultados = []
+    regresiones = []
+    print(f"{'caso':>13} {'tamaño':>8} {'n':>7} {'corridas':>9} {'mediana ms':>11} "
+          f"{'mejor ms':>9} {'ops/s':>12} {'memoria MB':>11}")
+    with tempfile.TemporaryDirectory(prefix="bench_micro_") as carpeta:
+        for nombre in args.casos:
+            for tamano in args.tamanos:
+                r = medir_caso(nombre, tamano, carpeta, args.segundos, args.min_corridas)
+                resultados.append(r)
+                _imprimir(r)
+
+        if base is not None:
+            regresiones = comparar_con_base(resultados, base, args.tolerancia, args.tolerancia_memoria)
+            # Una máquina compartida puede frenar un caso por momentos: antes de
+            # fallar se vuelve a medir y se queda el mejor resultado de cada uno
+            for intento in range(args.reintentos):
+                if not regresiones:
+                    break
+                sospechosos = {(caso, tamano) for caso, tamano, _ in regresiones}
+                print(f"\nReintento {intento + 1}: midiendo de nuevo {len(sospechosos)} casos")
+                for i, r in enumerate(resultados):
+                    if (r["caso"], r["tamano"]) not in sospechosos:
+                        continue
+                    nuevo = medir_caso(r["caso"], r["tamano"], carpeta, args.segundos, args.min_corridas)
+                    _imprimir(nuevo)
+                    if nuevo["ops_por_segundo"] < r["ops_por_segundo"]:
+                        for clave in ("corridas", "mediana_ms", "mejor_ms", "ops_por_segundo"):
+                            nuevo[clave] = r[clave]
+                    nuevo["memoria_pico_mb"] = min(nuevo["memoria_pico_mb"], r["memoria_pico_mb"])
+                    resultados[i] = nuevo
+                regresiones = comparar_con_base(resultados, base, args.tolerancia, args.tolerancia_memoria)
+
+    corrida = {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "sistema": {"python": platform.python_version(), "plataforma": platform.platform(),
+                    "cpus": os.cpu_count()},
+        "resultados": resultados,
+    }
+
+    codigo = 0
+    if args.guardar_base:
+        # Se conservan los casos de la base que no se midieron en esta corrida
+        anterior = {}
+        if os.path.exists(args.base):
+            with open(args.base, encoding="utf-8") as f:
+                anterior = json.load(f)
+        medidos = {(r["caso"], r["tamano"]) for r in resultados}
+        previos = [r for r in anterior.get("resultados", []) if (r["caso"], r["tamano"]) not in medidos]
+        with open(args.base, "w", encoding="utf-8") as f:
+            json.dump(dict(corrida, resultados=previos + resultados), f, ensure_ascii=False, indent=2)
+        print(f"Línea base guardada en {args.base}")
+    elif base is None:
+        print(f"\nNo hay línea base en {args.base}: corre con --guardar-base para crearla")
+    else:
+        if base.get("sistema", {}).get("plataforma") != corrida["sistema"]["plataforma"]:
+            print(f"Aviso: la línea base se midió en otra máquina ({base.get('sistema')})")
+        if regresiones:
+            print(f"\n{len(regresiones)} regresiones respecto a {args.base}:")
+            for caso, tamano, descripcion in regresiones:
+                print(f"  - {caso}/{tamano}: {descripcion}")
+            codigo = 1
+        else:
+            print(f"\nSin regresiones respecto a {args.base} "
+                  f"(tolerancia {args.tolerancia:.0%} ops/s, {args.tolerancia_memoria:.0%} memoria)")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(corrida, f, ensure_ascii=False, indent=2)
+    sys.exit(codigo)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# cache_http.py
+"""
+Caché HTTP persistente para el web scraping (ETag / Last-Modified).
+
+Por cada URL se guarda en SQLite el ETag, el Last-Modified y el hash del
+contenido descargado. En la siguiente pasada se pide con If-None-Match /
+If-Modified-Since: si el servidor responde 304 el documento no se descarga
+de nuevo, ni se vuelve a extraer ni a indexar.
+"""
+import hashlib
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+CACHE_HTTP_DIR = os.getenv("CACHE_HTTP_DIR", os.path.join(tempfile.gettempdir(), "cache_http"))
+
+
+class CacheHTTP:
+    """
+    Índice url -> validadores (+ cuerpo opcional para páginas HTML pequeñas).
+    """
+
+    def __init__(self, carpeta: str = CACHE_HTTP_DIR):
+        self.carpeta = carpeta
+        self.carpeta_cuerpos = os.path.join(carpeta, "cuerpos")
+        os.makedirs(self.carpeta_cuerpos, exist_ok=True)
+        self.ruta_db = os.path.join(carpeta, "cache_http.sqlite")
+        with self._conectar() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_http ("
+                " url TEXT PRIMARY KEY,"
+                " etag TEXT,"
+                " last_modified TEXT,"
+                " sha256 TEXT,"
+                " bytes INTEGER,"
+                " encoding TEXT,"
+                " ruta TEXT,"
+                " procesado_sha256 TEXT,"
+                " actualizado REAL)"
+            )
+
+    @contextmanager
+    def _conectar(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.ruta_db, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------------
+    def obtener(self, url: str) -> Optional[Dict]:
+        with self._conectar() as conn:
+            fila = conn.execute("SELECT * FROM cache_http WHERE url=?", (url,)).fetchone()
+        return dict(fila) if fila else None
+
+    def headers_condicionales(self, url: str, requiere_ruta: bool = False) -> Dict[str, str]:
+        """
+        Headers If-None-Match / If-Modified-Since para una URL ya vista.
+
+        Con `requiere_ruta=True` solo se revalida si el archivo guardado la vez
+        anterior todavía existe (si se borró hay que descargarlo completo).
+        """
+        entrada = self.obtener(url)
+        if not entrada:
+            return {}
+        if requiere_ruta and not (entrada.get("ruta") and os.path.exists(entrada["ruta"])):
+            return {}
+        headers = {}
+        if entrada.get("etag"):
+            headers["If-None-Match"] = entrada["etag"]
+        if entrada.get("last_modified"):
+            headers["If-Modified-Since"] = entrada["last_modified"]
+        return headers
+
+    def registrar(self, url: str, headers_respuesta, contenido_sha256: str,
+                  num_bytes: int, ruta: Optional[str] = None,
+                  encoding: Optional[str] = None):
+        """
+        Guarda los validadores de una respuesta 200.
+        """
+        with self._conectar() as conn:
+            conn.execute(
+                "INSERT INTO cache_http (url, etag, last_modified, sha256, bytes, encoding, ruta, actualizado) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET etag=excluded.etag, "
+                " last_modified=excluded.last_modified, sha256=excluded.sha256, "
+                " bytes=excluded.bytes, encoding=excluded.encoding, "
+                " ruta=COALESCE(excluded.ruta, cache_http.ruta), actualizado=excluded.actualizado",
+                (
+                    url,
+                    headers_respuesta.get("ETag"),
+                    headers_respuesta.get("Last-Modified"),
+                    contenido_sha256,
+                    num_bytes,
+                    encoding,
+                    ruta,
+                    time.time(),
+                ),
+            )
+
+    def tocar(self, url: str):
+        """
+        Marca una URL como revalidada (respuesta 304).
+        """
+        with self._conectar() as conn:
+            conn.execute("UPDATE cache_http SET actualizado=? WHERE url=?", (time.time(), url))
+
+    # ------------------------------------------------------------------
+    # Procesado: si el contenido ya se extrajo/indexó no se repite
+    # ------------------------------------------------------------------
+    def marcar_procesado(self, url: str, contenido_sha256: Optional[str] = None):
+        with self._conectar() as conn:
+            conn.execute(
+                "UPDATE cache_http SET procesado_sha256=COALESCE(?, sha256) WHERE url=?",
+                (contenido_sha256, url),
+            )
+
+    def ya_procesado(self, url: str, contenido_sha256: str) -> bool:
+        entrada = self.obtener(url)
+        return bool(entrada) and entrada.get("procesado_sha256") == contenido_sha256
+
+    # ------------------------------------------------------------------
+    # Cuerpos (solo para páginas HTML: los PDFs no se guardan aquí)
+    # ------------------------------------------------------------------
+    def guardar_cuerpo(self, contenido: bytes) -> str:
+        sha = hashlib.sha256(contenido).hexdigest()
+        ruta = os.path.join(self.carpeta_cuerpos, sha)
+        if not os.path.exists(ruta):
+            tmp = ruta + f".{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(contenido)
+            os.replace(tmp, ruta)
+        return ruta
+
+    def leer_cuerpo(self, url: str) -> Optional[bytes]:
+        entrada = self.obtener(url)
+        if not entrada or not entrada.get("ruta") or not os.path.exists(entrada["ruta"]):
+            return None
+        with open(entrada["ruta"], "rb") as f:
+            return f.read()
+
+
+_cache: Optional[CacheHTTP] = None
+
+
+def cache_global() -> CacheHTTP:
+    global _cache
+    if _cache is None:
+        _cache = CacheHTTP()
+    return _cache
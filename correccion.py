@@ -0,0 +1,299 @@
+# correccion.py
+"""
+Corrección ortográfica "¿quisiste decir...?" con SymSpell (borrados simétricos).
+
+Con el analizador estándar de Elastic "genero" no encuentra "género", y un
+error de tipeo en "violencia intrafamiliar" devuelve cero resultados: el
+usuario reintenta varias veces y eso multiplica la carga. Aquí se arma en
+memoria un diccionario de borrados a partir de los tokens del vocabulario
+(con sus frecuencias y claves sin tildes) y cada palabra se corrige con unas
+pocas búsquedas en diccionario, sin consultas fuzzy a Elastic.
+
+El diccionario se arma desde el corpus de términos de similares.py cuando se
+reconstruye la matriz (en la ingesta, no en una petición) y se guarda como
+`corrector.json` junto a esa versión. Cada worker lo carga en un hilo aparte
+al ver la versión nueva y mientras tanto sigue usando el anterior.
+"""
+import json
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from similares import STOPWORDS, IndiceSimilares, registrar_al_construir
+from texto import plegar_acentos
+
+CORRECCION_DISTANCIA = int(os.getenv("CORRECCION_DISTANCIA", "2"))
+# SymSpell solo genera borrados sobre el prefijo: menos memoria, igual precisión
+CORRECCION_PREFIJO = int(os.getenv("CORRECCION_PREFIJO", "7"))
+
+_PALABRA = re.compile(r"\w+", re.UNICODE)
+ARCHIVO_DICCIONARIO = "corrector.json"
+
+
+def _borrados(palabra: str, distancia: int) -> Set[str]:
+    """
+    Todas las variantes de `palabra` con hasta `distancia` letras borradas.
+    """
+    resultado = {palabra}
+    frontera = {palabra}
+    for _ in range(distancia):
+        siguiente = set()
+        for p in frontera:
+            if len(p) <= 1:
+                continue
+            for i in range(len(p)):
+                siguiente.add(p[:i] + p[i + 1:])
+        siguiente -= resultado
+        resultado |= siguiente
+        frontera = siguiente
+    return resultado
+
+
+def distancia_edicion(a: str, b: str, maximo: int) -> int:
+    """
+    Distancia de Damerau-Levenshtein (transposiciones adyacentes) con corte:
+    devuelve maximo + 1 si se pasa.
+    """
+    # Prefijo y sufijo comunes no cambian la distancia: solo se compara el medio
+    inicio = 0
+    while inicio < len(a) and inicio < len(b) and a[inicio] == b[inicio]:
+        inicio += 1
+    fin = 0
+    while fin < len(a) - inicio and fin < len(b) - inicio and a[-1 - fin] == b[-1 - fin]:
+        fin += 1
+    a, b = a[inicio:len(a) - fin], b[inicio:len(b) - fin]
+    if abs(len(a) - len(b)) > maximo:
+        return maximo + 1
+    if not a or not b:
+        return min(max(len(a), len(b)), maximo + 1)
+    anterior2: List[int] = []
+    anterior = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        actual = [i] + [0] * len(b)
+        minimo_fila = actual[0]
+        for j in range(1, len(b) + 1):
+            costo = 0 if a[i - 1] == b[j - 1] else 1
+            actual[j] = min(anterior[j] + 1, actual[j - 1] + 1, anterior[j - 1] + costo)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                actual[j] = min(actual[j], anterior2[j - 2] + 1)
+            minimo_fila = min(minimo_fila, actual[j])
+        if minimo_fila > maximo:
+            return maximo + 1
+        anterior2, anterior = anterior, actual
+    return min(anterior[-1], maximo + 1)
+
+
+class CorrectorOrtografico:
+    """
+    Diccionario SymSpell: clave sin tildes -> frecuencia y forma más común.
+    """
+
+    def __init__(self, distancia: int = CORRECCION_DISTANCIA, prefijo: int = CORRECCION_PREFIJO):
+        self.distancia = distancia
+        self.prefijo = prefijo
+        self.frecuencias: Dict[str, int] = {}
+        self.formas: Dict[str, str] = {}
+        self.borrados: Dict[str, List[str]] = {}
+
+    def construir(self, frecuencias: Dict[str, int], formas: Optional[Dict[str, str]] = None):
+        """
+        `frecuencias`: palabra plegada -> apariciones; `formas`: palabra plegada
+        -> forma con tildes para mostrar ("genero" -> "género").
+        """
+        borrados: Dict[str, List[str]] = {}
+        for palabra in frecuencias:
+            for variante in _borrados(palabra[:self.prefijo], self.distancia):
+                borrados.setdefault(variante, []).append(palabra)
+        self.frecuencias = dict(frecuencias)
+        self.formas = dict(formas or {})
+        self.borrados = borrados
+
+    def guardar(self, ruta: str):
+        tmp = ruta + f".{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"distancia": self.distancia, "prefijo": self.prefijo,
+                       "frecuencias": self.frecuencias, "formas": self.formas,
+                       "borrados": self.borrados}, f, ensure_ascii=False)
+        os.replace(tmp, ruta)
+
+    @classmethod
+    def cargar(cls, ruta: str) -> "CorrectorOrtografico":
+        with open(ruta, encoding="utf-8") as f:
+            datos = json.load(f)
+        corrector = cls(datos["distancia"], datos["prefijo"])
+        corrector.frecuencias = datos["frecuencias"]
+        corrector.formas = datos["formas"]
+        corrector.borrados = datos["borrados"]
+        return corrector
+
+    def sugerir(self, palabra: str) -> Optional[Tuple[str, int]]:
+        """
+        Mejor corrección de una palabra: (palabra plegada, distancia). Gana la
+        menor distancia y, a igual distancia, la más frecuente.
+        """
+        clave = plegar_acentos(palabra)
+        if clave in self.frecuencias:
+            return clave, 0
+        if len(clave) < 3:
+            return None
+
+        candidatos: Set[str] = set()
+        for variante in _borrados(clave[:self.prefijo], self.distancia):
+            candidatos.update(self.borrados.get(variante, ()))
+
+        mejor = None
+        for candidato in candidatos:
+            d = distancia_edicion(clave, candidato, self.distancia)
+            if d > self.distancia:
+                continue
+            orden = (d, -self.frecuencias[candidato])
+            if mejor is None or orden < mejor[0]:
+                mejor = (orden, candidato)
+        return (mejor[1], mejor[0][0]) if mejor else None
+
+    def corregir(self, texto: str) -> Optional[str]:
+        """
+        Frase corregida palabra por palabra (con tildes), o None si no cambia.
+        """
+        partes = []
+        cambio = False
+        ultimo = 0
+        for m in _PALABRA.finditer(texto):
+            palabra = m.group(0)
+            partes.append(texto[ultimo:m.start()])
+            ultimo = m.end()
+            sugerida = self.sugerir(palabra) if not palabra.isdigit() else None
+            if sugerida is None:
+                partes.append(palabra)
+                continue
+            forma = self.formas.get(sugerida[0], sugerida[0])
+            if forma.lower() != palabra.lower():
+                cambio = True
+                partes.append(forma)
+            else:
+                partes.append(palabra)
+        partes.append(texto[ultimo:])
+        return "".join(partes) if cambio else None
+
+
+def frecuencias_corpus(filas: Iterable[tuple]) -> Tuple[Dict[str, int], Dict[str, str]]:
+    """
+    Frecuencias (tokens del corpus de similares) y formas con tildes (tomadas
+    de los nombres de los términos, que se guardan tal cual).
+    """
+    frecuencias: Counter = Counter()
+    formas_vistas: Dict[str, Counter] = {}
+    for _id, padre, hijo, tokens in filas:
+        frecuencias.update(t for t in tokens.split() if t not in STOPWORDS)
+        for palabra in _PALABRA.findall(f"{padre or ''} {hijo or ''}".lower()):
+            formas_vistas.setdefault(plegar_acentos(palabra), Counter())[palabra] += 1
+    formas = {clave: c.most_common(1)[0][0] for clave, c in formas_vistas.items()}
+    return dict(frecuencias), formas
+
+
+class CorrectorVocabulario:
+    """
+    Corrector de un índice que sigue la versión publicada de la matriz de
+    similares (es decir, cambia tras una ingesta con términos). El cambio de
+    diccionario nunca ocurre en el hilo de una petición.
+    """
+
+    def __init__(self, similar: IndiceSimilares):
+        self.similar = similar
+        self.corrector: Optional[CorrectorOrtografico] = None
+        self._version: Optional[str] = None
+        self._cargando: Optional[str] = None
+        # Diccionario armado por este proceso para una versión aún no publicada
+        self._preparado: Optional[Tuple[str, CorrectorOrtografico]] = None
+        self._lock = threading.Lock()
+
+    def _version_actual(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.similar.carpeta, "ACTUAL")) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def instalar(self, version: str, corrector: CorrectorOrtografico):
+        with self._lock:
+            self.corrector = corrector
+            self._version = version
+            if self._cargando == version:
+                self._cargando = None
+
+    def _cargar(self, version: str):
+        """
+        Lee el diccionario que dejó la ingesta; si la versión no lo trae (p. ej.
+        se publicó sin correccion.py) se arma desde el corpus, en este hilo.
+        """
+        try:
+            try:
+                corrector = CorrectorOrtografico.cargar(
+                    os.path.join(self.similar.carpeta, version, ARCHIVO_DICCIONARIO))
+            except FileNotFoundError:
+                corrector = armar_corrector(self.similar.corpus.filas())
+            self.instalar(version, corrector)
+        except Exception as e:
+            print("[CORRECCION] No se pudo cargar el diccionario:", repr(e))
+            with self._lock:
+                self._cargando = None
+
+    def asegurar(self, esperar: bool = False) -> bool:
+        """
+        Si hay una versión nueva empieza a cargarla en otro hilo (con `esperar`,
+        aquí mismo). Devuelve si hay algún diccionario listo para usar.
+        """
+        version = self._version_actual()
+        if version is not None and version != self._version:
+            preparado = self._preparado
+            if preparado and preparado[0] == version:
+                self._preparado = None
+                self.instalar(*preparado)
+                return True
+            with self._lock:
+                lanzar = version != self._version and self._cargando != version
+                if lanzar:
+                    self._cargando = version
+            if lanzar:
+                if esperar:
+                    self._cargar(version)
+                else:
+                    threading.Thread(target=self._cargar, args=(version,), daemon=True,
+                                     name="correccion").start()
+        return self.corrector is not None
+
+    def corregir(self, texto: str) -> Optional[str]:
+        if not self.asegurar():
+            return None
+        return self.corrector.corregir(texto)
+
+
+def armar_corrector(filas: Iterable[tuple]) -> CorrectorOrtografico:
+    frecuencias, formas = frecuencias_corpus(filas)
+    corrector = CorrectorOrtografico()
+    corrector.construir(frecuencias, formas)
+    print(f"[CORRECCION] Diccionario con {len(frecuencias)} palabras "
+          f"({len(corrector.borrados)} borrados)")
+    return corrector
+
+
+def _guardar_con_version(similar: IndiceSimilares, destino: str, filas: list):
+    """Se llama al reconstruir la matriz: el diccionario queda listo junto a ella."""
+    corrector = armar_corrector(filas)
+    corrector.guardar(os.path.join(destino, ARCHIVO_DICCIONARIO))
+    # Este proceso ya lo tiene en memoria: se usa apenas se publique la versión
+    corrector_indice(similar)._preparado = (os.path.basename(destino), corrector)
+
+
+_correctores: Dict[str, CorrectorVocabulario] = {}
+
+
+def corrector_indice(similar: IndiceSimilares) -> CorrectorVocabulario:
+    if similar.carpeta not in _correctores:
+        _correctores[similar.carpeta] = CorrectorVocabulario(similar)
+    return _correctores[similar.carpeta]
+
+
+registrar_al_construir(_guardar_con_version)
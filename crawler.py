@@ -0,0 +1,239 @@
+# crawler.py
+"""
+Crawler concurrente en anchura (BFS) para el web scraping.
+
+Desde la URL inicial recorre las páginas del mismo dominio cuyas extensiones
+se indiquen (aspx, php, html...) hasta una profundidad y un número de páginas
+máximos, y va entregando los enlaces a documentos (pdf, docx...) a medida que
+los encuentra, para que descarga y extracción empiecen sin esperar al final.
+
+- Frontera por niveles: todas las páginas de un nivel se piden en paralelo.
+- URLs normalizadas (sin fragmento, host en minúscula, query ordenada).
+- Conjunto de vistas compacto: filtro de Bloom (bytearray + hashes).
+- Cortesía por host: un mínimo de tiempo entre peticiones al mismo servidor.
+"""
+import hashlib
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set
+from urllib.parse import parse_qsl, urldefrag, urlencode, urljoin, urlparse, urlunparse
+
+import requests
+from bs4 import BeautifulSoup
+
+CRAWLER_MAX_PROFUNDIDAD = int(os.getenv("CRAWLER_MAX_PROFUNDIDAD", "2"))
+CRAWLER_MAX_PAGINAS = int(os.getenv("CRAWLER_MAX_PAGINAS", "100"))
+CRAWLER_HILOS = int(os.getenv("CRAWLER_HILOS", "4"))
+CRAWLER_DEMORA_HOST = float(os.getenv("CRAWLER_DEMORA_HOST", "0.5"))
+
+# Rutas sin extensión ("/normativa/") también se consideran páginas
+EXTENSIONES_PAGINA_POR_DEFECTO = ("html", "htm", "aspx", "php")
+
+
+# ----------------------------------------------------------------------
+# URLs
+# ----------------------------------------------------------------------
+def normalizar_url(url: str) -> str:
+    """
+    Forma canónica de una URL para no visitar dos veces la misma página:
+    sin fragmento, esquema/host en minúscula, sin puerto por defecto,
+    query ordenada y sin "/" final redundante.
+    """
+    url, _ = urldefrag(url.strip())
+    p = urlparse(url)
+    esquema = p.scheme.lower()
+    host = (p.hostname or "").lower()
+    if p.port and not ((esquema == "http" and p.port == 80) or (esquema == "https" and p.port == 443)):
+        host = f"{host}:{p.port}"
+    ruta = p.path or "/"
+    if len(ruta) > 1 and ruta.endswith("/"):
+        ruta = ruta.rstrip("/")
+    query = urlencode(sorted(parse_qsl(p.query, keep_blank_values=True)))
+    return urlunparse((esquema, host, ruta, "", query, ""))
+
+
+def extension_url(url: str) -> str:
+    ultimo = urlparse(url).path.rsplit("/", 1)[-1]
+    return ultimo.rsplit(".", 1)[-1].lower() if "." in ultimo else ""
+
+
+def _dominio_base(host: str) -> str:
+    # www.minsalud.gov.co y minsalud.gov.co cuentan como el mismo sitio
+    host = (host or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def mismo_dominio(url: str, dominio: str) -> bool:
+    return _dominio_base(urlparse(url).hostname or "") == dominio
+
+
+# ----------------------------------------------------------------------
+# Filtro de Bloom
+# ----------------------------------------------------------------------
+class FiltroBloom:
+    """
+    Conjunto probabilístico de URLs vistas: ocupa ~1.2 bytes por URL con 1% de
+    falsos positivos (un falso positivo solo significa saltarse una página).
+    """
+
+    def __init__(self, capacidad: int = 100_000, error: float = 0.01):
+        capacidad = max(1, capacidad)
+        self.num_bits = max(8, int(-capacidad * math.log(error) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(self.num_bits / capacidad * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.elementos = 0
+
+    def _posiciones(self, valor: str) -> Iterator[int]:
+        # Doble hashing (Kirsch-Mitzenmacher) a partir de un solo blake2b
+        digest = hashlib.blake2b(valor.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def __contains__(self, valor: str) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._posiciones(valor))
+
+    def agregar(self, valor: str) -> bool:
+        """
+        Agrega un valor. Devuelve True si era nuevo.
+        """
+        nuevo = False
+        for p in self._posiciones(valor):
+            byte, bit = p >> 3, 1 << (p & 7)
+            if not self.bits[byte] & bit:
+                self.bits[byte] |= bit
+                nuevo = True
+        if nuevo:
+            self.elementos += 1
+        return nuevo
+
+
+# ----------------------------------------------------------------------
+# Crawler
+# ----------------------------------------------------------------------
+class Crawler:
+    """
+    Recorrido BFS concurrente de un sitio que entrega enlaces a documentos.
+    """
+
+    def __init__(self,
+                 extensiones_pagina: Optional[Iterable[str]] = None,
+                 tipos_documento: Iterable[str] = ("pdf",),
+                 max_profundidad: int = CRAWLER_MAX_PROFUNDIDAD,
+                 max_paginas: int = CRAWLER_MAX_PAGINAS,
+                 hilos: int = CRAWLER_HILOS,
+                 demora_host: float = CRAWLER_DEMORA_HOST,
+                 mismo_sitio: bool = True,
+                 sesion: Optional[requests.Session] = None,
+                 obtener_pagina: Optional[Callable[[str], str]] = None,
+                 timeout: float = 20):
+        extensiones = [e.strip().lower().lstrip(".") for e in (extensiones_pagina or []) if e.strip()]
+        self.extensiones_pagina: Set[str] = set(extensiones or EXTENSIONES_PAGINA_POR_DEFECTO)
+        self.tipos_documento: Set[str] = {t.strip().lower().lstrip(".") for t in tipos_documento if t.strip()} or {"pdf"}
+        self.max_profundidad = max_profundidad
+        self.max_paginas = max_paginas
+        self.hilos = max(1, hilos)
+        self.demora_host = demora_host
+        self.mismo_sitio = mismo_sitio
+        self.sesion = sesion or requests.Session()
+        self.timeout = timeout
+        # Permite inyectar una descarga con caché HTTP (webscraping_helper.obtener_html)
+        self.obtener_pagina = obtener_pagina or self._obtener_html
+
+        self.vistas = FiltroBloom(capacidad=max(1000, max_paginas * 50))
+        self.paginas_visitadas = 0
+        self._ultimo_acceso: Dict[str, float] = {}
+        self._lock_hosts: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    def _esperar_turno(self, url: str):
+        """
+        Cortesía: al mismo host como mucho una petición cada `demora_host` s.
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            lock = self._lock_hosts.setdefault(host, threading.Lock())
+        with lock:
+            espera = self._ultimo_acceso.get(host, 0) + self.demora_host - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+            self._ultimo_acceso[host] = time.monotonic()
+
+    def _es_pagina(self, url: str) -> bool:
+        ext = extension_url(url)
+        return ext == "" or ext in self.extensiones_pagina
+
+    def _es_documento(self, url: str) -> bool:
+        return extension_url(url) in self.tipos_documento
+
+    def _obtener_html(self, url: str) -> str:
+        resp = self.sesion.get(url, timeout=self.timeout)
+        resp.raise_for_status()
+        return resp.text
+
+    def _descargar_pagina(self, url: str) -> List[str]:
+        """
+        Descarga una página y devuelve sus enlaces absolutos normalizados.
+        """
+        self._esperar_turno(url)
+        try:
+            html = self.obtener_pagina(url)
+        except Exception as e:
+            print(f"[CRAWLER] Error accediendo a {url}: {e}")
+            return []
+
+        soup = BeautifulSoup(html, "lxml")
+        enlaces = []
+        for a in soup.find_all("a", href=True):
+            href = a["href"].strip()
+            if not href or href.startswith(("#", "mailto:", "javascript:", "tel:")):
+                continue
+            absoluta = urljoin(url, href)
+            if absoluta.startswith(("http://", "https://")):
+                enlaces.append(normalizar_url(absoluta))
+        return enlaces
+
+    def recorrer(self, url_inicial: str) -> Iterator[str]:
+        """
+        Recorre el sitio desde `url_inicial` y entrega las URLs de documentos
+        (sin repetir) en cuanto aparecen.
+        """
+        inicio = normalizar_url(url_inicial)
+        dominio = _dominio_base(urlparse(inicio).hostname or "")
+        self.vistas.agregar(inicio)
+        nivel = [inicio]
+        documentos_vistos = FiltroBloom(capacidad=max(1000, self.max_paginas * 50))
+
+        with ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix="crawler") as ex:
+            for profundidad in range(self.max_profundidad + 1):
+                if not nivel:
+                    break
+                restantes = self.max_paginas - self.paginas_visitadas
+                nivel = nivel[:max(0, restantes)]
+                self.paginas_visitadas += len(nivel)
+
+                siguiente: List[str] = []
+                futuros = [ex.submit(self._descargar_pagina, url) for url in nivel]
+                for futuro in as_completed(futuros):
+                    enlaces = futuro.result()
+                    for enlace in enlaces:
+                        if self._es_documento(enlace):
+                            # Los documentos pueden estar en otro host (CDN, repositorio)
+                            if documentos_vistos.agregar(enlace):
+                                yield enlace
+                        elif (profundidad < self.max_profundidad
+                              and self._es_pagina(enlace)
+                              and (not self.mismo_sitio or mismo_dominio(enlace, dominio))
+                              and self.vistas.agregar(enlace)):
+                            siguiente.append(enlace)
+
+                nivel = siguiente
+                if self.paginas_visitadas >= self.max_paginas:
+                    break
+
+        print(f"[CRAWLER] {self.paginas_visitadas} páginas visitadas desde {url_inicial}")
@@ -0,0 +1,360 @@
+# duplicados.py
+"""
+Detección de casi-duplicados en la ingesta con MinHash + LSH.
+
+La misma norma en PDF suele estar enlazada desde varias páginas y desde varias
+filas del vocabulario (link_1/link_2/link_3), así que textos casi idénticos se
+indexaban muchas veces. Aquí cada texto se resume en una firma MinHash
+(calculada con NumPy) y se reparte en bandas LSH; los candidatos que comparten
+alguna banda se comparan y, si la similitud de Jaccard estimada supera el
+umbral, el documento se guarda sin cuerpo y apuntando al canónico
+(`duplicado_de`). El canónico recibe la lista `duplicados`.
+
+Las firmas se guardan en SQLite, así la detección es incremental entre cargas.
+Solo se guardan las de documentos que Elastic confirmó (como el manifiesto de
+ingesta.py); mientras tanto quedan pendientes en memoria y ya cuentan como
+candidatos para los demás documentos de la carga.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from pasajes import resumen
+from texto import tokenizar
+
+DUPLICADOS_DB = os.getenv("DUPLICADOS_DB", os.path.join("/tmp", "duplicados_ingesta.sqlite"))
+DUPLICADOS_UMBRAL = float(os.getenv("DUPLICADOS_UMBRAL", "0.85"))
+MINHASH_PERMUTACIONES = int(os.getenv("MINHASH_PERMUTACIONES", "128"))
+LSH_BANDAS = int(os.getenv("LSH_BANDAS", "16"))
+# Textos más cortos no se deduplican (dos definiciones breves se parecen demasiado)
+DUPLICADOS_MIN_PALABRAS = int(os.getenv("DUPLICADOS_MIN_PALABRAS", "50"))
+TAMANO_SHINGLE = 5
+_BLOQUE_SHINGLES = 8192
+
+# Campos con el cuerpo pesado de un documento (PDF extraído o vocabulario)
+CAMPOS_CUERPO = ("paginas", "contenido", "pdf_text")
+
+
+def texto_documento(doc: dict) -> str:
+    if doc.get("paginas"):
+        return "\n".join(doc["paginas"])
+    return doc.get("contenido") or doc.get("pdf_text") or ""
+
+
+class MinHash:
+    """
+    Firmas MinHash con hashing multiplicativo (a*x + b) >> 32 sobre uint64:
+    el desborde de NumPy hace el módulo 2^64 sin costo.
+    """
+
+    def __init__(self, permutaciones: int = MINHASH_PERMUTACIONES, semilla: int = 1):
+        rng = np.random.default_rng(semilla)
+        self.permutaciones = permutaciones
+        self.a = (rng.integers(1, 2**63, size=permutaciones, dtype=np.uint64) | np.uint64(1))[:, None]
+        self.b = rng.integers(0, 2**63, size=permutaciones, dtype=np.uint64)[:, None]
+
+    @staticmethod
+    def shingles(palabras: List[str], k: int = TAMANO_SHINGLE) -> np.ndarray:
+        """
+        Hash de cada secuencia de k palabras, combinando los hashes de las
+        palabras de forma vectorizada (sin armar los strings de cada shingle).
+        """
+        h = np.fromiter((zlib.crc32(p.encode("utf-8")) for p in palabras),
+                        dtype=np.uint64, count=len(palabras))
+        if len(h) < k:
+            return np.unique(h)
+        n = len(h) - k + 1
+        combinado = np.zeros(n, dtype=np.uint64)
+        primo = np.uint64(1_000_003)
+        with np.errstate(over="ignore"):
+            for j in range(k):
+                combinado = combinado * primo + h[j:j + n]
+        return np.unique(combinado)
+
+    def firma(self, shingles: np.ndarray) -> np.ndarray:
+        firma = np.full(self.permutaciones, np.iinfo(np.uint32).max, dtype=np.uint32)
+        with np.errstate(over="ignore"):
+            for i in range(0, len(shingles), _BLOQUE_SHINGLES):
+                bloque = shingles[i:i + _BLOQUE_SHINGLES][None, :]
+                valores = ((self.a * bloque + self.b) >> np.uint64(32)).astype(np.uint32)
+                np.minimum(firma, valores.min(axis=1), out=firma)
+        return firma
+
+
+def similitud(firma_a: np.ndarray, firma_b: np.ndarray) -> float:
+    """
+    Jaccard estimado: fracción de posiciones iguales entre dos firmas.
+    """
+    return float(np.mean(firma_a == firma_b))
+
+
+class DetectorDuplicados:
+    """
+    Almacén de firmas (SQLite) + índice LSH por bandas.
+    """
+
+    def __init__(self, ruta_db: str = DUPLICADOS_DB,
+                 umbral: float = DUPLICADOS_UMBRAL,
+                 permutaciones: int = MINHASH_PERMUTACIONES,
+                 bandas: int = LSH_BANDAS):
+        if permutaciones % bandas:
+            raise ValueError("MINHASH_PERMUTACIONES debe ser múltiplo de LSH_BANDAS")
+        self.ruta_db = ruta_db
+        self.umbral = umbral
+        self.bandas = bandas
+        self.filas = permutaciones // bandas
+        self.minhash = MinHash(permutaciones)
+        # Firmas de documentos enviados que Elastic aún no confirma, compartidas
+        # entre las cargas en curso: (indice, id) -> (firma, claves, canonico)
+        self._pendientes: Dict[Tuple[str, str], Tuple[np.ndarray, List[int], Optional[str]]] = {}
+        self._bandas_pendientes: Dict[Tuple[str, int, int], Set[str]] = defaultdict(set)
+        self._duplicados_pendientes: Dict[Tuple[str, str], Set[str]] = defaultdict(set)
+        self._lock = threading.Lock()
+        with self._conectar() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS firmas ("
+                " indice TEXT NOT NULL,"
+                " id TEXT NOT NULL,"
+                " firma BLOB NOT NULL,"
+                " canonico TEXT,"
+                " actualizado REAL NOT NULL,"
+                " PRIMARY KEY (indice, id))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS bandas ("
+                " indice TEXT NOT NULL,"
+                " banda INTEGER NOT NULL,"
+                " clave INTEGER NOT NULL,"
+                " id TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_bandas ON bandas (indice, banda, clave)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_bandas_id ON bandas (indice, id)")
+
+    @contextmanager
+    def _conectar(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.ruta_db, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------------
+    def firma_texto(self, texto: str) -> Optional[np.ndarray]:
+        palabras = tokenizar(texto)
+        if len(palabras) < DUPLICADOS_MIN_PALABRAS:
+            return None
+        return self.minhash.firma(MinHash.shingles(palabras))
+
+    def _claves_bandas(self, firma: np.ndarray) -> List[int]:
+        claves = []
+        for i in range(self.bandas):
+            trozo = firma[i * self.filas:(i + 1) * self.filas].tobytes()
+            digest = hashlib.blake2b(trozo, digest_size=8).digest()
+            claves.append(int.from_bytes(digest, "little", signed=True))
+        return claves
+
+    def buscar(self, conn: sqlite3.Connection, indice: str, doc_id: str,
+               firma: np.ndarray, claves: List[int]) -> Optional[Tuple[str, float]]:
+        """
+        Documento canónico más parecido por encima del umbral (o None).
+        """
+        condicion = " OR ".join("(banda=? AND clave=?)" for _ in claves)
+        params = [v for par in enumerate(claves) for v in par]
+        candidatos = conn.execute(
+            f"SELECT DISTINCT f.id, f.firma, f.canonico FROM bandas b "
+            f"JOIN firmas f ON f.indice=b.indice AND f.id=b.id "
+            f"WHERE b.indice=? AND b.id<>? AND ({condicion})",
+            (indice, doc_id, *params),
+        ).fetchall()
+        candidatos = [(cand_id, np.frombuffer(blob, dtype=np.uint32), canonico)
+                      for cand_id, blob, canonico in candidatos]
+        with self._lock:
+            ids = set()
+            for i, clave in enumerate(claves):
+                ids |= self._bandas_pendientes.get((indice, i, clave), set())
+            ids.discard(doc_id)
+            candidatos += [(cand_id, self._pendientes[(indice, cand_id)][0], None)
+                           for cand_id in ids]
+
+        mejor = None
+        for cand_id, firma_cand, canonico in candidatos:
+            s = similitud(firma, firma_cand)
+            if s >= self.umbral and (mejor is None or s > mejor[1]):
+                # Si el candidato ya es duplicado de otro, se apunta al canónico
+                mejor = (canonico or cand_id, s)
+        return mejor
+
+    def registrar(self, conn: sqlite3.Connection, indice: str, doc_id: str,
+                  firma: np.ndarray, claves: List[int], canonico: Optional[str]):
+        conn.execute("DELETE FROM bandas WHERE indice=? AND id=?", (indice, doc_id))
+        conn.execute(
+            "INSERT OR REPLACE INTO firmas (indice, id, firma, canonico, actualizado) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (indice, doc_id, firma.tobytes(), canonico, time.time()),
+        )
+        # Los duplicados no entran a las bandas: solo se compara contra canónicos
+        if canonico is None:
+            conn.executemany(
+                "INSERT INTO bandas (indice, banda, clave, id) VALUES (?, ?, ?, ?)",
+                ((indice, i, clave, doc_id) for i, clave in enumerate(claves)),
+            )
+
+    def duplicados_de(self, conn: sqlite3.Connection, indice: str, canonico: str) -> List[str]:
+        filas = conn.execute(
+            "SELECT id FROM firmas WHERE indice=? AND canonico=? ORDER BY id",
+            (indice, canonico),
+        ).fetchall()
+        with self._lock:
+            pendientes = self._duplicados_pendientes.get((indice, canonico), set())
+            return sorted({f[0] for f in filas} | pendientes)
+
+    def _anotar_pendiente(self, indice: str, doc_id: str, firma: np.ndarray,
+                          claves: List[int], canonico: Optional[str]):
+        with self._lock:
+            self._quitar_pendiente(indice, doc_id)
+            self._pendientes[(indice, doc_id)] = (firma, claves, canonico)
+            if canonico is None:
+                for i, clave in enumerate(claves):
+                    self._bandas_pendientes[(indice, i, clave)].add(doc_id)
+            else:
+                self._duplicados_pendientes[(indice, canonico)].add(doc_id)
+
+    def _quitar_pendiente(self, indice: str, doc_id: str):
+        # Se llama con `_lock` tomado
+        pendiente = self._pendientes.pop((indice, doc_id), None)
+        if pendiente is None:
+            return
+        _, claves, canonico = pendiente
+        if canonico is None:
+            for i, clave in enumerate(claves):
+                ids = self._bandas_pendientes.get((indice, i, clave))
+                if ids is not None:
+                    ids.discard(doc_id)
+                    if not ids:
+                        del self._bandas_pendientes[(indice, i, clave)]
+        else:
+            ids = self._duplicados_pendientes.get((indice, canonico))
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del self._duplicados_pendientes[(indice, canonico)]
+
+    def confirmar(self, indice: str, ids: Iterable[str]):
+        """
+        Guarda en SQLite las firmas pendientes de los ids que Elastic indexó.
+        """
+        with self._lock:
+            confirmadas = [(doc_id, self._pendientes[(indice, doc_id)])
+                           for doc_id in ids if (indice, doc_id) in self._pendientes]
+        if not confirmadas:
+            return
+        with self._conectar() as conn:
+            for doc_id, (firma, claves, canonico) in confirmadas:
+                self.registrar(conn, indice, doc_id, firma, claves, canonico)
+        # Ya están en SQLite: se dejan de buscar en memoria
+        with self._lock:
+            for doc_id, pendiente in confirmadas:
+                if self._pendientes.get((indice, doc_id)) is pendiente:
+                    self._quitar_pendiente(indice, doc_id)
+
+    def descartar(self, indice: str, ids: Iterable[str]):
+        """
+        Olvida las firmas pendientes de documentos que Elastic no confirmó.
+        """
+        with self._lock:
+            for doc_id in ids:
+                self._quitar_pendiente(indice, doc_id)
+
+    def sesion(self, indice: str) -> "SesionDuplicados":
+        return SesionDuplicados(self, indice)
+
+    def olvidar(self, indice: str):
+        with self._conectar() as conn:
+            conn.execute("DELETE FROM bandas WHERE indice=?", (indice,))
+            conn.execute("DELETE FROM firmas WHERE indice=?", (indice,))
+        with self._lock:
+            for clave in [c for c in self._pendientes if c[0] == indice]:
+                self._quitar_pendiente(*clave)
+
+
+class SesionDuplicados:
+    """
+    Una pasada de ingesta sobre un índice: colapsa los casi-duplicados y
+    registra las firmas solo de lo que Elastic confirma (`confirmar`). Al
+    terminar, `cerrar` olvida las que quedaron sin confirmar.
+    """
+
+    def __init__(self, detector: DetectorDuplicados, indice: str):
+        self.detector = detector
+        self.indice = indice
+        self.pendientes: Set[str] = set()
+
+    def colapsar(self, documentos: Iterable[dict],
+                 al_detectar: Optional[Callable[[str, str, float], None]] = None) -> Iterator[dict]:
+        """
+        Etapa de ingesta (documentos ya con `_id`): los casi-duplicados salen
+        sin cuerpo, con `duplicado_de` y `similitud`, seguidos de una
+        actualización parcial del canónico con su lista `duplicados`.
+        """
+        detector, indice = self.detector, self.indice
+        with detector._conectar() as conn:
+            for doc in documentos:
+                firma = detector.firma_texto(texto_documento(doc))
+                if firma is None:
+                    yield doc
+                    continue
+
+                doc_id = doc["_id"]
+                claves = detector._claves_bandas(firma)
+                encontrado = detector.buscar(conn, indice, doc_id, firma, claves)
+                if encontrado is None:
+                    detector._anotar_pendiente(indice, doc_id, firma, claves, None)
+                    self.pendientes.add(doc_id)
+                    # Un canónico re-indexado conserva sus referencias
+                    previos = detector.duplicados_de(conn, indice, doc_id)
+                    if previos:
+                        doc["duplicados"] = previos
+                    yield doc
+                    continue
+
+                canonico, s = encontrado
+                detector._anotar_pendiente(indice, doc_id, firma, claves, canonico)
+                self.pendientes.add(doc_id)
+                cuerpo = texto_documento(doc)
+                solo_pdf_text = not (doc.get("paginas") or doc.get("contenido"))
+                for campo in CAMPOS_CUERPO:
+                    doc.pop(campo, None)
+                doc["pdf_resumen" if solo_pdf_text else "contenido"] = resumen(cuerpo)
+                doc["duplicado_de"] = canonico
+                doc["similitud"] = round(s, 3)
+                if al_detectar:
+                    al_detectar(doc_id, canonico, s)
+                yield doc
+                yield {
+                    "_op": "update",
+                    "_id": canonico,
+                    "duplicados": detector.duplicados_de(conn, indice, canonico),
+                }
+
+    def confirmar(self, ids: Iterable[str]):
+        """
+        Registra las firmas de los ids que Elastic indexó sin error.
+        """
+        ids = [i for i in ids if i in self.pendientes]
+        if ids:
+            self.detector.confirmar(self.indice, ids)
+            self.pendientes.difference_update(ids)
+
+    def cerrar(self):
+        self.detector.descartar(self.indice, self.pendientes)
+        self.pendientes = set()
@@ -1,13 +1,23 @@
 import os
 import json
 import logging
-from typing import List, Optional, Dict
+import re
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+from urllib.parse import quote
 
 import requests
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Nombres de índice aceptados: minúsculas, dígitos, _ y - (sin / ni ..), ya
+# que el nombre también se usa para rutas en disco (similares, generaciones)
+NOMBRE_INDICE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,199}$")
+
+
+def nombre_indice_valido(nombre) -> bool:
+    return isinstance(nombre, str) and bool(NOMBRE_INDICE.match(nombre))
+
 
 class ElasticSearch:
     """
@@ -32,6 +42,16 @@ class ElasticSearch:
             "Content-Type": "application/json",
             "Authorization": f"ApiKey {self.api_key}",
         }
+        # Sesión HTTP (conexiones keep-alive) creada al primer uso en cada
+        # proceso: no se comparten sockets entre workers de gunicorn
+        self._sesion: Optional[requests.Session] = None
+        self._pid: Optional[int] = None
+
+    def _http(self) -> requests.Session:
+        if self._sesion is None or self._pid != os.getpid():
+            self._sesion = requests.Session()
+            self._pid = os.getpid()
+        return self._sesion
 
     def _url(self, path: str) -> str:
         """
@@ -41,12 +61,12 @@ class ElasticSearch:
             path = "/" + path
         return f"{self.base_url}{path}"
 
-    def ping(self) -> bool:
+    def ping(self, timeout: float = 10) -> bool:
         """
         Verifica si Elastic está respondiendo.
         """
         try:
-            resp = requests.get(self._url("/"), headers=self.headers, timeout=10)
+            resp = self._http().get(self._url("/"), headers=self.headers, timeout=timeout)
             logger.info("Ping Elastic status: %s", resp.status_code)
             return resp.ok
         except Exception as e:
@@ -60,12 +80,36 @@ class ElasticSearch:
         url = self._url(f"/{index_name}")
         body = mappings or {}
 
-        resp = requests.put(url, headers=self.headers, data=json.dumps(body))
+        resp = self._http().put(url, headers=self.headers, data=json.dumps(body))
         try:
             return resp.json()
         except Exception:
             return {"status_code": resp.status_code, "text": resp.text}
 
+    def _enviar_bulk(self, body: str) -> dict:
+        """
+        Envía un cuerpo NDJSON ya armado a la API _bulk. La respuesta lleva
+        también `status_code` (un 4xx/5xx puede venir con JSON de error sin `items`).
+        """
+        url = self._url("/_bulk")
+        headers = self.headers.copy()
+        headers["Content-Type"] = "application/x-ndjson"
+
+        resp = self._http().post(url, headers=headers, data=body.encode("utf-8"))
+
+        try:
+            data = resp.json()
+        except Exception:
+            data = {"text": resp.text}
+        if not isinstance(data, dict):
+            data = {"respuesta": data}
+        data["status_code"] = resp.status_code
+
+        if resp.status_code >= 400:
+            logger.error("Error en bulk indexing: %s", data)
+
+        return data
+
     def indexar_bulks(self, index_name: str, documentos: List[dict]) -> dict:
         """
         Indexa una lista de documentos usando la API _bulk de Elastic.
@@ -82,22 +126,174 @@ class ElasticSearch:
             bulk_lines.append(json.dumps(doc))
 
         body = "\n".join(bulk_lines) + "\n"
+        return self._enviar_bulk(body)
 
-        url = self._url("/_bulk")
-        headers = self.headers.copy()
-        headers["Content-Type"] = "application/x-ndjson"
+    def indexar_en_lotes(
+        self,
+        index_name: str,
+        documentos: Iterable[dict],
+        tamano_lote: int = 500,
+        max_bytes_lote: int = 10 * 1024 * 1024,
+        al_enviar_lote: Optional[Callable[[int, int], None]] = None,
+        al_confirmar_ids: Optional[Callable[[List[str]], None]] = None,
+    ) -> dict:
+        """
+        Indexa documentos que llegan de un generador, en varias peticiones _bulk.
+
+        Cada lote se cierra al llegar a `tamano_lote` documentos o a
+        `max_bytes_lote` bytes de NDJSON, así que la memoria usada no depende
+        de cuántos documentos haya en total. Si se pasa `al_enviar_lote`, se
+        llama tras cada lote con (documentos del lote, documentos con error).
+
+        Si un documento trae la llave `_id` se usa como id en Elastic (y no se
+        envía dentro del cuerpo); `al_confirmar_ids` recibe los ids de cada
+        lote que Elastic indexó sin error. Con la llave `_index` un documento
+        va a otro índice (p. ej. los pasajes en el índice acompañante; esos no
+        se pasan a `al_confirmar_ids`, que solo recibe los del índice principal)
+        y con `"_op": "update"` se envía como actualización parcial de `_id`
+        (tampoco se confirma). `"_op": "upsert"` es una actualización parcial
+        que crea el documento si no existe; esa sí se confirma.
+
+        Devuelve un resumen: documentos enviados, lotes, documentos con error.
+        """
+        resumen = {"enviados": 0, "lotes": 0, "errores": 0, "errors": False}
+        accion_sin_id = json.dumps({"index": {"_index": index_name}})
+
+        lineas: List[str] = []
+        # Por cada documento del lote: si va al índice principal (confirmable)
+        principales: List[bool] = []
+        bytes_lote = 0
+
+        def enviar():
+            data = self._enviar_bulk("\n".join(lineas) + "\n")
+            n_docs = len(lineas) // 2
+            errores_lote = 0
+            items = data.get("items") or []
+            # Sin `items` Elastic no procesó el lote (p. ej. 413 o un error de parseo)
+            fallo_total = data.get("status_code", 200) >= 400 or not items
+            if fallo_total:
+                errores_lote = n_docs
+            elif data.get("errors"):
+                errores_lote = sum(
+                    1 for it in items
+                    if next(iter(it.values()), {}).get("error")
+                )
+            if al_confirmar_ids and not fallo_total:
+                # Los items vuelven en el orden del lote; los de otros índices
+                # (pasajes, pdf_text) pueden repetir el _id del documento principal
+                al_confirmar_ids([
+                    r.get("_id")
+                    for principal, r in zip(principales, (next(iter(it.values()), {}) for it in items))
+                    if principal and r.get("_id") and not r.get("error")
+                ])
+            resumen["lotes"] += 1
+            resumen["enviados"] += n_docs
+            resumen["errores"] += errores_lote
+            resumen["errors"] = resumen["errors"] or bool(errores_lote)
+            if al_enviar_lote:
+                al_enviar_lote(n_docs, errores_lote)
 
-        resp = requests.post(url, headers=headers, data=body)
+        for doc in documentos:
+            if "_id" in doc or "_index" in doc or "_op" in doc:
+                doc = dict(doc)
+                operacion = doc.pop("_op", None) or "index"
+                destino = doc.pop("_index", None) or index_name
+                meta = {"_index": destino}
+                if "_id" in doc:
+                    meta["_id"] = str(doc.pop("_id"))
+                accion = json.dumps({operacion: meta})
+                if operacion == "upsert":
+                    accion = json.dumps({"update": meta})
+                    doc = {"doc": doc, "doc_as_upsert": True}
+                elif operacion == "update":
+                    doc = {"doc": doc}
+            else:
+                accion = accion_sin_id
+                destino, operacion = index_name, "index"
+            linea = json.dumps(doc)
+            # Las actualizaciones parciales (p. ej. `duplicados` del canónico) no
+            # indexan el documento: no se confirman en el manifiesto
+            principales.append(destino == index_name and operacion != "update")
+            lineas.append(accion)
+            lineas.append(linea)
+            bytes_lote += len(accion) + len(linea) + 2
+            if len(lineas) // 2 >= tamano_lote or bytes_lote >= max_bytes_lote:
+                enviar()
+                lineas = []
+                principales = []
+                bytes_lote = 0
+
+        if lineas:
+            enviar()
+
+        return resumen
+
+    def obtener_documento(self, index_name: str, doc_id: str,
+                          campos: Optional[List[str]] = None) -> Optional[dict]:
+        """
+        Devuelve el _source de un documento por id (None si no existe).
+        Con `campos` solo se traen esos campos del _source.
+        """
+        url = self._url(f"/{index_name}/_doc/{quote(str(doc_id), safe='')}")
+        params = {"_source_includes": ",".join(campos)} if campos else None
+        resp = self._http().get(url, headers=self.headers, params=params, timeout=30)
+        if resp.status_code == 404:
+            return None
+        resp.raise_for_status()
+        return resp.json().get("_source", {})
+
+    def recorrer_documentos(self, index_name: str, campos: Optional[List[str]] = None,
+                            query: Optional[Dict] = None, tamano: int = 1000) -> Iterator[dict]:
+        """
+        Recorre todos los documentos de un índice con la API scroll.
+        Entrega el _source de cada uno con su `_id`.
+        """
+        body = {"size": tamano, "query": query or {"match_all": {}}, "sort": ["_doc"]}
+        if campos:
+            body["_source"] = campos
+        resp = self._http().post(
+            self._url(f"/{index_name}/_search"),
+            headers=self.headers, params={"scroll": "2m"}, data=json.dumps(body), timeout=60,
+        )
+        resp.raise_for_status()
+        data = resp.json()
+        scroll_id = data.get("_scroll_id")
+        try:
+            while True:
+                hits = data.get("hits", {}).get("hits", [])
+                if not hits:
+                    break
+                for hit in hits:
+                    doc = dict(hit.get("_source", {}))
+                    doc["_id"] = hit["_id"]
+                    yield doc
+                resp = self._http().post(
+                    self._url("/_search/scroll"), headers=self.headers,
+                    data=json.dumps({"scroll": "2m", "scroll_id": scroll_id}), timeout=60,
+                )
+                resp.raise_for_status()
+                data = resp.json()
+                scroll_id = data.get("_scroll_id", scroll_id)
+        finally:
+            if scroll_id:
+                self._http().delete(self._url("/_search/scroll"), headers=self.headers,
+                                data=json.dumps({"scroll_id": scroll_id}), timeout=10)
 
+    def borrar_por_query(self, index_name: str, query: Dict) -> dict:
+        """
+        Borra los documentos de un índice que cumplan la query (_delete_by_query).
+        """
+        url = self._url(f"/{index_name}/_delete_by_query")
+        resp = self._http().post(
+            url,
+            headers=self.headers,
+            params={"conflicts": "proceed"},
+            data=json.dumps({"query": query}),
+        )
         try:
-            data = resp.json()
+            return resp.json()
         except Exception:
-            data = {"status_code": resp.status_code, "text": resp.text}
-
-        if resp.status_code >= 400:
-            logger.error("Error en bulk indexing: %s", data)
-
-        return data
+            return {"status_code": resp.status_code, "text": resp.text}
 
     def buscar_texto(
         self,
@@ -131,7 +327,7 @@ class ElasticSearch:
             }
 
         url = self._url(f"/{index_name}/_search")
-        resp = requests.get(url, headers=self.headers, data=json.dumps(q))
+        resp = self._http().get(url, headers=self.headers, data=json.dumps(q))
 
         try:
             return resp.json()
@@ -154,7 +350,7 @@ class ElasticSearch:
                 "size": 0,
                 "query": {"match_all": {}}
             }
-            resp = requests.get(url, headers=self.headers, data=json.dumps(body))
+            resp = self._http().get(url, headers=self.headers, data=json.dumps(body))
 
             try:
                 data = resp.json()
@@ -189,7 +385,7 @@ class ElasticSearch:
         """
         try:
             url = self._url(f"/{index_name}/_search")
-            resp = requests.get(url, headers=self.headers, data=json.dumps(query_body))
+            resp = self._http().get(url, headers=self.headers, data=json.dumps(query_body))
 
             try:
                 return resp.json()
@@ -219,18 +415,18 @@ class ElasticSearch:
             if operacion == "index":
                 # PUT /{index}/_doc/{id}
                 url = self._url(f"/{index_name}/_doc/{doc_id}")
-                resp = requests.put(url, headers=self.headers, data=json.dumps(documento))
+                resp = self._http().put(url, headers=self.headers, data=json.dumps(documento))
 
             elif operacion == "update":
                 # POST /{index}/_update/{id}
                 url = self._url(f"/{index_name}/_update/{doc_id}")
                 body = {"doc": documento}
-                resp = requests.post(url, headers=self.headers, data=json.dumps(body))
+                resp = self._http().post(url, headers=self.headers, data=json.dumps(body))
 
             elif operacion == "delete":
                 # DELETE /{index}/_doc/{id}
                 url = self._url(f"/{index_name}/_doc/{doc_id}")
-                resp = requests.delete(url, headers=self.headers)
+                resp = self._http().delete(url, headers=self.headers)
 
             else:
                 raise ValueError(f"Operación DML no soportada: {operacion}")
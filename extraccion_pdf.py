@@ -0,0 +1,431 @@
+# extraccion_pdf.py
+"""
+Extracción de texto de PDFs en un pool de procesos.
+
+PyPDF2 es puro Python y consume CPU (y el GIL), así que extraer en el hilo de
+la petición o en hilos no escala. Aquí cada PDF (o cada rango de páginas, si
+el PDF es grande) se manda a un ProcessPoolExecutor del tamaño de los núcleos
+disponibles, con un tiempo máximo por documento.
+"""
+import io
+import itertools
+import multiprocessing
+import os
+import signal
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import (CancelledError, ProcessPoolExecutor, TimeoutError as FuturoTimeout,
+                                wait as esperar)
+from typing import IO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from PyPDF2 import PdfReader
+
+PDF_PROCESOS = int(os.getenv("PDF_PROCESOS", "0")) or (os.cpu_count() or 1)
+# 0 = todas las páginas. Antes era un límite fijo de 5 páginas por rendimiento.
+PDF_MAX_PAGINAS = int(os.getenv("PDF_MAX_PAGINAS", "0"))
+PDF_TIMEOUT = float(os.getenv("PDF_TIMEOUT", "120"))
+# A partir de cuántas páginas un PDF se reparte en rangos entre varios procesos
+PDF_PAGINAS_POR_TAREA = int(os.getenv("PDF_PAGINAS_POR_TAREA", "25"))
+# "spawn" evita heredar hilos / sockets del worker de gunicorn al crear procesos
+PDF_CONTEXTO = os.getenv("PDF_CONTEXTO_PROCESOS", "spawn")
+# PDFs hasta este tamaño se procesan desde memoria (sin escribirlos a disco)
+PDF_MEMORIA_MAX = int(os.getenv("PDF_MEMORIA_MAX_MB", "8")) * 1024 * 1024
+
+# Un PDF puede venir como ruta en disco o como bytes ya descargados
+FuentePDF = Union[str, bytes]
+
+
+def _abrir(fuente: FuentePDF) -> IO[bytes]:
+    if isinstance(fuente, (bytes, bytearray, memoryview)):
+        return io.BytesIO(fuente)
+    return open(fuente, "rb")
+
+
+def nombre_fuente(fuente: FuentePDF) -> str:
+    if isinstance(fuente, str):
+        return os.path.basename(fuente)
+    return f"<{len(fuente)} bytes en memoria>"
+
+
+# ----------------------------------------------------------------------
+# Funciones que corren dentro de los procesos del pool
+# ----------------------------------------------------------------------
+def _texto_pagina(reader: PdfReader, i: int) -> str:
+    try:
+        return reader.pages[i].extract_text() or ""
+    except Exception:
+        return ""
+
+
+def iterar_texto_paginas(fuente: FuentePDF, inicio: int = 0,
+                         fin: Optional[int] = None) -> Iterator[str]:
+    """
+    Entrega el texto de las páginas [inicio, fin) de un PDF, una por una
+    (sin ir concatenando un string que crece con cada página).
+    """
+    with _abrir(fuente) as f:
+        reader = PdfReader(f)
+        total = len(reader.pages)
+        fin = total if fin is None else min(fin, total)
+        for i in range(inicio, fin):
+            yield _texto_pagina(reader, i)
+
+
+def _extraer_rango(fuente: FuentePDF, inicio: int, fin: Optional[int]) -> List[str]:
+    """
+    Texto de las páginas [inicio, fin) de un PDF (corre dentro del pool).
+    """
+    return list(iterar_texto_paginas(fuente, inicio, fin))
+
+
+def _contar_y_extraer(fuente: FuentePDF, fin: int) -> Tuple[int, List[str]]:
+    """
+    Primera tarea de cada PDF: cuenta sus páginas y extrae las [0, fin).
+    Contar también es leer el PDF, así que corre en el pool y con timeout.
+    """
+    with _abrir(fuente) as f:
+        reader = PdfReader(f)
+        total = len(reader.pages)
+        return total, [_texto_pagina(reader, i) for i in range(min(fin, total))]
+
+
+# Cola para avisar al proceso padre qué tarea empieza cada proceso del pool
+_avisos = None
+
+
+def _iniciar_proceso(avisos):
+    global _avisos
+    _avisos = avisos
+
+
+def _ejecutar(tarea_id: int, funcion, *args):
+    """
+    Envoltorio de cada tarea del pool: avisa que empezó (y en qué proceso)
+    antes de correrla.
+    """
+    _avisos.put((tarea_id, os.getpid()))
+    return funcion(*args)
+
+
+# ----------------------------------------------------------------------
+# Pool
+# ----------------------------------------------------------------------
+class ExtractorPDF:
+    """
+    Pool de procesos para extraer texto de PDFs.
+
+    Uso:
+        handle = extractor.enviar(ruta)          # no bloquea
+        resultado = extractor.resultado(handle)  # espera con timeout
+    """
+
+    def __init__(self, procesos: int = PDF_PROCESOS,
+                 max_paginas: int = PDF_MAX_PAGINAS,
+                 timeout: float = PDF_TIMEOUT,
+                 paginas_por_tarea: int = PDF_PAGINAS_POR_TAREA):
+        self.procesos = max(1, procesos)
+        self.max_paginas = max_paginas
+        self.timeout = timeout
+        self.paginas_por_tarea = max(1, paginas_por_tarea)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.RLock()
+        # Cola por la que los procesos avisan qué tarea empiezan (ver `_ejecutar`)
+        self._avisos = None
+        # Tareas enviadas que todavía no terminaron, por id
+        self._tareas: Dict[int, dict] = {}
+        self._ids = itertools.count()
+        # Tareas vencidas que siguen corriendo (no se pueden cancelar)
+        self._colgados: List[dict] = []
+
+    def _obtener_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                contexto = multiprocessing.get_context(PDF_CONTEXTO)
+                if self._pid != os.getpid():
+                    self._pool = None
+                    self._tareas = {}
+                    self._colgados = []
+                    self._avisos = contexto.Queue()
+                    self._pid = os.getpid()
+                    threading.Thread(target=self._escuchar_avisos, args=(self._avisos,),
+                                     daemon=True, name="pdf-avisos").start()
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.procesos,
+                        mp_context=contexto,
+                        initializer=_iniciar_proceso,
+                        initargs=(self._avisos,),
+                    )
+        return self._pool
+
+    def _escuchar_avisos(self, avisos):
+        """
+        Anota cuándo empieza cada tarea y en qué proceso: el timeout corre desde
+        ahí y, si la tarea se cuelga, se sabe qué proceso matar.
+        """
+        while True:
+            try:
+                tarea_id, pid = avisos.get()
+            except (EOFError, OSError):
+                return
+            tarea = self._tareas.get(tarea_id)
+            if tarea is not None and tarea["inicio"] is None:
+                tarea["pid"] = pid
+                tarea["inicio"] = time.monotonic()
+
+    def _enviar_tarea(self, funcion, *args) -> dict:
+        tarea = {"id": next(self._ids), "args": (funcion,) + args,
+                 "inicio": None, "pid": None}
+        with self._lock:
+            self._someter(tarea)
+        return tarea
+
+    def _someter(self, tarea: dict):
+        pool = self._obtener_pool()
+        self._tareas[tarea["id"]] = tarea
+        tarea["pool"] = pool
+        tarea["futuro"] = pool.submit(_ejecutar, tarea["id"], *tarea["args"])
+        tarea["futuro"].add_done_callback(lambda futuro: self._terminada(tarea, futuro))
+
+    def _terminada(self, tarea: dict, futuro):
+        if tarea["futuro"] is futuro:
+            self._tareas.pop(tarea["id"], None)
+
+    def _esperar(self, tarea: dict, timeout: float):
+        """
+        Resultado de una tarea. Mientras espera en la cola del pool no corre el
+        timeout: los `timeout` segundos cuentan desde que un proceso la empieza.
+        """
+        while True:
+            futuro = tarea["futuro"]
+            if tarea["inicio"] is None:
+                espera = 0.5
+            else:
+                espera = tarea["inicio"] + timeout - time.monotonic()
+                if espera <= 0:
+                    raise FuturoTimeout()
+            try:
+                return futuro.result(timeout=espera)
+            except FuturoTimeout:
+                continue
+            except CancelledError:
+                # Cancelada para reenviarla a un pool nuevo (ver `_abandonar`)
+                with self._lock:
+                    if tarea["futuro"] is futuro:
+                        raise
+            except Exception:
+                if tarea["futuro"] is futuro:
+                    raise
+
+    def _abandonar(self, tareas: List[dict]):
+        """
+        Cancela las tareas de un PDF que superó el timeout sin tocar las de los
+        demás. Las que ya están corriendo no se pueden cancelar y siguen ocupando
+        su proceso; si todos los procesos quedan así se cambia a un pool nuevo,
+        se le reenvían las tareas que esperaban en la cola del viejo y los
+        procesos colgados se matan cuando acaban las tareas sanas del viejo.
+        """
+        with self._lock:
+            for tarea in tareas:
+                if not tarea["futuro"].cancel() and not tarea["futuro"].done():
+                    self._colgados.append(tarea)
+            # Solo cuentan las que un proceso empezó: las demás esperan en la cola interna del pool
+            self._colgados = [t for t in self._colgados
+                              if t["inicio"] is not None and not t["futuro"].done()]
+            if len(self._colgados) < self.procesos or self._pool is None:
+                return
+            viejo, colgados = self._pool, self._colgados
+            self._pool = None
+            self._colgados = []
+            for tarea in list(self._tareas.values()):
+                if tarea["pool"] is viejo and tarea["inicio"] is None:
+                    # Aunque el pool la dé por empezada (ya pasó a su cola interna)
+                    # no va a correr: se reenvía con otro id y se ignora la copia vieja
+                    tarea["futuro"].cancel()
+                    self._tareas.pop(tarea["id"], None)
+                    tarea["id"] = next(self._ids)
+                    self._someter(tarea)
+        print(f"[PDF] {self.procesos} procesos ocupados con PDFs vencidos; se crea un pool nuevo")
+        threading.Thread(target=self._retirar_pool, args=(viejo, colgados),
+                         daemon=True, name="pdf-retiro").start()
+
+    def _retirar_pool(self, pool: ProcessPoolExecutor, colgados: List[dict]):
+        """
+        Espera a que terminen las tareas no vencidas de un pool reemplazado,
+        lo cierra y mata los procesos que siguen con tareas colgadas.
+        """
+        ids_colgados = {t["id"] for t in colgados}
+        esperar([t["futuro"] for t in list(self._tareas.values())
+                 if t["pool"] is pool and t["id"] not in ids_colgados])
+        pool.shutdown(wait=False, cancel_futures=True)
+        for tarea in colgados:
+            if tarea["pid"] and not tarea["futuro"].done():
+                try:
+                    os.kill(tarea["pid"], signal.SIGTERM)
+                except OSError:
+                    pass
+        print(f"[PDF] Pool anterior cerrado ({len(colgados)} tareas colgadas terminadas)")
+
+    def cerrar(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+
+    def enviar(self, fuente: FuentePDF, max_paginas: Optional[int] = None) -> dict:
+        """
+        Manda un PDF (ruta o bytes) al pool sin bloquear. La primera tarea cuenta
+        las páginas y extrae las primeras `paginas_por_tarea`; el resto del PDF
+        se reparte en rangos que se extraen en paralelo (ver `_avanzar`).
+        """
+        limite = self.max_paginas if max_paginas is None else max_paginas
+        primero = min(limite, self.paginas_por_tarea) if limite else self.paginas_por_tarea
+        return {
+            "ruta": nombre_fuente(fuente),
+            "fuente": fuente,
+            "limite": limite,
+            "inicio": self._enviar_tarea(_contar_y_extraer, fuente, primero),
+            "resto": None,
+            "error": None,
+        }
+
+    def _avanzar(self, handle: dict, esperar: bool = False, timeout: Optional[float] = None):
+        """
+        Cuando la primera tarea de un PDF termina (ya se sabe cuántas páginas
+        tiene) manda los rangos restantes. Sin `esperar` solo lo hace si ya
+        terminó, para repartir PDFs grandes mientras se siguen enviando otros.
+        """
+        if handle["resto"] is not None:
+            return
+        futuro = handle["inicio"]["futuro"]
+        if not esperar and (not futuro.done() or futuro.cancelled()
+                            or futuro.exception() is not None):
+            return
+        total, paginas = self._esperar(handle["inicio"], self.timeout if timeout is None else timeout)
+        handle["num_paginas"] = total
+        handle["paginas"] = paginas
+        limite = handle["limite"]
+        hasta = min(total, limite) if limite else total
+        rangos = range(len(paginas), hasta, self.paginas_por_tarea)
+        fuente = handle["fuente"]
+        handle["fuente"] = None
+        if rangos and not isinstance(fuente, str):
+            # Un PDF en memoria se escribe una vez a disco: así cada rango recibe
+            # la ruta y no una copia serializada de todos los bytes
+            fd, ruta = tempfile.mkstemp(suffix=".pdf")
+            with os.fdopen(fd, "wb") as f:
+                f.write(fuente)
+            fuente = handle["temporal"] = ruta
+        handle["resto"] = [
+            self._enviar_tarea(_extraer_rango, fuente, inicio,
+                               min(inicio + self.paginas_por_tarea, hasta))
+            for inicio in rangos
+        ]
+
+    def resultado(self, handle: dict, timeout: Optional[float] = None) -> dict:
+        """
+        Espera la extracción de un PDF enviado con `enviar`. Cada tarea tiene
+        `timeout` segundos desde que un proceso del pool la empieza; si una se
+        pasa se descarta solo este PDF.
+        Devuelve {"ruta", "paginas": [texto por página], "num_paginas", "error"}.
+        """
+        res = {"ruta": handle["ruta"], "paginas": [], "num_paginas": 0, "error": handle["error"]}
+        if res["error"]:
+            return res
+
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            self._avanzar(handle, esperar=True, timeout=timeout)
+            paginas = handle["paginas"]
+            for tarea in handle["resto"]:
+                paginas.extend(self._esperar(tarea, timeout))
+            res["paginas"] = paginas
+            res["num_paginas"] = handle["num_paginas"]
+        except FuturoTimeout:
+            res["error"] = f"Tiempo máximo de extracción superado ({timeout}s)"
+            self._abandonar([handle["inicio"]] + (handle["resto"] or []))
+        except Exception as e:
+            res["error"] = f"PDF ilegible: {e}" if handle["resto"] is None else f"Error extrayendo texto: {e}"
+        finally:
+            if handle.get("temporal"):
+                try:
+                    os.remove(handle.pop("temporal"))
+                except OSError:
+                    pass
+        return res
+
+    def extraer(self, fuente: FuentePDF, max_paginas: Optional[int] = None) -> dict:
+        return self.resultado(self.enviar(fuente, max_paginas))
+
+    def extraer_varios(self, fuentes: Iterable[Tuple[FuentePDF, dict]],
+                       max_paginas: Optional[int] = None,
+                       en_vuelo: Optional[int] = None) -> Iterator[Tuple[dict, dict]]:
+        """
+        Extrae muchos PDFs manteniendo el pool ocupado pero sin encolar todo de
+        una vez (como mucho `en_vuelo` PDFs pendientes). `fuentes` entrega
+        (ruta o bytes, metadatos) y puede ser un generador (p. ej. descargas que van
+        terminando); se entrega (metadatos, resultado) en el mismo orden.
+        """
+        en_vuelo = en_vuelo or self.procesos * 2
+        pendientes: deque = deque()
+        for fuente, meta in fuentes:
+            pendientes.append((meta, self.enviar(fuente, max_paginas)))
+            for _, handle in pendientes:
+                self._avanzar(handle)
+            if len(pendientes) >= en_vuelo:
+                meta_listo, handle = pendientes.popleft()
+                yield meta_listo, self.resultado(handle)
+        while pendientes:
+            meta_listo, handle = pendientes.popleft()
+            yield meta_listo, self.resultado(handle)
+
+
+_extractor: Optional[ExtractorPDF] = None
+
+
+def extractor_global() -> ExtractorPDF:
+    """
+    Extractor compartido por el proceso (el pool se crea la primera vez que se usa).
+    """
+    global _extractor
+    if _extractor is None:
+        _extractor = ExtractorPDF()
+    return _extractor
+
+
+def documentos_desde_pdfs(fuentes: Iterable[Tuple[FuentePDF, dict]],
+                          extractor: Optional[ExtractorPDF] = None,
+                          max_paginas: Optional[int] = None,
+                          al_fallar: Optional[Callable[[dict, str], None]] = None,
+                          con_paginas: bool = False) -> Iterator[dict]:
+    """
+    Convierte (ruta o bytes del PDF, metadatos) en documentos para Elastic: los metadatos
+    más `contenido` y `num_paginas`. Los PDFs sin texto o con error se omiten
+    (y se avisa a `al_fallar`). Con `con_paginas` se agrega también la lista
+    `paginas` (texto por página) para partirla en pasajes (pasajes.py).
+    """
+    extractor = extractor or extractor_global()
+    for meta, res in extractor.extraer_varios(fuentes, max_paginas=max_paginas):
+        nombre = meta.get("titulo") or res["ruta"]
+        if res["error"]:
+            print(f"[PDF] Error leyendo PDF {nombre}: {res['error']}")
+            if al_fallar:
+                al_fallar(meta, res["error"])
+            continue
+
+        texto = "\n".join(res["paginas"]).strip()
+        if not texto:
+            print(f"[PDF] PDF sin texto legible: {nombre}")
+            if al_fallar:
+                al_fallar(meta, "sin texto")
+            continue
+
+        doc: Dict = dict(meta)
+        doc["contenido"] = texto
+        doc["num_paginas"] = res["num_paginas"]
+        if con_paginas:
+            doc["paginas"] = res["paginas"]
+        yield doc
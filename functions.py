@@ -11,8 +11,21 @@ import sqlite3
 from datetime import datetime
 from pathlib import Path
 from tqdm import tqdm
-import io
 import zipfile
+from urllib.parse import urlparse
+import hashlib
+import time
+from contextlib import contextmanager
+try:
+    import resource  # solo Unix: pico de memoria del proceso
+except ImportError:
+    resource = None
+
+# Filas por bloque al leer CSV grandes y carpeta de la caché Parquet
+CSV_CHUNK_FILAS = int(os.getenv("CSV_CHUNK_FILAS", "200000"))
+CSV_CACHE_DIR = os.getenv("CSV_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "csv_parquet"))
+# Columnas de texto con menos de esta fracción de valores distintos quedan como category
+CSV_MAX_FRACCION_CATEGORIA = 0.5
 
 class funciones:
     def __init__(self):
@@ -30,8 +43,11 @@ class funciones:
             print(f"Error al crear carpeta: {e}")
     
     """ Esta funcion revisa el contenido de una tabla en una base de datos SQLite y muestra un  numero limitado de registros."""
-    def revisar_contenido_de_una_tabla(db_path, tabla_nombre, whereColumna='',whereValor='', limit=10, order_by_columna=None, order_asc=True):
-        conn=sqlite3.connect(db_path)
+    def revisar_contenido_de_una_tabla(db_path, tabla_nombre, whereColumna='',whereValor='', limit=10, order_by_columna=None, order_asc=True, conn=None):
+        # Con conn se reutiliza una conexión abierta (p. ej. la de conectar_sqlite_bulk)
+        propia = conn is None
+        if propia:
+            conn=sqlite3.connect(db_path)
         cursor=conn.cursor()
         cursor.execute("SELECT COUNT(*) FROM "+tabla_nombre)
         total_registros=cursor.fetchone()[0]
@@ -50,44 +66,539 @@ class funciones:
         resultados=cursor.fetchall()
         for fila in resultados:
             print(fila)
-        conn.close()
+        if propia:
+            conn.close()
 
-    """ Esta funcion carga un archivo CSV en un DataFrame de pandas, asignando nombres de columnas especificados y manejando errores."""
-    def cargar_data_desde_archivo_csv(ruta_archivo,columnas_nombre,pd):
+    """ Esta funcion carga un archivo CSV en un DataFrame de pandas, asignando nombres de columnas especificados y manejando errores.
+        Lee por bloques (chunksize) con tipos compactos (categorías, enteros reducidos) y guarda una
+        caché Parquet por hash del archivo: la segunda carga del mismo archivo no vuelve a parsear.
+        `pd` está obsoleto y se ignora (pandas se importa en leer_csv_compacto); se deja solo
+        para no romper las llamadas que todavía lo pasan."""
+    def cargar_data_desde_archivo_csv(ruta_archivo,columnas_nombre,pd=None,dtypes=None,chunksize=None,
+                                      carpeta_cache=None,usar_cache=True):
         try:
-            df_temporal = pd.read_csv(ruta_archivo,sep=';',header=None,encoding='latin-1',on_bad_lines='skip')
-            #agregarle nombre de columnas al df creado
-            df_temporal.columns=columnas_nombre
-            if (len(df_temporal.columns)==len(columnas_nombre)):
-                print(f" archivo {os.path.basename(ruta_archivo)} cargada exitosamente")
-                return df_temporal
-            else:
-                print(f"archivo no trabajado {os.path.basename(ruta_archivo)} no tiene 10 columnas")
+            df_temporal, stats = leer_csv_compacto(
+                ruta_archivo, columnas_nombre, dtypes=dtypes, chunksize=chunksize,
+                carpeta_cache=carpeta_cache, usar_cache=usar_cache,
+            )
+            if df_temporal is None:
+                print(f"archivo no trabajado {os.path.basename(ruta_archivo)} no tiene {len(columnas_nombre)} columnas")
                 return None
+            print(f" archivo {os.path.basename(ruta_archivo)} cargada exitosamente {_texto_stats(stats)}")
+            return df_temporal
 
         except Exception as e:
             print(f"Error al procesar el archivo {os.path.basename(ruta_archivo)}: {str(e)}")
             return None
+
+    """ Carga muchos CSV con el mismo formato en un pool de procesos (cada archivo en su proceso)
+        y los une en un solo DataFrame conservando los tipos compactos."""
+    def cargar_data_desde_archivos_csv(rutas_archivos,columnas_nombre,dtypes=None,procesos=None,
+                                       chunksize=None,carpeta_cache=None,usar_cache=True):
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        inicio = time.perf_counter()
+        dfs = {}
+        total_filas = 0
+        with ProcessPoolExecutor(max_workers=procesos) as executor:
+            futuros = {
+                executor.submit(leer_csv_compacto, ruta, columnas_nombre, dtypes, chunksize,
+                                carpeta_cache, usar_cache): ruta
+                for ruta in rutas_archivos
+            }
+            for futuro in tqdm(as_completed(futuros), total=len(futuros), desc='Cargando CSV'):
+                ruta = futuros[futuro]
+                try:
+                    df, stats = futuro.result()
+                except Exception as e:
+                    print(f"Error al procesar el archivo {os.path.basename(ruta)}: {str(e)}")
+                    continue
+                if df is None:
+                    print(f"archivo no trabajado {os.path.basename(ruta)} no tiene {len(columnas_nombre)} columnas")
+                    continue
+                print(f" archivo {os.path.basename(ruta)} {_texto_stats(stats)}")
+                total_filas += len(df)
+                dfs[ruta] = df
+        if not dfs:
+            return None
+        # Se une en el orden de entrada, no en el de llegada
+        df_total = concatenar_compacto([dfs[r] for r in rutas_archivos if r in dfs])
+        segundos = time.perf_counter() - inicio
+        print(f"Total: {total_filas} filas de {len(dfs)} archivos en {segundos:.1f}s "
+              f"({total_filas / max(segundos, 1e-9):,.0f} filas/s), "
+              f"{df_total.memory_usage(deep=True).sum() / 2**20:.1f} MB en memoria")
+        return df_total
     
-    def descomprimir_zip_local(self,ruta_file_zip, ruta_descomprimir):
+    """ Carga el esquema estrella de la BDUA (Departamento, Sisben, Eps, Municipio, Detalle) en SQLite
+        por lotes: executemany en una sola transacción y llaves foráneas resueltas con merge de pandas."""
+    def cargar_bdua_sqlite(df, db_path, regimen="Contributivo", tamano_lote=None):
+        return cargar_bdua_sqlite(df, db_path, regimen=regimen, tamano_lote=tamano_lote)
+
+    def descomprimir_zip_local(self,ruta_file_zip, ruta_descomprimir, tipoArchivo='', hilos=None):
       self.crear_carpeta(ruta_descomprimir)
-      with zipfile.ZipFile(ruta_file_zip,'r') as zip_ref:
-        total_files =len(zip_ref.namelist())
-        with tqdm (total=total_files,desc='Descomprimiendo') as pbar:
-          for member in zip_ref.infolist():
-            zip_ref.extract(member,ruta_descomprimir)
-            pbar.update(1)
-
-
-    def descargar_y_descomprimir_zip(url, carpeta_destino, tipoArchivo=''):
-        
-        #os.makedirs(carpeta_destino, exist_ok=True)  #cree la carpeta sino existe
-        self.crear_carpeta(carpeta_destino)
-        response = requests.get(url)
-        zip_file = zipfile.ZipFile(io.BytesIO(response.content))
-        if (tipoArchivo == ''):
-            zip_file.extractall(carpeta_destino) #exportar .zip a la carpeta  
-        else:
-            for nombre_archivo in zip_file.namelist():
-                if nombre_archivo.endswith(tipoArchivo):
-                    zip_file.extract(nombre_archivo, carpeta_destino)
+      return extraer_zip_en_paralelo(ruta_file_zip, ruta_descomprimir, tipoArchivo, hilos)
+
+    """ Descarga el .zip por bloques a un archivo (reanudable si se corta) y lo extrae en paralelo.
+        Con extraer=False solo descarga y devuelve la ruta del .zip para leerlo con iterar_miembros_zip."""
+    def descargar_y_descomprimir_zip(url, carpeta_destino, tipoArchivo='', hilos=None, extraer=True, conservar_zip=False):
+        os.makedirs(carpeta_destino, exist_ok=True)  #cree la carpeta sino existe
+        ruta_zip = descargar_a_archivo(url, os.path.join(carpeta_destino, _nombre_zip(url)))
+        if not extraer:
+            return ruta_zip
+        extraidos = extraer_zip_en_paralelo(ruta_zip, carpeta_destino, tipoArchivo, hilos)
+        if not conservar_zip:
+            os.remove(ruta_zip)
+        return extraidos
+
+
+# ================== CARGA DE CSV COMPACTA ==================
+# Funciones de módulo (no métodos) para poder mandarlas a un pool de procesos.
+
+def _pico_memoria_mb():
+    if resource is None:
+        return None
+    # ru_maxrss viene en KB en Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _texto_stats(stats):
+    texto = f"({stats['filas']} filas en {stats['segundos']:.1f}s, {stats['filas_por_segundo']:,.0f} filas/s"
+    if stats.get("pico_memoria_mb") is not None:
+        texto += f", pico {stats['pico_memoria_mb']:.0f} MB"
+    if stats.get("desde_cache"):
+        texto += ", desde caché"
+    return texto + ")"
+
+
+def _hash_archivo(ruta, extra=""):
+    """Hash del contenido del archivo (+ parámetros de lectura) para la caché."""
+    h = hashlib.sha256(extra.encode("utf-8"))
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def compactar_tipos(df):
+    """Reduce enteros/decimales al tipo más pequeño y pasa a category los textos repetidos."""
+    import pandas as pd
+    for columna in df.columns:
+        serie = df[columna]
+        if pd.api.types.is_integer_dtype(serie):
+            df[columna] = pd.to_numeric(serie, downcast="integer")
+        elif pd.api.types.is_float_dtype(serie):
+            df[columna] = pd.to_numeric(serie, downcast="float")
+        elif pd.api.types.is_object_dtype(serie) or pd.api.types.is_string_dtype(serie):
+            # Textos casi únicos ocuparían más como category (códigos + categorías)
+            if len(serie) and serie.nunique() < CSV_MAX_FRACCION_CATEGORIA * len(serie):
+                df[columna] = serie.astype("category")
+    return df
+
+
+def concatenar_compacto(dfs):
+    """Une DataFrames compactos sin perder las categorías (union_categoricals)."""
+    import pandas as pd
+    from pandas.api.types import union_categoricals
+    if len(dfs) == 1:
+        resultado = dfs[0]
+    else:
+        columnas = {}
+        for columna in dfs[0].columns:
+            partes = [df[columna] for df in dfs]
+            if all(isinstance(p.dtype, pd.CategoricalDtype) for p in partes):
+                columnas[columna] = pd.Series(union_categoricals(partes, ignore_order=True))
+            else:
+                columnas[columna] = pd.concat(
+                    [p.astype(object) if isinstance(p.dtype, pd.CategoricalDtype) else p for p in partes],
+                    ignore_index=True,
+                )
+        resultado = pd.DataFrame(columnas)
+    # Columnas casi únicas (p. ej. número de expediente) no ganan nada como category
+    for columna in resultado.columns:
+        serie = resultado[columna]
+        if isinstance(serie.dtype, pd.CategoricalDtype) and len(serie):
+            if len(serie.cat.categories) > CSV_MAX_FRACCION_CATEGORIA * len(serie):
+                resultado[columna] = serie.astype(object)
+    return resultado
+
+
+def leer_csv_compacto(ruta_archivo, columnas_nombre, dtypes=None, chunksize=None,
+                      carpeta_cache=None, usar_cache=True, sep=';', encoding='latin-1'):
+    """
+    Lee un CSV (sin encabezado, ; y latin-1 como los de datos.gov.co) por bloques.
+    Devuelve (DataFrame o None si no tiene las columnas esperadas, estadísticas).
+    """
+    import pandas as pd
+    inicio = time.perf_counter()
+    chunksize = chunksize or CSV_CHUNK_FILAS
+    carpeta_cache = carpeta_cache or CSV_CACHE_DIR
+
+    ruta_cache = None
+    if usar_cache:
+        clave = _hash_archivo(ruta_archivo, extra=repr((list(columnas_nombre), dtypes, sep, encoding)))
+        ruta_cache = os.path.join(carpeta_cache, clave + ".parquet")
+        if os.path.exists(ruta_cache):
+            df = pd.read_parquet(ruta_cache)
+            return df, _stats(len(df), inicio, desde_cache=True)
+
+    partes = []
+    lector = pd.read_csv(ruta_archivo, sep=sep, header=None, encoding=encoding,
+                         on_bad_lines='skip', chunksize=chunksize, dtype=dtypes,
+                         low_memory=False)
+    for chunk in lector:
+        if chunk.shape[1] != len(columnas_nombre):
+            return None, _stats(0, inicio)
+        chunk.columns = columnas_nombre
+        partes.append(compactar_tipos(chunk))
+
+    df = concatenar_compacto(partes) if partes else pd.DataFrame(columns=columnas_nombre)
+
+    if ruta_cache:
+        try:
+            os.makedirs(carpeta_cache, exist_ok=True)
+            tmp = ruta_cache + f".{os.getpid()}.tmp"
+            df.to_parquet(tmp, index=False)
+            os.replace(tmp, ruta_cache)
+        except ImportError:
+            print("Caché Parquet desactivada: instala pyarrow para usarla")
+        except Exception as e:
+            print(f"No se pudo guardar la caché Parquet de {os.path.basename(ruta_archivo)}: {e}")
+    return df, _stats(len(df), inicio)
+
+
+def _stats(filas, inicio, desde_cache=False):
+    segundos = time.perf_counter() - inicio
+    return {
+        "filas": filas,
+        "segundos": segundos,
+        "filas_por_segundo": filas / max(segundos, 1e-9),
+        "pico_memoria_mb": _pico_memoria_mb(),
+        "desde_cache": desde_cache,
+    }
+
+
+# ================== ETL A SQLITE POR LOTES ==================
+# En vez de un SELECT + INSERT por fila (iterrows), cada tabla se carga con
+# executemany dentro de una transacción y las llaves foráneas se resuelven con
+# un merge de pandas contra las dimensiones ya cargadas.
+
+SQLITE_TAMANO_LOTE = int(os.getenv("SQLITE_TAMANO_LOTE", "50000"))
+
+# Columnas del CSV de la BDUA
+COLUMNAS_DETALLE_BDUA = {
+    'Género': 'Genero',
+    'Grupo etario': 'Grupo_etario',
+    'Tipo de afiliado': 'Tipo_afiliado',
+    'Estado del afiliado': 'Estado_afiliado',
+    'Condición del beneficiario': 'Condicion_beneficiario',
+    'Régimen': 'Regimen',
+    'Zona de Afiliación': 'Zona_afiliacion',
+    'Cantidad de registros': 'Cantidad_registros',
+}
+
+ESQUEMA_BDUA = [
+    """CREATE TABLE IF NOT EXISTS Departamento (
+        Id_Departamento INTEGER PRIMARY KEY AUTOINCREMENT,
+        Nombre_Departamento TEXT UNIQUE NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS Sisben (
+        Id_Sisben INTEGER PRIMARY KEY AUTOINCREMENT,
+        Nombre_Sisben TEXT UNIQUE NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS Eps (
+        codigo_Eps TEXT PRIMARY KEY,
+        Nombre_Eps TEXT UNIQUE NOT NULL,
+        regimen TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS Municipio (
+        Id_Municipio INTEGER PRIMARY KEY AUTOINCREMENT,
+        Nombre_Municipio TEXT NOT NULL,
+        Id_Departamento INTEGER,
+        FOREIGN KEY (Id_Departamento) REFERENCES Departamento(Id_Departamento),
+        UNIQUE (Nombre_Municipio, Id_Departamento)
+    )""",
+    """CREATE TABLE IF NOT EXISTS Detalle (
+        Id_Detalle INTEGER PRIMARY KEY AUTOINCREMENT,
+        Id_Municipio INTEGER,
+        Id_Sisben INTEGER,
+        codigo_Eps TEXT,
+        Genero TEXT,
+        Grupo_etario TEXT,
+        Tipo_afiliado TEXT,
+        Estado_afiliado TEXT,
+        Condicion_beneficiario TEXT,
+        Regimen TEXT,
+        Zona_afiliacion TEXT,
+        Cantidad_registros INTEGER,
+        FOREIGN KEY (Id_Municipio) REFERENCES Municipio(Id_Municipio),
+        FOREIGN KEY (Id_Sisben) REFERENCES Sisben(Id_Sisben),
+        FOREIGN KEY (codigo_Eps) REFERENCES Eps(codigo_Eps)
+    )""",
+]
+
+# Se crean al final: mantener índices durante la carga la hace mucho más lenta
+INDICES_BDUA = [
+    "CREATE INDEX IF NOT EXISTS ix_detalle_municipio ON Detalle (Id_Municipio)",
+    "CREATE INDEX IF NOT EXISTS ix_detalle_sisben ON Detalle (Id_Sisben)",
+    "CREATE INDEX IF NOT EXISTS ix_detalle_eps ON Detalle (codigo_Eps)",
+    "CREATE INDEX IF NOT EXISTS ix_municipio_departamento ON Municipio (Id_Departamento)",
+]
+
+
+@contextmanager
+def conectar_sqlite_bulk(db_path):
+    """
+    Conexión para carga masiva: WAL, sin fsync por transacción y caché grande.
+    Confirma al salir (o deshace si hubo error) y cierra la conexión.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-200000")  # ~200 MB
+        conn.execute("PRAGMA foreign_keys=OFF")
+        with conn:
+            yield conn
+        # Vuelve a un modo seguro para quien abra la base después
+        conn.execute("PRAGMA synchronous=NORMAL")
+    finally:
+        conn.close()
+
+
+def _filas_sql(df):
+    """Filas como tuplas para sqlite3: NaN/NA -> NULL y números de numpy -> Python."""
+    objetos = df.astype(object)
+    return list(objetos.where(df.notna(), None).itertuples(index=False, name=None))
+
+
+def insertar_por_lotes(conn, tabla, columnas, df, ignorar_duplicados=False, tamano_lote=None):
+    """Inserta las filas de df (en el orden de columnas) con executemany por lotes."""
+    tamano_lote = tamano_lote or SQLITE_TAMANO_LOTE
+    verbo = "INSERT OR IGNORE" if ignorar_duplicados else "INSERT"
+    sql = f"{verbo} INTO {tabla} ({', '.join(columnas)}) VALUES ({', '.join('?' * len(columnas))})"
+    antes = conn.total_changes
+    for inicio in range(0, len(df), tamano_lote):
+        bloque = df.iloc[inicio:inicio + tamano_lote]
+        conn.executemany(sql, _filas_sql(bloque))
+    return conn.total_changes - antes
+
+
+def _leer_tabla(conn, sql):
+    import pandas as pd
+    cursor = conn.execute(sql)
+    return pd.DataFrame(cursor.fetchall(), columns=[c[0] for c in cursor.description])
+
+
+def cargar_bdua_sqlite(df, db_path, regimen="Contributivo", tamano_lote=None):
+    """
+    Carga un DataFrame de la BDUA al esquema estrella. Devuelve cuántas filas
+    se crearon por tabla. Puede llamarse varias veces (una por archivo): las
+    dimensiones usan INSERT OR IGNORE y se releen antes de resolver llaves.
+    """
+    inicio = time.perf_counter()
+    creados = {}
+    with conectar_sqlite_bulk(db_path) as conn:
+        for ddl in ESQUEMA_BDUA:
+            conn.execute(ddl)
+
+        # ---- dimensiones simples
+        departamentos = df[['Departamento']].dropna().drop_duplicates()
+        creados['Departamento'] = insertar_por_lotes(
+            conn, 'Departamento', ['Nombre_Departamento'], departamentos, True, tamano_lote)
+        sisben = df[['Nivel del Sisbén']].dropna().drop_duplicates()
+        creados['Sisben'] = insertar_por_lotes(
+            conn, 'Sisben', ['Nombre_Sisben'], sisben, True, tamano_lote)
+        eps = df[['Código de la entidad', 'Nombre de la entidad']].dropna().drop_duplicates()
+        eps = eps.assign(regimen=regimen)
+        creados['Eps'] = insertar_por_lotes(
+            conn, 'Eps', ['codigo_Eps', 'Nombre_Eps', 'regimen'], eps, True, tamano_lote)
+
+        # ---- Municipio: id del departamento con un merge
+        mapa_dptos = _leer_tabla(conn, "SELECT Id_Departamento, Nombre_Departamento FROM Departamento")
+        municipios = (df[['Municipio', 'Departamento']].dropna().drop_duplicates()
+                      .merge(mapa_dptos, left_on='Departamento', right_on='Nombre_Departamento'))
+        creados['Municipio'] = insertar_por_lotes(
+            conn, 'Municipio', ['Nombre_Municipio', 'Id_Departamento'],
+            municipios[['Municipio', 'Id_Departamento']], True, tamano_lote)
+
+        # ---- Detalle: municipio y sisben resueltos con merges
+        mapa_municipios = _leer_tabla(
+            conn,
+            "SELECT m.Id_Municipio, m.Nombre_Municipio, d.Nombre_Departamento "
+            "FROM Municipio m JOIN Departamento d ON d.Id_Departamento = m.Id_Departamento")
+        mapa_sisben = _leer_tabla(conn, "SELECT Id_Sisben, Nombre_Sisben FROM Sisben")
+        detalle = (df.merge(mapa_municipios, how='left',
+                            left_on=['Municipio', 'Departamento'],
+                            right_on=['Nombre_Municipio', 'Nombre_Departamento'])
+                     .merge(mapa_sisben, how='left',
+                            left_on='Nivel del Sisbén', right_on='Nombre_Sisben'))
+        sin_municipio = int(detalle['Id_Municipio'].isna().sum())
+        if sin_municipio:
+            print(f"ERRROR: {sin_municipio} registros con municipio/departamento no encontrado")
+        # Como en la carga original, sin nivel de Sisbén queda 0
+        detalle['Id_Sisben'] = detalle['Id_Sisben'].fillna(0).astype('int64')
+        detalle = detalle.rename(columns={'Código de la entidad': 'codigo_Eps', **COLUMNAS_DETALLE_BDUA})
+        columnas = ['Id_Municipio', 'Id_Sisben', 'codigo_Eps', *COLUMNAS_DETALLE_BDUA.values()]
+        creados['Detalle'] = insertar_por_lotes(
+            conn, 'Detalle', columnas, detalle[columnas], False, tamano_lote)
+
+        for ddl in INDICES_BDUA:
+            conn.execute(ddl)
+        conn.execute("ANALYZE")
+
+    segundos = time.perf_counter() - inicio
+    print(f"BDUA cargada en {segundos:.1f}s: " + ", ".join(f"{t}={n}" for t, n in creados.items()))
+    return creados
+
+
+# ================== DESCARGA Y EXTRACCIÓN DE ZIP ==================
+# Los .zip de datos abiertos pesan varios GB: se descargan por bloques a disco
+# (nunca completos en memoria) y se extraen con varios hilos.
+
+ZIP_BLOQUE_DESCARGA = 1024 * 1024
+ZIP_REINTENTOS = int(os.getenv("ZIP_REINTENTOS", "3"))
+ZIP_HILOS = int(os.getenv("ZIP_HILOS", str(min(8, (os.cpu_count() or 2) * 2))))
+
+
+def _nombre_zip(url):
+    nombre = os.path.basename(urlparse(url).path)
+    if not nombre:
+        nombre = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+    return nombre if nombre.lower().endswith(".zip") else nombre + ".zip"
+
+
+def _validador_descarga(response):
+    """ETag fuerte o Last-Modified: los validadores que acepta If-Range."""
+    etag = response.headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("Last-Modified")
+
+
+def _leer_validador(ruta):
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _guardar_validador(ruta, validador):
+    if validador:
+        with open(ruta, "w", encoding="utf-8") as f:
+            f.write(validador)
+    elif os.path.exists(ruta):
+        os.remove(ruta)
+
+
+def descargar_a_archivo(url, ruta_destino, reintentos=None, timeout=60):
+    """
+    Descarga url a ruta_destino por bloques. Mientras baja se escribe en
+    `<ruta>.part`; si la descarga se corta, el siguiente intento (o la próxima
+    llamada) continúa desde donde quedó con Range + If-Range (el ETag o
+    Last-Modified guardado junto al .part). Si el archivo cambió en el servidor,
+    o no hay validador para comprobarlo, se empieza de cero.
+    """
+    reintentos = ZIP_REINTENTOS if reintentos is None else reintentos
+    if os.path.exists(ruta_destino):
+        return ruta_destino
+    parcial = ruta_destino + ".part"
+    ruta_validador = parcial + ".validador"
+    intento = 0
+    while True:
+        ya_descargado = os.path.getsize(parcial) if os.path.exists(parcial) else 0
+        validador = _leer_validador(ruta_validador) if ya_descargado else None
+        headers = {}
+        if ya_descargado and validador:
+            headers = {"Range": f"bytes={ya_descargado}-", "If-Range": validador}
+        try:
+            with requests.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                if response.status_code == 416:
+                    # Solo si el servidor confirma el mismo tamaño (y versión) el .part está completo
+                    tamano_remoto = response.headers.get("Content-Range", "").rpartition("/")[2]
+                    if (tamano_remoto == str(ya_descargado)
+                            and (_validador_descarga(response) or validador) == validador):
+                        break
+                    print("El archivo cambió en el servidor, se descarga de nuevo")
+                    os.remove(parcial)
+                    continue
+                response.raise_for_status()
+                # 206 desde donde se pidió: se continúa. 200: el archivo cambió (If-Range)
+                # o el servidor no soporta Range, y se empieza de cero
+                reanuda = response.status_code == 206
+                if reanuda and not response.headers.get("Content-Range", "").startswith(
+                        f"bytes {ya_descargado}-"):
+                    os.remove(parcial)
+                    continue
+                modo = "ab" if reanuda else "wb"
+                if not reanuda:
+                    _guardar_validador(ruta_validador, _validador_descarga(response))
+                total = int(response.headers.get("Content-Length", 0)) or None
+                inicial = ya_descargado if reanuda else 0
+                with open(parcial, modo) as f, tqdm(total=total and total + inicial, initial=inicial,
+                                                    unit="B", unit_scale=True,
+                                                    desc=os.path.basename(ruta_destino)) as pbar:
+                    for bloque in response.iter_content(chunk_size=ZIP_BLOQUE_DESCARGA):
+                        f.write(bloque)
+                        pbar.update(len(bloque))
+            break
+        except requests.RequestException as e:
+            if intento == reintentos:
+                raise
+            intento += 1
+            print(f"Descarga interrumpida ({e}), reintentando {intento}/{reintentos}")
+            time.sleep(2 ** (intento - 1))
+    os.replace(parcial, ruta_destino)
+    _guardar_validador(ruta_validador, None)
+    return ruta_destino
+
+
+def _miembros_zip(zip_ref, tipoArchivo=''):
+    return [m for m in zip_ref.infolist()
+            if not m.is_dir() and (tipoArchivo == '' or m.filename.endswith(tipoArchivo))]
+
+
+def extraer_zip_en_paralelo(ruta_zip, carpeta_destino, tipoArchivo='', hilos=None):
+    """
+    Extrae los miembros (filtrados por extensión) con varios hilos. Cada hilo
+    abre su propio ZipFile: un mismo handle no se puede leer en paralelo.
+    La descompresión de zlib libera el GIL, así que los hilos sí se reparten.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    import threading
+    with zipfile.ZipFile(ruta_zip, 'r') as zip_ref:
+        miembros = [m.filename for m in _miembros_zip(zip_ref, tipoArchivo)]
+
+    locales = threading.local()
+    abiertos = []
+
+    def extraer(nombre):
+        if not hasattr(locales, "zip_ref"):
+            locales.zip_ref = zipfile.ZipFile(ruta_zip, 'r')
+            abiertos.append(locales.zip_ref)
+        # extract() limpia rutas absolutas y '..'
+        return locales.zip_ref.extract(nombre, carpeta_destino)
+
+    try:
+        with ThreadPoolExecutor(max_workers=hilos or ZIP_HILOS) as executor, \
+                tqdm(total=len(miembros), desc='Descomprimiendo') as pbar:
+            extraidos = []
+            for ruta in executor.map(extraer, miembros):
+                extraidos.append(ruta)
+                pbar.update(1)
+    finally:
+        for zip_ref in abiertos:
+            zip_ref.close()
+    return extraidos
+
+
+def iterar_miembros_zip(ruta_zip, tipoArchivo=''):
+    """
+    Recorre los miembros del .zip sin extraerlos: entrega (nombre, archivo
+    binario abierto) para leerlo directo, p. ej. pd.read_csv(archivo, sep=';')
+    o json.load(archivo). El archivo solo es válido dentro de la iteración.
+    """
+    with zipfile.ZipFile(ruta_zip, 'r') as zip_ref:
+        for miembro in _miembros_zip(zip_ref, tipoArchivo):
+            with zip_ref.open(miembro) as archivo:
+                yield miembro.filename, archivo
@@ -0,0 +1,50 @@
+# gunicorn.conf.py
+"""
+Perfil de producción:  gunicorn -c gunicorn.conf.py app:app
+
+La app pasa casi todo el tiempo esperando a Elastic y Mongo (I/O), así que se
+usan pocos procesos con varios hilos cada uno (gthread) en vez de muchos
+procesos: cada proceso carga pandas/numpy y la matriz de similares, y los
+hilos comparten esa memoria. Con preload la app se importa una sola vez en el
+master (sin abrir conexiones: ver "INICIALIZAR CONEXIONES" en app.py) y los
+workers comparten esas páginas por copy-on-write.
+
+Todo se puede ajustar por variables de entorno.
+"""
+import multiprocessing
+import os
+import time
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:" + os.getenv("PORT", "8000"))
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(multiprocessing.cpu_count() + 1, 8))))
+# ELASTIC_MAX_CONCURRENTES (limites.py, 6 por defecto) debe quedar por debajo
+# de los hilos para que sobren hilos que respondan 429 en vez de encolar
+threads = int(os.getenv("GUNICORN_HILOS", "8"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+# Búsquedas lentas de Elastic o cargas grandes (que igual corren en el pool de trabajos)
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+# Reciclar workers de a poco: la extracción de PDFs fragmenta la memoria
+max_requests = int(os.getenv("GUNICORN_MAX_PETICIONES", "2000"))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", None)
+errorlog = "-"
+
+
+def on_starting(server):
+    # Histogramas de /metrics de procesos de una ejecución anterior
+    import metricas
+    metricas.registro.limpiar()
+
+
+def post_fork(server, worker):
+    worker.inicio_fork = time.time()
+
+
+def post_worker_init(worker):
+    import app
+    app.iniciar_trabajador(inicio=getattr(worker, "inicio_fork", None))
@@ -0,0 +1,422 @@
+# ingesta.py
+"""
+Lectura incremental de documentos JSON para indexar en Elastic.
+
+En lugar de hacer `json.load` de cada archivo y juntar todo en una lista,
+estas funciones son generadores: leen el archivo (o el miembro del ZIP) por
+bloques y van entregando documento por documento. Así la memoria usada depende
+del tamaño del lote que se manda a Elastic, no del tamaño del archivo subido.
+
+Formatos soportados:
+  - un objeto JSON suelto            {...}
+  - un arreglo JSON de objetos       [{...}, {...}]
+  - NDJSON / JSON Lines              {...}\\n{...}\\n
+"""
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import IO, Dict, Iterable, Iterator, List, Tuple, Union
+from zipfile import ZipFile
+
+from extraccion_pdf import PDF_MEMORIA_MAX
+
+TAMANO_BLOQUE = 64 * 1024
+# Tope de cada lectura extra cuando un valor no cabe en el buffer
+BLOQUE_MAXIMO = 4 * 1024 * 1024
+EXTENSIONES_JSON = (".json", ".ndjson", ".jsonl")
+
+_decoder = json.JSONDecoder()
+_ESPACIOS = " \t\r\n"
+# Caracteres que importan para saber dónde cierra un objeto / arreglo
+_ESTRUCTURA = re.compile(r'["\[\]{}]')
+_EN_CADENA = re.compile(r'[\\"]')
+
+
+class _LectorIncremental:
+    """
+    Buffer de texto que se rellena por bloques a medida que el parser lo pide.
+    """
+
+    def __init__(self, texto: IO[str], tamano_bloque: int = TAMANO_BLOQUE):
+        self.texto = texto
+        self.tamano_bloque = tamano_bloque
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def leer_mas(self, minimo: int = 0) -> bool:
+        """
+        Agrega al menos un bloque al buffer. Devuelve False si ya no hay más datos.
+        """
+        if self.eof:
+            return False
+        # Descartar lo ya consumido para que el buffer no crezca sin límite
+        if self.pos:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        bloque = self.texto.read(max(self.tamano_bloque, minimo))
+        if not bloque:
+            self.eof = True
+            return False
+        self.buffer += bloque
+        return True
+
+    def saltar(self, caracteres: str) -> str:
+        """
+        Avanza sobre `caracteres` y devuelve el siguiente carácter ('' en EOF).
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in caracteres:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.leer_mas():
+                return ""
+
+    def _valor_cerrado(self, escaneo: dict) -> bool:
+        """
+        Indica si el objeto / arreglo que empieza en `pos` ya cerró dentro del
+        buffer. `escaneo` guarda hasta dónde se revisó (relativo a `pos`) para
+        no volver a recorrer lo ya visto en cada reintento.
+        """
+        if self.buffer[self.pos:self.pos + 1] not in ("{", "["):
+            return False
+        i = self.pos + escaneo["i"]
+        fin = len(self.buffer)
+        while True:
+            patron = _EN_CADENA if escaneo["en_cadena"] else _ESTRUCTURA
+            m = patron.search(self.buffer, i)
+            if not m:
+                escaneo["i"] = max(i, fin) - self.pos
+                return False
+            c = m.group()
+            i = m.end()
+            if c == "\\":
+                i += 1  # el carácter escapado no cuenta
+            elif c == '"':
+                escaneo["en_cadena"] = not escaneo["en_cadena"]
+            elif c in "{[":
+                escaneo["profundidad"] += 1
+            else:
+                escaneo["profundidad"] -= 1
+                if escaneo["profundidad"] == 0:
+                    escaneo["i"] = i - self.pos
+                    return True
+
+    def siguiente_valor(self):
+        """
+        Decodifica el siguiente valor JSON completo a partir de la posición actual.
+        Si el valor está cortado a mitad de bloque se leen más datos y se reintenta;
+        el bloque se duplica en cada reintento (hasta `BLOQUE_MAXIMO`) para que un
+        documento enorme no cueste tiempo cuadrático. Si el objeto ya cerró y aun
+        así no se puede decodificar, está mal formado y se lanza el error sin
+        seguir leyendo el resto del archivo.
+        """
+        extra = self.tamano_bloque
+        escaneo = {"i": 0, "profundidad": 0, "en_cadena": False}
+        while True:
+            try:
+                valor, fin = _decoder.raw_decode(self.buffer, self.pos)
+                # Un número al final del buffer puede estar incompleto ("12" de "123")
+                if fin == len(self.buffer) and not self.eof and not isinstance(valor, (dict, list, str)):
+                    raise json.JSONDecodeError("valor posiblemente incompleto", self.buffer, fin)
+                self.pos = fin
+                return valor
+            except json.JSONDecodeError:
+                if self._valor_cerrado(escaneo) or not self.leer_mas(extra):
+                    raise
+                extra = min(extra * 2, BLOQUE_MAXIMO)
+
+
+def iterar_json(archivo: IO[bytes], nombre: str = "") -> Iterator[dict]:
+    """
+    Genera los documentos (dicts) de un archivo JSON, arreglo JSON o NDJSON
+    leyéndolo de forma incremental.
+    """
+    texto = io.TextIOWrapper(archivo, encoding="utf-8-sig", errors="replace")
+    lector = _LectorIncremental(texto)
+
+    primero = lector.saltar(_ESPACIOS)
+    if not primero:
+        return
+
+    if primero == "[":
+        # Arreglo en el nivel superior: entregar cada elemento
+        lector.pos += 1
+        while True:
+            c = lector.saltar(_ESPACIOS + ",")
+            if c == "]" or not c:
+                return
+            valor = lector.siguiente_valor()
+            if isinstance(valor, dict):
+                yield valor
+            else:
+                print(f"[WARN] Elemento no objeto ignorado en {nombre}: {type(valor).__name__}")
+    else:
+        # Objeto suelto o NDJSON: valores separados por espacios / saltos de línea
+        while lector.saltar(_ESPACIOS):
+            valor = lector.siguiente_valor()
+            if isinstance(valor, dict):
+                yield valor
+            elif isinstance(valor, list):
+                for elemento in valor:
+                    if isinstance(elemento, dict):
+                        yield elemento
+
+
+def iterar_documentos_zip(ruta_zip: str) -> Iterator[dict]:
+    """
+    Recorre los miembros JSON de un ZIP leyéndolos directamente del archivo
+    (sin extraerlos a disco) y entrega sus documentos uno a uno.
+    """
+    with ZipFile(ruta_zip, "r") as z:
+        for info in z.infolist():
+            if info.is_dir():
+                continue
+            if not info.filename.lower().endswith(EXTENSIONES_JSON):
+                # Los PDFs del ZIP se procesan aparte (iterar_pdfs_zip)
+                if not info.filename.lower().endswith(".pdf"):
+                    print(f"[INFO] Archivo dentro del ZIP ignorado: {info.filename}")
+                continue
+            with z.open(info) as jf:
+                try:
+                    yield from iterar_json(jf, info.filename)
+                except json.JSONDecodeError as e:
+                    print(f"[WARN] No se pudo leer JSON {info.filename} de {ruta_zip}: {e}")
+
+
+def iterar_pdfs_zip(ruta_zip: str, carpeta_destino: str,
+                    en_memoria_hasta: int = PDF_MEMORIA_MAX) -> Iterator[Tuple[Union[str, bytes], dict]]:
+    """
+    Entrega (pdf, metadatos) por cada PDF dentro de un ZIP, para pasarlos al
+    extractor de texto. Los PDFs de hasta `en_memoria_hasta` bytes se leen a
+    memoria; los más grandes se copian por chunks a `carpeta_destino`.
+    """
+    with ZipFile(ruta_zip, "r") as z:
+        for n, info in enumerate(z.infolist()):
+            if info.is_dir() or not info.filename.lower().endswith(".pdf"):
+                continue
+            nombre = os.path.basename(info.filename) or f"documento_{n}.pdf"
+            if info.file_size <= en_memoria_hasta:
+                pdf = z.read(info)
+            else:
+                pdf = os.path.join(carpeta_destino, f"{n}_{nombre}")
+                with z.open(info) as origen, open(pdf, "wb") as destino:
+                    shutil.copyfileobj(origen, destino, TAMANO_BLOQUE)
+            yield pdf, {
+                "source": "carga_zip",
+                "archivo_zip": os.path.basename(ruta_zip),
+                "ruta_en_zip": info.filename,
+                "titulo": nombre,
+            }
+
+
+def iterar_pdfs_archivos(rutas: Iterable[str], carpeta_destino: str) -> Iterator[Tuple[Union[str, bytes], dict]]:
+    """
+    PDFs de una carga: los sueltos y los que vienen dentro de ZIPs.
+    """
+    for ruta in rutas:
+        nombre = ruta.lower()
+        try:
+            if nombre.endswith(".zip"):
+                yield from iterar_pdfs_zip(ruta, carpeta_destino)
+            elif nombre.endswith(".pdf"):
+                yield ruta, {"source": "carga_pdf", "titulo": os.path.basename(ruta)}
+        except Exception as e:
+            print(f"[WARN] Error leyendo PDFs de {ruta}: {e}")
+
+
+def iterar_documentos_archivo(ruta_archivo: str) -> Iterator[dict]:
+    """
+    Entrega los documentos de un archivo subido (.zip, .json, .ndjson, .jsonl).
+    """
+    nombre = ruta_archivo.lower()
+    try:
+        if nombre.endswith(".zip"):
+            yield from iterar_documentos_zip(ruta_archivo)
+        elif nombre.endswith(EXTENSIONES_JSON):
+            with open(ruta_archivo, "rb") as jf:
+                yield from iterar_json(jf, ruta_archivo)
+        elif nombre.endswith(".pdf"):
+            pass  # se procesan aparte (iterar_pdfs_archivos)
+        else:
+            print(f"[INFO] Archivo ignorado (no es ZIP ni JSON): {ruta_archivo}")
+    except Exception as e:
+        print(f"[WARN] Error leyendo {ruta_archivo}: {e}")
+
+
+def iterar_documentos_archivos(rutas: Iterable[str]) -> Iterator[dict]:
+    """
+    Encadena los documentos de varios archivos subidos.
+    """
+    for ruta in rutas:
+        yield from iterar_documentos_archivo(ruta)
+
+
+def en_lotes(documentos: Iterable[dict], tamano: int) -> Iterator[List[dict]]:
+    """
+    Agrupa un iterable de documentos en listas de como máximo `tamano`.
+    """
+    lote: List[dict] = []
+    for doc in documentos:
+        lote.append(doc)
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+# ----------------------------------------------------------------------
+# Ids deterministas + manifiesto de cambios
+# ----------------------------------------------------------------------
+MANIFIESTO_DB = os.getenv("MANIFIESTO_DB", os.path.join("/tmp", "manifiesto_ingesta.sqlite"))
+
+
+def _normalizar_clave(valor) -> str:
+    return " ".join(str(valor or "").split()).lower()
+
+
+def hash_contenido(doc: dict) -> str:
+    """
+    Hash estable del contenido de un documento (independiente del orden de llaves).
+    """
+    canonico = json.dumps(doc, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(canonico.encode("utf-8")).hexdigest()
+
+
+def id_documento(doc: dict) -> str:
+    """
+    Id determinista para un documento, a partir de una llave estable:
+      - documentos de web scraping: url_pdf
+      - vocabulario: term_parent + term_child
+      - cualquier otro: hash del contenido
+    Así re-subir o re-scrapear lo mismo sobrescribe en vez de duplicar.
+    """
+    if doc.get("_id"):
+        return str(doc["_id"])
+    if doc.get("url_pdf"):
+        clave = "url:" + str(doc["url_pdf"]).strip()
+    elif doc.get("term_parent") or doc.get("term_child"):
+        clave = ("term:" + _normalizar_clave(doc.get("term_parent"))
+                 + "|" + _normalizar_clave(doc.get("term_child")))
+    else:
+        return hash_contenido(doc)
+    return hashlib.sha1(clave.encode("utf-8")).hexdigest()
+
+
+class ManifiestoIngesta:
+    """
+    Registro local id -> hash de lo que ya se indexó en cada índice.
+
+    Antes de mandar un documento se compara su hash con el del manifiesto; si
+    no cambió no se envía. El manifiesto solo se actualiza con los ids que
+    Elastic confirmó, así un lote fallido se reintenta en la próxima carga.
+    """
+
+    def __init__(self, ruta_db: str = MANIFIESTO_DB):
+        self.ruta_db = ruta_db
+        with self._conectar() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS manifiesto ("
+                " indice TEXT NOT NULL,"
+                " id TEXT NOT NULL,"
+                " hash TEXT NOT NULL,"
+                " actualizado REAL NOT NULL,"
+                " PRIMARY KEY (indice, id))"
+            )
+
+    @contextmanager
+    def _conectar(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.ruta_db, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def hashes(self, indice: str, ids: List[str]) -> Dict[str, str]:
+        """
+        Hashes guardados para un grupo de ids (una consulta por grupo).
+        """
+        if not ids:
+            return {}
+        marcas = ",".join("?" * len(ids))
+        with self._conectar() as conn:
+            filas = conn.execute(
+                f"SELECT id, hash FROM manifiesto WHERE indice=? AND id IN ({marcas})",
+                (indice, *ids),
+            ).fetchall()
+        return dict(filas)
+
+    def guardar(self, indice: str, pares: Iterable[Tuple[str, str]]):
+        ahora = time.time()
+        with self._conectar() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO manifiesto (indice, id, hash, actualizado) "
+                "VALUES (?, ?, ?, ?)",
+                ((indice, i, h, ahora) for i, h in pares),
+            )
+
+    def olvidar(self, indice: str):
+        """
+        Borra el manifiesto de un índice (p. ej. si el índice se recreó vacío).
+        """
+        with self._conectar() as conn:
+            conn.execute("DELETE FROM manifiesto WHERE indice=?", (indice,))
+
+    def sesion(self, indice: str, forzar: bool = False) -> "SesionManifiesto":
+        return SesionManifiesto(self, indice, forzar)
+
+
+class SesionManifiesto:
+    """
+    Una pasada de ingesta sobre un índice: filtra lo que no cambió y confirma
+    en el manifiesto lo que Elastic indexó.
+    """
+
+    TAMANO_CONSULTA = 500
+
+    def __init__(self, manifiesto: ManifiestoIngesta, indice: str, forzar: bool = False):
+        self.manifiesto = manifiesto
+        self.indice = indice
+        self.forzar = forzar
+        self.pendientes: Dict[str, str] = {}
+        self.omitidos = 0
+
+    def filtrar(self, documentos: Iterable[dict]) -> Iterator[dict]:
+        """
+        Asigna `_id` a cada documento y entrega solo los nuevos o modificados.
+        """
+        for grupo in en_lotes(documentos, self.TAMANO_CONSULTA):
+            con_id = []
+            for doc in grupo:
+                doc_id = id_documento(doc)
+                cuerpo = {k: v for k, v in doc.items() if k != "_id"}
+                con_id.append((doc_id, cuerpo, hash_contenido(cuerpo)))
+
+            guardados = {} if self.forzar else self.manifiesto.hashes(
+                self.indice, [d[0] for d in con_id]
+            )
+            for doc_id, cuerpo, h in con_id:
+                if guardados.get(doc_id) == h or self.pendientes.get(doc_id) == h:
+                    self.omitidos += 1
+                    continue
+                self.pendientes[doc_id] = h
+                cuerpo["_id"] = doc_id
+                yield cuerpo
+
+    def confirmar(self, ids: Iterable[str]):
+        """
+        Registra en el manifiesto los ids que Elastic indexó sin error.
+        """
+        pares = [(i, self.pendientes.pop(i)) for i in ids if i in self.pendientes]
+        if pares:
+            self.manifiesto.guardar(self.indice, pares)
@@ -0,0 +1,333 @@
+# limites.py
+"""
+Control de admisión delante de Elastic: límite de peticiones por cliente y
+de llamadas simultáneas.
+
+- Cubeta de tokens por cliente (usuario con sesión o, si no, IP) y por regla:
+  la búsqueda pública y la consola de Elastic de los administradores tienen
+  cada una su ráfaga y su tasa. Al vaciarse la cubeta se responde 429 con
+  Retry-After en vez de encolar la petición.
+- Concurrencia: cada worker atiende como máximo ELASTIC_MAX_CONCURRENTES
+  peticiones a rutas que llaman a Elastic (con_turno_elastic); las demás
+  reciben 429 de inmediato. Así una ráfaga no acumula hilos esperando y la
+  latencia de los demás usuarios no se dispara. El valor tiene que ser menor
+  que los hilos del worker (GUNICORN_HILOS) o nunca se rechaza nada.
+
+Las cubetas viven en memoria de cada proceso; con LIMITE_BACKEND=sqlite se
+guardan en un SQLite compartido por todos los workers de gunicorn, y además
+hay un tope global de ELASTIC_MAX_CONCURRENTES_GLOBAL llamadas simultáneas
+entre todos los workers (cupos en archivos con flock). Con el backend en
+memoria el tope total es ELASTIC_MAX_CONCURRENTES × workers.
+"""
+import math
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from flask import jsonify, request, session
+
+try:
+    import fcntl  # solo Unix: cupos compartidos entre procesos
+except ImportError:
+    fcntl = None
+
+LIMITE_BACKEND = os.getenv("LIMITE_BACKEND", "memoria")  # memoria | sqlite
+LIMITE_DB = os.getenv("LIMITE_DB", os.path.join(tempfile.gettempdir(), "limites.sqlite"))
+# Detrás de un proxy (nginx, balanceador) la IP real viene en X-Forwarded-For:
+# se usa la última entrada, la que agregó nuestro proxy (las anteriores las
+# manda el cliente y puede inventarlas)
+LIMITE_CONFIAR_PROXY = os.getenv("LIMITE_CONFIAR_PROXY", "0") == "1"
+# Por worker; por defecto gunicorn.conf.py usa 8 hilos
+ELASTIC_MAX_CONCURRENTES = int(os.getenv("ELASTIC_MAX_CONCURRENTES", "6"))
+# Entre todos los workers (solo con LIMITE_BACKEND=sqlite)
+ELASTIC_MAX_CONCURRENTES_GLOBAL = int(os.getenv("ELASTIC_MAX_CONCURRENTES_GLOBAL", "24"))
+LIMITE_TURNOS_DIR = os.getenv("LIMITE_TURNOS_DIR", os.path.join(tempfile.gettempdir(), "turnos_elastic"))
+# Cubetas en memoria a partir de las cuales se descartan las que están llenas
+MAX_CUBETAS_MEMORIA = 10000
+# Cada cuánto (segundos) como mucho se recorren las cubetas para descartar
+PODA_SEGUNDOS = 30
+
+# Regla -> (ráfaga máxima, tokens por segundo)
+REGLAS = {
+    "busqueda": (
+        float(os.getenv("LIMITE_BUSQUEDA_RAFAGA", "20")),
+        float(os.getenv("LIMITE_BUSQUEDA_POR_SEGUNDO", "5")),
+    ),
+    "elastic_admin": (
+        float(os.getenv("LIMITE_ADMIN_RAFAGA", "5")),
+        float(os.getenv("LIMITE_ADMIN_POR_SEGUNDO", "0.5")),
+    ),
+}
+
+# Endpoint de Flask -> regla
+REGLAS_ENDPOINT = {
+    "buscar": "busqueda",
+    "buscar_pasajes": "busqueda",
+    "termino_pdf_text": "busqueda",
+    "api_similares": "busqueda",
+    "api_elastic_ejecutar": "elastic_admin",
+}
+
+
+def _recargar(tokens: float, ultimo: float, ahora: float,
+              capacidad: float, tasa: float) -> float:
+    return min(capacidad, tokens + (ahora - ultimo) * tasa)
+
+
+def _resultado(tokens: float, tasa: float) -> Tuple[bool, float, float]:
+    """(permitido, tokens restantes, segundos hasta tener un token)."""
+    if tokens >= 1:
+        return True, tokens - 1, 0.0
+    return False, tokens, (1 - tokens) / tasa if tasa > 0 else 60.0
+
+
+class CubetasMemoria:
+    """
+    Cubetas de tokens del proceso:
+    clave -> (tokens, última recarga, capacidad, tasa de su regla).
+    """
+
+    def __init__(self, max_cubetas: int = MAX_CUBETAS_MEMORIA,
+                 poda_segundos: float = PODA_SEGUNDOS):
+        self.max_cubetas = max_cubetas
+        self.poda_segundos = poda_segundos
+        self._cubetas: Dict[str, Tuple[float, float, float, float]] = {}
+        self._ultima_poda = time.monotonic()
+        self._lock = threading.Lock()
+
+    def tomar(self, clave: str, capacidad: float, tasa: float) -> Tuple[bool, float]:
+        ahora = time.monotonic()
+        with self._lock:
+            tokens, ultimo, _, _ = self._cubetas.get(clave, (capacidad, ahora, capacidad, tasa))
+            tokens = _recargar(tokens, ultimo, ahora, capacidad, tasa)
+            permitido, tokens, espera = _resultado(tokens, tasa)
+            self._cubetas[clave] = (tokens, ahora, capacidad, tasa)
+            if (len(self._cubetas) > self.max_cubetas
+                    and ahora - self._ultima_poda >= self.poda_segundos):
+                self._podar(ahora)
+        return permitido, espera
+
+    def _podar(self, ahora: float):
+        # Una cubeta que ya se habría llenado es igual a no tenerla; cada una
+        # se recarga con la capacidad y tasa de su propia regla
+        llenas = [c for c, (t, u, capacidad, tasa) in self._cubetas.items()
+                  if _recargar(t, u, ahora, capacidad, tasa) >= capacidad]
+        for clave in llenas:
+            del self._cubetas[clave]
+        self._ultima_poda = ahora
+
+
+class CubetasSQLite:
+    """
+    Las mismas cubetas en una tabla SQLite compartida entre procesos. Cada
+    toma es una transacción BEGIN IMMEDIATE (lectura + escritura atómicas).
+    """
+
+    def __init__(self, ruta_db: str = LIMITE_DB):
+        self.ruta_db = ruta_db
+        with self._conectar() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cubetas ("
+                " clave TEXT PRIMARY KEY,"
+                " tokens REAL NOT NULL,"
+                " actualizado REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _conectar(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.ruta_db, timeout=2, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def tomar(self, clave: str, capacidad: float, tasa: float) -> Tuple[bool, float]:
+        # Reloj de pared: los procesos no comparten time.monotonic()
+        ahora = time.time()
+        with self._conectar() as conn:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                fila = conn.execute(
+                    "SELECT tokens, actualizado FROM cubetas WHERE clave=?", (clave,)
+                ).fetchone()
+                tokens, ultimo = fila if fila else (capacidad, ahora)
+                tokens = _recargar(tokens, ultimo, ahora, capacidad, tasa)
+                permitido, tokens, espera = _resultado(tokens, tasa)
+                conn.execute(
+                    "INSERT OR REPLACE INTO cubetas (clave, tokens, actualizado) VALUES (?, ?, ?)",
+                    (clave, tokens, ahora),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        if random.random() < 0.001:
+            self.podar()
+        return permitido, espera
+
+    def podar(self, antiguedad: float = 3600):
+        with self._conectar() as conn:
+            conn.execute("DELETE FROM cubetas WHERE actualizado < ?", (time.time() - antiguedad,))
+
+
+class Saturado(Exception):
+    """No hay cupo para otra llamada simultánea a Elastic."""
+
+
+class CuposCompartidos:
+    """
+    Cupos de concurrencia entre procesos: un archivo por cupo y flock sin
+    espera. Si un worker muere el sistema operativo suelta sus cupos.
+    """
+
+    def __init__(self, maximo: int = ELASTIC_MAX_CONCURRENTES_GLOBAL,
+                 carpeta: str = LIMITE_TURNOS_DIR):
+        self.maximo = maximo
+        self.carpeta = carpeta
+        self._archivos: List = []
+        self._ocupados: Set[int] = set()
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _abrir(self):
+        # flock es por archivo abierto: cada proceso abre los suyos, y los
+        # hilos del mismo proceso se reparten los cupos con `_ocupados`
+        os.makedirs(self.carpeta, exist_ok=True)
+        self._archivos = [open(os.path.join(self.carpeta, f"cupo_{i}"), "a")
+                          for i in range(self.maximo)]
+        self._ocupados = set()
+        self._pid = os.getpid()
+
+    def tomar(self) -> Optional[int]:
+        with self._lock:
+            if self._pid != os.getpid():
+                self._abrir()
+            inicio = random.randrange(self.maximo)
+            for k in range(self.maximo):
+                i = (inicio + k) % self.maximo
+                if i in self._ocupados:
+                    continue
+                try:
+                    fcntl.flock(self._archivos[i], fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                self._ocupados.add(i)
+                return i
+        return None
+
+    def soltar(self, i: int):
+        with self._lock:
+            fcntl.flock(self._archivos[i], fcntl.LOCK_UN)
+            self._ocupados.discard(i)
+
+
+class LimiteConcurrencia:
+    """
+    Semáforo sin espera: si no hay cupo se rechaza en el acto (Saturado).
+    Con `compartidos` además hace falta un cupo global entre workers.
+    """
+
+    def __init__(self, maximo: int = ELASTIC_MAX_CONCURRENTES,
+                 compartidos: Optional[CuposCompartidos] = None):
+        self.maximo = maximo
+        self.compartidos = compartidos
+        self._semaforo = threading.BoundedSemaphore(maximo)
+        self._pid = os.getpid()
+
+    @contextmanager
+    def turno(self) -> Iterator[None]:
+        if self._pid != os.getpid():
+            # Tras el fork cada worker arranca con todos sus cupos libres
+            self._semaforo = threading.BoundedSemaphore(self.maximo)
+            self._pid = os.getpid()
+        semaforo = self._semaforo
+        if not semaforo.acquire(blocking=False):
+            raise Saturado()
+        cupo = None
+        try:
+            if self.compartidos is not None:
+                cupo = self.compartidos.tomar()
+                if cupo is None:
+                    raise Saturado()
+            yield
+        finally:
+            if cupo is not None:
+                self.compartidos.soltar(cupo)
+            semaforo.release()
+
+
+_cubetas = None
+limite_elastic = LimiteConcurrencia(
+    compartidos=CuposCompartidos() if LIMITE_BACKEND == "sqlite" and fcntl is not None else None
+)
+
+
+def con_turno_elastic(f):
+    """
+    Decorador de rutas que llaman a Elastic: ocupan un cupo de concurrencia
+    mientras responden (o 429 si no hay).
+    """
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        with limite_elastic.turno():
+            return f(*args, **kwargs)
+    return wrapper
+
+
+def cubetas():
+    global _cubetas
+    if _cubetas is None:
+        _cubetas = CubetasSQLite() if LIMITE_BACKEND == "sqlite" else CubetasMemoria()
+    return _cubetas
+
+
+def cliente_actual() -> str:
+    usuario = session.get("usuario")
+    if usuario:
+        return f"usuario:{usuario}"
+    ip = request.remote_addr or "desconocida"
+    if LIMITE_CONFIAR_PROXY and request.headers.get("X-Forwarded-For"):
+        ip = request.headers["X-Forwarded-For"].split(",")[-1].strip() or ip
+    return f"ip:{ip}"
+
+
+def respuesta_429(mensaje: str, espera: float):
+    respuesta = jsonify({"error": mensaje, "reintentar_en": round(espera, 2)})
+    respuesta.status_code = 429
+    respuesta.headers["Retry-After"] = str(max(1, math.ceil(espera)))
+    return respuesta
+
+
+def _antes():
+    regla = REGLAS_ENDPOINT.get(request.endpoint)
+    if regla is None:
+        return None
+    capacidad, tasa = REGLAS[regla]
+    try:
+        permitido, espera = cubetas().tomar(f"{regla}:{cliente_actual()}", capacidad, tasa)
+    except sqlite3.Error as e:
+        # Si el backend compartido falla se deja pasar: el límite no debe tumbar la búsqueda
+        print("[LIMITES] Error en el backend de cubetas:", repr(e))
+        return None
+    if not permitido:
+        return respuesta_429("Demasiadas solicitudes, intente de nuevo en unos segundos.", espera)
+    return None
+
+
+def instalar(app):
+    """Cubetas por cliente antes de cada ruta limitada y 429 ante Saturado."""
+    app.before_request(_antes)
+
+    @app.errorhandler(Saturado)
+    def _saturado(_error):
+        return respuesta_429("El buscador está ocupado, intente de nuevo en un momento.", 1)
+
+    return app
@@ -0,0 +1,270 @@
+# metricas.py
+"""
+Tiempos por ruta de Flask, encabezado Server-Timing y endpoint /metrics.
+
+Cada petición se mide completa y, dentro de ella, los tramos que se anoten con
+`medir("elastic")`, `medir("mongo")`, etc. La codificación JSON se mide sola
+(proveedor JSON de la app) y de las respuestas de Elastic se toma `took` para
+separar el tiempo del servidor del viaje de red.
+
+Los tiempos se acumulan en histogramas por proceso. Con gunicorn cada worker
+tiene los suyos, así que cada proceso vuelca su copia a un archivo JSON en
+METRICAS_DIR y /metrics suma los de todos los procesos (formato de texto de
+Prometheus).
+
+En vez de imprimir cada consulta, una fracción de las peticiones (y todas las
+lentas) se registra como una línea JSON con ruta, estado y tiempos.
+"""
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Tuple
+
+from flask import Response, g, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+
+METRICAS_DIR = os.getenv("METRICAS_DIR", os.path.join(tempfile.gettempdir(), "metricas_app"))
+# Cada cuánto (segundos) un proceso vuelca sus histogramas a disco
+METRICAS_INTERVALO = float(os.getenv("METRICAS_INTERVALO", "5"))
+# Fracción de peticiones que se registran en el log; las lentas siempre
+METRICAS_MUESTRA_LOG = float(os.getenv("METRICAS_MUESTRA_LOG", "0.01"))
+METRICAS_LENTA_MS = float(os.getenv("METRICAS_LENTA_MS", "1000"))
+
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Nombre de la métrica -> texto de ayuda
+METRICAS = {
+    "http_peticion_segundos": "Duración de las peticiones HTTP por ruta",
+    "tramo_segundos": "Tiempo de cada tramo (elastic, elastic_took, mongo, bcrypt, json) por ruta",
+}
+
+Etiquetas = Tuple[Tuple[str, str], ...]
+
+
+class Histogramas:
+    """
+    Histogramas acumulados en memoria: (métrica, etiquetas) -> conteos por
+    límite, suma y cantidad.
+    """
+
+    def __init__(self, limites: Iterable[float] = LIMITES_SEGUNDOS):
+        self.limites = tuple(limites)
+        self._datos: Dict[Tuple[str, Etiquetas], list] = {}
+        self._lock = threading.Lock()
+
+    def observar(self, metrica: str, etiquetas: Dict[str, str], valor: float):
+        clave = (metrica, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            datos = self._datos.get(clave)
+            if datos is None:
+                datos = self._datos[clave] = [[0] * len(self.limites), 0.0, 0]
+            for i, limite in enumerate(self.limites):
+                if valor <= limite:
+                    datos[0][i] += 1
+                    break
+            datos[1] += valor
+            datos[2] += 1
+
+    def instantanea(self) -> list:
+        with self._lock:
+            return [
+                [metrica, list(map(list, etiquetas)), list(conteos), suma, cantidad]
+                for (metrica, etiquetas), (conteos, suma, cantidad) in self._datos.items()
+            ]
+
+
+class RegistroMetricas:
+    """
+    Histogramas del proceso + volcado periódico a METRICAS_DIR.
+    """
+
+    def __init__(self, carpeta: str = METRICAS_DIR, intervalo: float = METRICAS_INTERVALO):
+        self.carpeta = carpeta
+        self.intervalo = intervalo
+        self.histogramas = Histogramas()
+        self._ultimo_volcado = 0.0
+        self._pid = None
+        self._archivo = None
+
+    def _ruta_archivo(self) -> str:
+        # Tras un fork (workers de gunicorn) cada proceso usa su propio archivo
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._archivo = os.path.join(self.carpeta, f"proceso_{self._pid}_{int(time.time() * 1000)}.json")
+            self.histogramas = Histogramas(self.histogramas.limites)
+        return self._archivo
+
+    def observar(self, metrica: str, etiquetas: Dict[str, str], valor: float):
+        self._ruta_archivo()
+        self.histogramas.observar(metrica, etiquetas, valor)
+        if time.monotonic() - self._ultimo_volcado >= self.intervalo:
+            self.volcar()
+
+    def volcar(self):
+        ruta = self._ruta_archivo()
+        self._ultimo_volcado = time.monotonic()
+        try:
+            os.makedirs(self.carpeta, exist_ok=True)
+            tmp = ruta + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"limites": self.histogramas.limites,
+                           "datos": self.histogramas.instantanea()}, f)
+            os.replace(tmp, ruta)
+        except OSError as e:
+            print("[METRICAS] No se pudieron guardar las métricas:", repr(e))
+
+    def combinadas(self) -> Dict[Tuple[str, Etiquetas], list]:
+        """
+        Suma de los histogramas de todos los procesos (archivos en la carpeta).
+        """
+        self.volcar()
+        total: Dict[Tuple[str, Etiquetas], list] = {}
+        limites = self.histogramas.limites
+        for nombre in os.listdir(self.carpeta):
+            if not nombre.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.carpeta, nombre), encoding="utf-8") as f:
+                    contenido = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if tuple(contenido.get("limites", ())) != limites:
+                continue
+            for metrica, etiquetas, conteos, suma, cantidad in contenido["datos"]:
+                clave = (metrica, tuple(tuple(e) for e in etiquetas))
+                acumulado = total.setdefault(clave, [[0] * len(limites), 0.0, 0])
+                acumulado[0] = [a + b for a, b in zip(acumulado[0], conteos)]
+                acumulado[1] += suma
+                acumulado[2] += cantidad
+        return total
+
+    def limpiar(self):
+        """Borra los archivos de procesos anteriores (al arrancar el servidor)."""
+        if os.path.isdir(self.carpeta):
+            for nombre in os.listdir(self.carpeta):
+                if nombre.endswith(".json"):
+                    os.remove(os.path.join(self.carpeta, nombre))
+
+    def texto_prometheus(self) -> str:
+        limites = self.histogramas.limites
+        por_metrica = defaultdict(list)
+        for (metrica, etiquetas), datos in sorted(self.combinadas().items()):
+            por_metrica[metrica].append((etiquetas, datos))
+
+        lineas = []
+        for metrica, series in por_metrica.items():
+            lineas.append(f"# HELP {metrica} {METRICAS.get(metrica, metrica)}")
+            lineas.append(f"# TYPE {metrica} histogram")
+            for etiquetas, (conteos, suma, cantidad) in series:
+                base = ",".join(f'{k}="{_escapar(v)}"' for k, v in etiquetas)
+                acumulado = 0
+                for limite, conteo in zip(limites, conteos):
+                    acumulado += conteo
+                    lineas.append(f'{metrica}_bucket{{{base},le="{limite}"}} {acumulado}')
+                lineas.append(f'{metrica}_bucket{{{base},le="+Inf"}} {cantidad}')
+                lineas.append(f"{metrica}_sum{{{base}}} {suma:.6f}")
+                lineas.append(f"{metrica}_count{{{base}}} {cantidad}")
+        return "\n".join(lineas) + "\n"
+
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registro = RegistroMetricas()
+
+
+# ----------------------------------------------------------------------
+# Tramos dentro de una petición
+# ----------------------------------------------------------------------
+def registrar(tramo: str, segundos: float):
+    """
+    Suma `segundos` al tramo de la petición en curso (fuera de una petición
+    no hace nada: p. ej. trabajos en segundo plano).
+    """
+    if has_request_context() and hasattr(g, "_tramos"):
+        g._tramos[tramo] = g._tramos.get(tramo, 0.0) + segundos
+
+
+@contextmanager
+def medir(tramo: str):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar(tramo, time.perf_counter() - inicio)
+
+
+def registrar_took(resp: Optional[dict]):
+    """Tiempo que Elastic dice haber usado (`took`, en ms) para la respuesta."""
+    if isinstance(resp, dict) and isinstance(resp.get("took"), (int, float)):
+        registrar("elastic_took", resp["took"] / 1000)
+
+
+class ProveedorJSONMedido(DefaultJSONProvider):
+    """Proveedor JSON de Flask que mide la codificación de las respuestas."""
+
+    def dumps(self, obj, **kwargs):
+        with medir("json"):
+            return super().dumps(obj, **kwargs)
+
+
+# ----------------------------------------------------------------------
+# Integración con Flask
+# ----------------------------------------------------------------------
+def _antes():
+    g._inicio = time.perf_counter()
+    g._tramos = {}
+
+
+def _despues(respuesta):
+    inicio = getattr(g, "_inicio", None)
+    if inicio is None:
+        return respuesta
+    total = time.perf_counter() - inicio
+    ruta = request.url_rule.rule if request.url_rule else "sin_ruta"
+    estado = str(respuesta.status_code)
+    tramos = getattr(g, "_tramos", {})
+
+    registro.observar("http_peticion_segundos",
+                      {"ruta": ruta, "metodo": request.method, "estado": estado}, total)
+    for tramo, segundos in tramos.items():
+        registro.observar("tramo_segundos", {"ruta": ruta, "tramo": tramo}, segundos)
+
+    partes = [f"{tramo};dur={segundos * 1000:.1f}" for tramo, segundos in tramos.items()]
+    partes.append(f"total;dur={total * 1000:.1f}")
+    respuesta.headers["Server-Timing"] = ", ".join(partes)
+
+    total_ms = total * 1000
+    if total_ms >= METRICAS_LENTA_MS or random.random() < METRICAS_MUESTRA_LOG:
+        print("[METRICAS]", json.dumps({
+            "ruta": ruta,
+            "metodo": request.method,
+            "estado": respuesta.status_code,
+            "args": request.args.to_dict(),
+            "total_ms": round(total_ms, 1),
+            "tramos_ms": {t: round(s * 1000, 1) for t, s in tramos.items()},
+            "lenta": total_ms >= METRICAS_LENTA_MS,
+        }, ensure_ascii=False))
+    return respuesta
+
+
+def instalar(app):
+    """
+    Registra la medición en la app: hooks antes/después de cada petición,
+    proveedor JSON medido y la ruta /metrics.
+    """
+    app.json = ProveedorJSONMedido(app)
+    app.before_request(_antes)
+    app.after_request(_despues)
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return Response(registro.texto_prometheus(), mimetype="text/plain; version=0.0.4")
+
+    return app
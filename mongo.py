@@ -1,5 +1,17 @@
+import os
+import threading
+
 from pymongo import MongoClient
-from typing import Optional, Dict
+from typing import Optional, Dict, Tuple
+
+import metricas
+import seguridad
+
+# Un MongoClient por URI (y timeout) y por proceso: el cliente mantiene su propio
+# pool de conexiones y no se puede compartir entre procesos (fork de gunicorn)
+_clientes: Dict[Tuple[str, int], MongoClient] = {}
+_pid_clientes: Optional[int] = None
+_lock_clientes = threading.Lock()
 
 def validar_usuario(
     usuario: str,
@@ -9,20 +21,34 @@ def validar_usuario(
     collection_name: str
 ) -> Optional[Dict]:
     try:
-        client = MongoClient(uri, serverSelectionTimeoutMS=5000)
-        # probar conexión
-        client.admin.command("ping")
-
+        client = _get_client(uri)
         db = client[db_name]
         coleccion = db[collection_name]
 
-        user = coleccion.find_one({"usuario": usuario})
+        with metricas.medir("mongo"):
+            user = coleccion.find_one({"usuario": usuario})
         if not user:
             return None
 
-        if user.get("password") != password:
+        hash_guardado = user.get("password")
+        with metricas.medir("bcrypt"):
+            valido = seguridad.verificar_password(password, hash_guardado)
+        if not valido:
             return None
 
+        # Migrar contraseñas planas o hashes con un costo distinto al actual
+        if seguridad.necesita_rehash(hash_guardado):
+            try:
+                with metricas.medir("bcrypt"):
+                    nuevo_hash = seguridad.hashear_password(password)
+                with metricas.medir("mongo"):
+                    coleccion.update_one(
+                        {"_id": user["_id"], "password": hash_guardado},
+                        {"$set": {"password": nuevo_hash}}
+                    )
+            except Exception as e:
+                print(">>> WARN no se pudo actualizar el hash de", usuario, repr(e))
+
         return {
             "usuario": user.get("usuario"),
             "rol": user.get("rol", "Usuario"),
@@ -32,8 +58,30 @@ def validar_usuario(
         print(">>> ERROR EN validar_usuario():", repr(e))
         raise
 
-def _get_client(uri: str) -> MongoClient:
-    return MongoClient(uri, serverSelectionTimeoutMS=5000)
+def _get_client(uri: str, timeout_ms: int = 5000) -> MongoClient:
+    global _pid_clientes
+    clave = (uri, timeout_ms)
+    with _lock_clientes:
+        if _pid_clientes != os.getpid():
+            # Clientes heredados del proceso padre: no se usan ni se cierran aquí
+            _clientes.clear()
+            _pid_clientes = os.getpid()
+        if clave not in _clientes:
+            _clientes[clave] = MongoClient(uri, serverSelectionTimeoutMS=timeout_ms, connect=False)
+        return _clientes[clave]
+
+def ping(uri: str, timeout_ms: int = 3000) -> bool:
+    """
+    Verifica si Mongo responde (para el endpoint de readiness). Usa su propio
+    cliente con `timeout_ms` también para elegir servidor: con Mongo caído el
+    cliente normal esperaría sus 5 s de serverSelectionTimeoutMS.
+    """
+    try:
+        _get_client(uri, timeout_ms).admin.command("ping", maxTimeMS=timeout_ms)
+        return True
+    except Exception as e:
+        print(">>> WARN Mongo no responde:", repr(e))
+        return False
 
 def listar_usuarios(uri: str, db_name: str, collection_name: str):
     """
@@ -87,8 +135,7 @@ def listar_usuarios_tabla(uri: str, db_name: str, collection_name: str):
 def crear_usuario(uri: str, db_name: str, collection_name: str, data: dict):
     """
     Crea un nuevo usuario en la colección.
-    OJO: para el proyecto real deberíamos encriptar password,
-    aquí se deja plano solo por fines académicos.
+    La contraseña se guarda como hash bcrypt (ver seguridad.py).
     """
     client = _get_client(uri)
     db = client[db_name]
@@ -99,13 +146,16 @@ def crear_usuario(uri: str, db_name: str, collection_name: str, data: dict):
         raise ValueError("El campo 'usuario' es obligatorio")
 
     # Verificar si ya existe
-    ya_existe = coleccion.find_one({"usuario": usuario})
+    with metricas.medir("mongo"):
+        ya_existe = coleccion.find_one({"usuario": usuario})
     if ya_existe:
         raise ValueError("El usuario ya existe")
 
+    with metricas.medir("bcrypt"):
+        password = seguridad.preparar_password(data.get("password", ""))
     doc = {
         "usuario": usuario,
-        "password": data.get("password", ""),
+        "password": password,
         "rol": data.get("rol", "Usuario"),
         "permisos": {
             "login": bool(data.get("login", True)),
@@ -115,7 +165,8 @@ def crear_usuario(uri: str, db_name: str, collection_name: str, data: dict):
         }
     }
 
-    coleccion.insert_one(doc)
+    with metricas.medir("mongo"):
+        coleccion.insert_one(doc)
     return True
 
 def actualizar_usuario(uri: str, db_name: str, collection_name: str,
@@ -135,13 +186,16 @@ def actualizar_usuario(uri: str, db_name: str, collection_name: str,
 
     # Si cambia el nombre, validar que no exista otro igual
     if nuevo_usuario != usuario_original:
-        ya_existe = coleccion.find_one({"usuario": nuevo_usuario})
+        with metricas.medir("mongo"):
+            ya_existe = coleccion.find_one({"usuario": nuevo_usuario})
         if ya_existe:
             raise ValueError("Ya existe otro usuario con ese nombre")
 
+    with metricas.medir("bcrypt"):
+        password = seguridad.preparar_password(data.get("password", ""))
     update_doc = {
         "usuario": nuevo_usuario,
-        "password": data.get("password", ""),
+        "password": password,
         "rol": data.get("rol", "Usuario"),
         "permisos": {
             "login": bool(data.get("login", True)),
@@ -151,10 +205,11 @@ def actualizar_usuario(uri: str, db_name: str, collection_name: str,
         }
     }
 
-    result = coleccion.update_one(
-        {"usuario": usuario_original},
-        {"$set": update_doc}
-    )
+    with metricas.medir("mongo"):
+        result = coleccion.update_one(
+            {"usuario": usuario_original},
+            {"$set": update_doc}
+        )
     if result.matched_count == 0:
         raise ValueError("El usuario no existe")
 
@@ -0,0 +1,256 @@
+# pasajes.py
+"""
+División del texto de los PDFs en pasajes para indexar y buscar.
+
+En vez de indexar cada PDF como un único `contenido` enorme, el texto se parte
+en pasajes solapados (con página y posición de caracteres) que se guardan como
+documentos livianos en un índice acompañante `<indice>_pasajes`, enlazados al
+documento original por `doc_id`. El documento original queda solo con sus
+metadatos y un resumen corto.
+
+La búsqueda por pasajes puntúa campos pequeños y agrupa (collapse) los mejores
+pasajes de cada documento.
+
+Opcionalmente el `pdf_text` completo de los términos se guarda aparte, en
+`<indice>_pdf_text` con el mismo id del término, y el índice principal queda
+solo con los campos del término y un resumen (ver separar_pdf_text).
+"""
+import os
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+PASAJE_CARACTERES = int(os.getenv("PASAJE_CARACTERES", "1500"))
+PASAJE_SOLAPAMIENTO = int(os.getenv("PASAJE_SOLAPAMIENTO", "200"))
+RESUMEN_CARACTERES = int(os.getenv("RESUMEN_CARACTERES", "500"))
+SUFIJO_PASAJES = "_pasajes"
+SUFIJO_PDF_TEXT = "_pdf_text"
+
+# Campos del documento original que se copian a cada pasaje para poder
+# mostrar el resultado sin una segunda consulta
+CAMPOS_ENLACE = ("titulo", "url_pdf", "source", "term_parent", "term_child")
+
+MAPEO_PASAJES = {
+    "mappings": {
+        "properties": {
+            "doc_id": {"type": "keyword"},
+            "orden": {"type": "integer"},
+            "pagina": {"type": "integer"},
+            "inicio": {"type": "integer"},
+            "fin": {"type": "integer"},
+            "texto": {"type": "text"},
+            "titulo": {"type": "text"},
+            "url_pdf": {"type": "keyword"},
+            "source": {"type": "keyword"},
+            "term_parent": {"type": "text"},
+            "term_child": {"type": "text"},
+        }
+    }
+}
+
+
+def indice_pasajes(indice: str) -> str:
+    return indice + SUFIJO_PASAJES
+
+
+def indice_pdf_text(indice: str) -> str:
+    return indice + SUFIJO_PDF_TEXT
+
+
+def _cortes(texto: str, tamano: int, solapamiento: int) -> Iterator[tuple]:
+    """
+    Posiciones (inicio, fin) de ventanas de `tamano` caracteres que se solapan
+    `solapamiento`. Cada corte se corre hasta el último espacio para no partir
+    palabras (si el espacio queda en la segunda mitad de la ventana).
+    """
+    n = len(texto)
+    inicio = 0
+    while inicio < n:
+        fin = min(inicio + tamano, n)
+        if fin < n:
+            espacio = texto.rfind(" ", inicio + tamano // 2, fin)
+            if espacio > 0:
+                fin = espacio
+        yield inicio, fin
+        if fin >= n:
+            break
+        siguiente = max(fin - solapamiento, inicio + 1)
+        # Empezar el siguiente pasaje en inicio de palabra
+        espacio = texto.find(" ", siguiente, fin)
+        inicio = espacio + 1 if espacio != -1 else siguiente
+
+
+def dividir_en_pasajes(paginas: List[str],
+                       tamano: int = PASAJE_CARACTERES,
+                       solapamiento: int = PASAJE_SOLAPAMIENTO,
+                       con_pagina: bool = True) -> Iterator[Dict]:
+    """
+    Pasajes de una lista de textos por página: {orden, pagina, inicio, fin, texto}.
+    `inicio`/`fin` son posiciones de caracteres dentro de la página.
+    Con `con_pagina=False` (texto sin paginar) no se incluye `pagina`.
+    """
+    solapamiento = min(solapamiento, tamano // 2)
+    orden = 0
+    for num_pagina, texto in enumerate(paginas, start=1):
+        if not texto or not texto.strip():
+            continue
+        for inicio, fin in _cortes(texto, tamano, solapamiento):
+            fragmento = texto[inicio:fin].strip()
+            if not fragmento:
+                continue
+            pasaje = {"orden": orden, "inicio": inicio, "fin": fin, "texto": fragmento}
+            if con_pagina:
+                pasaje["pagina"] = num_pagina
+            orden += 1
+            yield pasaje
+
+
+def resumen(texto: str, caracteres: int = RESUMEN_CARACTERES) -> str:
+    texto = " ".join((texto or "").split())
+    if len(texto) <= caracteres:
+        return texto
+    corte = texto.rfind(" ", 0, caracteres)
+    return texto[:corte if corte > 0 else caracteres] + "…"
+
+
+def expandir_pasajes(documentos: Iterable[dict], indice: str,
+                     al_expandir: Optional[Callable[[str, int], None]] = None) -> Iterator[dict]:
+    """
+    Para cada documento (ya con `_id`) que traiga `paginas` (PDFs) o `pdf_text`
+    entrega primero sus pasajes, con `_index` del índice de pasajes, y después
+    el propio documento:
+      - PDFs: se quita `paginas` y `contenido` se reemplaza por un resumen.
+      - vocabulario: `pdf_text` se deja en el documento y se parte en pasajes.
+    Los demás documentos pasan sin cambios. `al_expandir(doc_id, num_pasajes)`
+    permite limpiar luego los pasajes sobrantes de una versión anterior (con 0
+    para los documentos que ahora llegan sin texto que partir).
+    """
+    destino = indice_pasajes(indice)
+    for doc in documentos:
+        paginas = doc.pop("paginas", None)
+        if paginas is not None:
+            pasajes = dividir_en_pasajes(paginas)
+            doc["contenido"] = resumen(doc.get("contenido") or " ".join(paginas))
+        elif isinstance(doc.get("pdf_text"), str) and doc["pdf_text"].strip():
+            pasajes = dividir_en_pasajes([doc["pdf_text"]], con_pagina=False)
+        else:
+            if al_expandir and "_id" in doc and "_index" not in doc and "_op" not in doc:
+                al_expandir(doc["_id"], 0)
+            yield doc
+            continue
+
+        doc_id = doc["_id"]
+        enlace = {c: doc[c] for c in CAMPOS_ENLACE if doc.get(c)}
+        num_pasajes = 0
+        for pasaje in pasajes:
+            pasaje.update(enlace)
+            pasaje["doc_id"] = doc_id
+            pasaje["_index"] = destino
+            pasaje["_id"] = f"{doc_id}-{pasaje['orden']}"
+            num_pasajes += 1
+            yield pasaje
+
+        doc["num_pasajes"] = num_pasajes
+        if al_expandir:
+            al_expandir(doc_id, num_pasajes)
+        yield doc
+
+
+def separar_pdf_text(documentos: Iterable[dict], indice: str,
+                     al_separar: Optional[Callable[[str], None]] = None,
+                     al_omitir: Optional[Callable[[str], None]] = None) -> Iterator[dict]:
+    """
+    Saca el `pdf_text` de los documentos del índice principal (ya con `_id`) y
+    lo entrega como documento aparte para `<indice>_pdf_text`, con el mismo id.
+    En el principal quedan `pdf_resumen` y `tiene_pdf_text`. Los documentos que
+    ya van a otro índice (`_index`, p. ej. pasajes) o son actualizaciones
+    parciales pasan sin cambios. `al_omitir(doc_id)` avisa de los que llegan sin
+    `pdf_text`, para borrar el que quedara de una versión anterior.
+    """
+    destino = indice_pdf_text(indice)
+    for doc in documentos:
+        if "_index" in doc or "_op" in doc:
+            yield doc
+            continue
+        texto = doc.get("pdf_text")
+        if not isinstance(texto, str) or not texto.strip():
+            if al_omitir:
+                al_omitir(doc["_id"])
+            yield doc
+            continue
+
+        del doc["pdf_text"]
+        doc["pdf_resumen"] = resumen(texto)
+        doc["tiene_pdf_text"] = True
+        if al_separar:
+            al_separar(doc["_id"])
+        yield {"_index": destino, "_id": doc["_id"], "pdf_text": texto}
+        yield doc
+
+
+def consulta_pasajes_sobrantes(num_pasajes: Dict[str, int]) -> dict:
+    """
+    Query para borrar los pasajes de versiones anteriores que ya no existen
+    (si un documento se re-indexa con menos pasajes que antes).
+    """
+    return {
+        "bool": {
+            "should": [
+                {"bool": {"filter": [
+                    {"term": {"doc_id": doc_id}},
+                    {"range": {"orden": {"gte": n}}},
+                ]}}
+                for doc_id, n in num_pasajes.items()
+            ],
+            "minimum_should_match": 1,
+        }
+    }
+
+
+def consulta_busqueda_pasajes(q: str, size: int = 10, pasajes_por_documento: int = 3) -> dict:
+    """
+    Búsqueda sobre el índice de pasajes: mejores pasajes agrupados por documento.
+    """
+    return {
+        "size": size,
+        "query": {
+            "multi_match": {
+                "query": q,
+                "fields": ["texto", "titulo^2", "term_parent^2", "term_child^2"],
+            }
+        },
+        "_source": ["doc_id", *CAMPOS_ENLACE],
+        "collapse": {
+            "field": "doc_id",
+            "inner_hits": {
+                "name": "pasajes",
+                "size": pasajes_por_documento,
+                "_source": ["orden", "pagina", "inicio", "fin"],
+                "highlight": {
+                    "fields": {"texto": {"fragment_size": 200, "number_of_fragments": 1}}
+                },
+            },
+        },
+    }
+
+
+def resultados_pasajes(resp: dict) -> List[Dict]:
+    """
+    Convierte la respuesta agrupada de Elastic en una lista simple:
+    un elemento por documento con sus mejores pasajes.
+    """
+    resultados = []
+    for hit in resp.get("hits", {}).get("hits", []):
+        fuente = hit.get("_source", {})
+        internos = hit.get("inner_hits", {}).get("pasajes", {}).get("hits", {}).get("hits", [])
+        resultados.append({
+            **fuente,
+            "score": hit.get("_score"),
+            "pasajes": [
+                {
+                    **p.get("_source", {}),
+                    "score": p.get("_score"),
+                    "fragmento": (p.get("highlight", {}).get("texto") or [""])[0],
+                }
+                for p in internos
+            ],
+        })
+    return resultados
@@ -0,0 +1,210 @@
+# respuestas.py
+"""
+Respuestas HTTP más livianas: compresión, ETags y estáticos con huella.
+
+- Compresión: las respuestas de texto (JSON, HTML, CSS, JS) por encima de
+  COMPRESION_MIN_BYTES se comprimen con brotli (si está instalado) o gzip,
+  según lo que acepte el navegador.
+- ETags: /api/buscar calcula el suyo sin consultar Elastic, a partir de la
+  "generación" del índice (un token que cambia con cada ingesta) y de la
+  consulta; si el navegador ya tiene esa respuesta se devuelve 304 sin tocar
+  Elastic. Las demás respuestas GET en JSON llevan un ETag del cuerpo.
+- Estáticos: url_for('static', ...) agrega ?v=<hash del archivo> y esas URLs
+  se sirven con caché de un año (immutable): un cambio en el archivo cambia
+  la URL.
+"""
+import gzip
+import hashlib
+import os
+import tempfile
+import time
+import uuid
+from typing import Dict, Optional, Tuple
+
+from flask import request
+
+import metricas
+from elastic import nombre_indice_valido
+
+try:
+    import brotli
+except ImportError:  # opcional: sin brotli se usa gzip
+    brotli = None
+
+COMPRESION_MIN_BYTES = int(os.getenv("COMPRESION_MIN_BYTES", "1024"))
+COMPRESION_NIVEL_GZIP = int(os.getenv("COMPRESION_NIVEL_GZIP", "6"))
+COMPRESION_NIVEL_BROTLI = int(os.getenv("COMPRESION_NIVEL_BROTLI", "5"))
+TIPOS_COMPRIMIBLES = (
+    "application/json", "text/html", "text/css", "text/plain",
+    "application/javascript", "text/javascript",
+)
+GENERACIONES_DIR = os.getenv("GENERACIONES_DIR", os.path.join(tempfile.gettempdir(), "generaciones_indices"))
+# Cambios hechos por fuera de la app no cambian la generación: los ETags de
+# búsqueda se renuevan igual cada tanto
+ETAG_MAX_SEGUNDOS = int(os.getenv("ETAG_MAX_SEGUNDOS", "3600"))
+ESTATICOS_MAX_EDAD = 365 * 24 * 3600
+
+SUFIJOS_CODIFICACION = {"gzip": "-gz", "br": "-br"}
+
+
+# ----------------------------------------------------------------------
+# Generación de cada índice
+# ----------------------------------------------------------------------
+_generaciones: Dict[str, Tuple[int, str]] = {}
+
+
+def _ruta_generacion(indice: str) -> str:
+    # El nombre viene de formularios y de la consola de Elastic: no puede
+    # salirse de GENERACIONES_DIR
+    if not nombre_indice_valido(indice):
+        raise ValueError(f"Nombre de índice no válido: {indice!r}")
+    return os.path.join(GENERACIONES_DIR, indice)
+
+
+def generacion(indice: str) -> str:
+    """
+    Token de la versión actual del índice (se relee solo si el archivo cambió:
+    la ingesta corre en otros procesos).
+    """
+    ruta = _ruta_generacion(indice)
+    try:
+        marca = os.stat(ruta).st_mtime_ns
+    except FileNotFoundError:
+        return "0"
+    cacheada = _generaciones.get(indice)
+    if cacheada and cacheada[0] == marca:
+        return cacheada[1]
+    with open(ruta, encoding="utf-8") as f:
+        token = f.read().strip()
+    _generaciones[indice] = (marca, token)
+    return token
+
+
+def nueva_generacion(indice: str) -> str:
+    """Se llama tras modificar el índice: invalida los ETags de sus búsquedas."""
+    os.makedirs(GENERACIONES_DIR, exist_ok=True)
+    token = uuid.uuid4().hex[:16]
+    tmp = _ruta_generacion(indice) + f".{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(token)
+    os.replace(tmp, _ruta_generacion(indice))
+    return token
+
+
+def etag_busqueda(indice: str, *partes) -> str:
+    """ETag de una búsqueda: generación del índice + consulta, sin ir a Elastic."""
+    ventana = int(time.time() // ETAG_MAX_SEGUNDOS) if ETAG_MAX_SEGUNDOS > 0 else 0
+    clave = "|".join(map(str, (indice, generacion(indice), ventana, *partes)))
+    return hashlib.sha1(clave.encode("utf-8")).hexdigest()[:24]
+
+
+def coincide_etag(etag: str) -> bool:
+    """¿El navegador ya tiene esta respuesta (en cualquiera de sus codificaciones)?"""
+    pedidas = request.if_none_match
+    if not pedidas:
+        return False
+    return any(pedidas.contains(etag + sufijo) for sufijo in ("", *SUFIJOS_CODIFICACION.values()))
+
+
+# ----------------------------------------------------------------------
+# Estáticos con huella
+# ----------------------------------------------------------------------
+_huellas: Dict[str, Tuple[int, str]] = {}
+
+
+def huella_archivo(ruta: str) -> Optional[str]:
+    try:
+        marca = os.stat(ruta).st_mtime_ns
+    except OSError:
+        return None
+    cacheada = _huellas.get(ruta)
+    if cacheada and cacheada[0] == marca:
+        return cacheada[1]
+    h = hashlib.sha1()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(64 * 1024), b""):
+            h.update(bloque)
+    huella = h.hexdigest()[:12]
+    _huellas[ruta] = (marca, huella)
+    return huella
+
+
+# ----------------------------------------------------------------------
+# Integración con Flask
+# ----------------------------------------------------------------------
+def _codificacion_aceptada() -> Optional[str]:
+    aceptadas = request.accept_encodings
+    if brotli is not None and aceptadas["br"]:
+        return "br"
+    if aceptadas["gzip"]:
+        return "gzip"
+    return None
+
+
+def _comprimir(respuesta):
+    if (respuesta.direct_passthrough or respuesta.is_streamed
+            or respuesta.status_code != 200
+            or "Content-Encoding" in respuesta.headers
+            or respuesta.mimetype not in TIPOS_COMPRIMIBLES):
+        return respuesta
+    respuesta.vary.add("Accept-Encoding")
+    codificacion = _codificacion_aceptada()
+    if codificacion is None:
+        return respuesta
+    cuerpo = respuesta.get_data()
+    if len(cuerpo) < COMPRESION_MIN_BYTES:
+        return respuesta
+
+    with metricas.medir("compresion"):
+        if codificacion == "br":
+            comprimido = brotli.compress(cuerpo, quality=COMPRESION_NIVEL_BROTLI)
+        else:
+            comprimido = gzip.compress(cuerpo, compresslevel=COMPRESION_NIVEL_GZIP, mtime=0)
+    respuesta.set_data(comprimido)
+    respuesta.headers["Content-Encoding"] = codificacion
+    # ETag fuerte distinto por codificación (mismo contenido, otros bytes)
+    etag, debil = respuesta.get_etag()
+    if etag:
+        respuesta.set_etag(etag + SUFIJOS_CODIFICACION[codificacion], weak=debil)
+    return respuesta
+
+
+def _despues(respuesta):
+    if request.endpoint == "static":
+        if request.args.get("v"):
+            respuesta.cache_control.no_cache = None
+            respuesta.cache_control.public = True
+            respuesta.cache_control.max_age = ESTATICOS_MAX_EDAD
+            respuesta.cache_control.immutable = True
+        # send_file entrega el archivo en modo passthrough (sin cuerpo en memoria);
+        # CSS / JS se leen para poder comprimirlos, el resto pasa tal cual
+        if (respuesta.direct_passthrough and respuesta.status_code == 200
+                and respuesta.mimetype in TIPOS_COMPRIMIBLES):
+            respuesta.direct_passthrough = False
+            respuesta.make_sequence()
+        return _comprimir(respuesta)
+
+    if (request.method == "GET" and respuesta.status_code == 200
+            and respuesta.mimetype == "application/json"
+            and not respuesta.direct_passthrough and not respuesta.is_streamed):
+        if not respuesta.get_etag()[0]:
+            respuesta.set_etag(hashlib.sha1(respuesta.get_data()).hexdigest()[:24])
+        if coincide_etag(respuesta.get_etag()[0]):
+            respuesta.status_code = 304
+            respuesta.set_data(b"")
+            return respuesta
+    return _comprimir(respuesta)
+
+
+def instalar(app):
+    """Compresión y ETags en las respuestas + ?v=<huella> en los estáticos."""
+    app.after_request(_despues)
+
+    @app.url_defaults
+    def _huella_estaticos(endpoint, valores):
+        if endpoint == "static" and "filename" in valores and "v" not in valores:
+            huella = huella_archivo(os.path.join(app.static_folder, valores["filename"]))
+            if huella:
+                valores["v"] = huella
+
+    return app
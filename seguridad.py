@@ -0,0 +1,133 @@
+# seguridad.py
+"""
+Hash y verificación de contraseñas con bcrypt.
+
+bcrypt es costoso a propósito (100-300 ms por login con costo 12), pero libera
+el GIL mientras calcula. Por eso el trabajo se manda a un pool de hilos acotado:
+una ráfaga de logins no deja sin CPU a /api/buscar (el pool nunca usa más de
+BCRYPT_MAX_HILOS núcleos). El hilo de la petición sí espera su resultado, así
+que la cola del pool también está acotada: si ya hay BCRYPT_MAX_COLA esperando
+se rechaza en el acto (BcryptOcupado) en vez de dejar hilos de gunicorn
+bloqueados detrás de la ráfaga.
+"""
+import os
+import hmac
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturoTimeout
+from typing import Optional
+
+import bcrypt
+
+# Costo (log2 de rondas) con el que se generan los hashes nuevos.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Máximo de verificaciones bcrypt simultáneas por worker.
+BCRYPT_MAX_HILOS = int(os.getenv("BCRYPT_MAX_HILOS", "2"))
+# Máximo de verificaciones esperando turno (además de las que corren) por worker.
+BCRYPT_MAX_COLA = int(os.getenv("BCRYPT_MAX_COLA", "4"))
+# Tiempo máximo esperando a que el pool verifique una contraseña.
+BCRYPT_TIMEOUT = float(os.getenv("BCRYPT_TIMEOUT", "10"))
+
+_PREFIJOS_BCRYPT = ("$2a$", "$2b$", "$2y$")
+
+_pool = ThreadPoolExecutor(
+    max_workers=BCRYPT_MAX_HILOS,
+    thread_name_prefix="bcrypt",
+)
+# Cupos del pool: las que corren más las que esperan
+_cupos = threading.BoundedSemaphore(BCRYPT_MAX_HILOS + BCRYPT_MAX_COLA)
+
+
+class BcryptOcupado(Exception):
+    """El pool de bcrypt está lleno (o no respondió a tiempo): reintentar luego."""
+
+
+def es_hash_bcrypt(valor: Optional[str]) -> bool:
+    """
+    Indica si un valor guardado ya es un hash bcrypt (y no una contraseña plana).
+    """
+    return bool(valor) and valor.startswith(_PREFIJOS_BCRYPT) and len(valor) == 60
+
+
+def costo_hash(hash_guardado: str) -> Optional[int]:
+    """
+    Devuelve el costo con el que se generó un hash bcrypt ($2b$12$... -> 12).
+    """
+    if not es_hash_bcrypt(hash_guardado):
+        return None
+    try:
+        return int(hash_guardado.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def _hashear(password: str, rounds: int) -> str:
+    salt = bcrypt.gensalt(rounds=rounds)
+    return bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
+
+
+def _verificar(password: str, hash_guardado: str) -> bool:
+    try:
+        return bcrypt.checkpw(password.encode("utf-8"), hash_guardado.encode("utf-8"))
+    except ValueError:
+        return False
+
+
+def _en_pool(funcion, *args):
+    """
+    Corre `funcion` en el pool de bcrypt y espera su resultado. Sin cupo en la
+    cola, o si no termina en BCRYPT_TIMEOUT, lanza BcryptOcupado.
+    """
+    if not _cupos.acquire(blocking=False):
+        raise BcryptOcupado()
+    try:
+        futuro = _pool.submit(funcion, *args)
+    except Exception:
+        _cupos.release()
+        raise
+    futuro.add_done_callback(lambda _f: _cupos.release())
+    try:
+        return futuro.result(timeout=BCRYPT_TIMEOUT)
+    except FuturoTimeout:
+        raise BcryptOcupado() from None
+
+
+def hashear_password(password: str, rounds: Optional[int] = None) -> str:
+    """
+    Genera el hash bcrypt de una contraseña usando el pool de hilos.
+    """
+    return _en_pool(_hashear, password, rounds or BCRYPT_ROUNDS)
+
+
+def verificar_password(password: str, hash_guardado: Optional[str]) -> bool:
+    """
+    Verifica una contraseña contra lo que hay guardado en Mongo.
+
+    Si lo guardado aún es texto plano (usuarios anteriores a bcrypt) se compara
+    en tiempo constante; el llamador se encarga de migrarlo con `necesita_rehash`.
+    """
+    if not hash_guardado:
+        return False
+
+    if not es_hash_bcrypt(hash_guardado):
+        return hmac.compare_digest(password.encode("utf-8"), hash_guardado.encode("utf-8"))
+
+    return _en_pool(_verificar, password, hash_guardado)
+
+
+def necesita_rehash(hash_guardado: Optional[str], rounds: Optional[int] = None) -> bool:
+    """
+    True si lo guardado es texto plano o un hash con un costo distinto al configurado.
+    """
+    return costo_hash(hash_guardado or "") != (rounds or BCRYPT_ROUNDS)
+
+
+def preparar_password(password: str) -> str:
+    """
+    Valor a guardar en Mongo para una contraseña recibida desde el admin.
+
+    La tabla de usuarios devuelve el hash y el formulario de edición lo reenvía
+    tal cual, así que un hash bcrypt recibido se conserva sin volver a hashearlo.
+    """
+    if not password or es_hash_bcrypt(password):
+        return password
+    return hashear_password(password)
@@ -0,0 +1,492 @@
+# similares.py
+"""
+Términos similares del vocabulario con TF-IDF y similitud coseno (NumPy).
+
+`related_terms` se mantiene a mano; aquí se calcula, sin modelos ni red, qué
+términos se parecen más a uno dado a partir de `term_parent`, `term_child` y
+la definición (texto plegado sin tildes).
+
+- Los tokens de cada término se guardan en SQLite (CorpusTerminos): tras una
+  ingesta solo se tokenizan los términos nuevos o modificados.
+- La matriz TF-IDF (CSR normalizada por fila) se guarda como archivos .npy
+  que se abren con mmap: los workers de gunicorn comparten las páginas.
+- Una consulta es un producto disperso vectorizado sobre toda la matriz.
+- Tras una ingesta la reconstrucción la hace un hilo en segundo plano que
+  junta las ingestas seguidas; si el corpus no cambió desde la versión
+  publicada no se reconstruye.
+
+Reconstrucción completa desde Elastic:
+    python similares.py --indice lenguaje_controlado
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl  # solo Unix: bloqueo entre procesos al reconstruir
+except ImportError:
+    fcntl = None
+
+from elastic import nombre_indice_valido
+from texto import plegar_acentos, tokenizar
+
+SIMILARES_DIR = os.getenv("SIMILARES_DIR", os.path.join(tempfile.gettempdir(), "similares"))
+CAMPOS_TERMINO = ("term_parent", "term_child", "definition", "definicion_1")
+# Tras una ingesta se espera este tiempo antes de reconstruir: las ingestas
+# seguidas se juntan en una sola reconstrucción
+SIMILARES_ESPERA = float(os.getenv("SIMILARES_ESPERA_S", "2"))
+
+STOPWORDS = {
+    "de", "la", "el", "en", "y", "a", "los", "las", "del", "se", "que", "por",
+    "un", "una", "con", "para", "es", "al", "lo", "como", "o", "su", "sus",
+    "no", "son", "entre", "sobre", "este", "esta", "estos", "estas", "ser",
+    "mas", "le", "les", "ya", "cuando", "sin", "tambien", "u", "e", "ni",
+}
+
+
+def es_termino(doc: dict) -> bool:
+    return bool(doc.get("term_parent") or doc.get("term_child"))
+
+
+def tokens_termino(doc: dict) -> List[str]:
+    """
+    Tokens de un término: el nombre (padre + hijo) cuenta doble frente a la definición.
+    """
+    nombre = tokenizar(f"{doc.get('term_parent') or ''} {doc.get('term_child') or ''}", 2)
+    definicion = tokenizar(str(doc.get("definition") or doc.get("definicion_1") or ""), 2)
+    return [t for t in nombre * 2 + definicion if t not in STOPWORDS]
+
+
+def nombre_termino(doc: dict) -> str:
+    return plegar_acentos(str(doc.get("term_child") or doc.get("term_parent") or "")).strip()
+
+
+# ----------------------------------------------------------------------
+# Corpus persistente (tokens por término)
+# ----------------------------------------------------------------------
+class CorpusTerminos:
+    """
+    Tokens de cada término del vocabulario, en SQLite.
+    """
+
+    def __init__(self, carpeta: str):
+        os.makedirs(carpeta, exist_ok=True)
+        self.ruta_db = os.path.join(carpeta, "terminos.sqlite")
+        with self._conectar() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS terminos ("
+                " id TEXT PRIMARY KEY,"
+                " term_parent TEXT,"
+                " term_child TEXT,"
+                " tokens TEXT NOT NULL,"
+                " actualizado REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _conectar(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.ruta_db, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def actualizar(self, documentos: Iterable[dict]) -> int:
+        """
+        Inserta o reemplaza términos (documentos con `_id`). Devuelve cuántos.
+        """
+        ahora = time.time()
+        filas = [
+            (str(d["_id"]), d.get("term_parent"), d.get("term_child"),
+             " ".join(tokens_termino(d)), ahora)
+            for d in documentos if es_termino(d) and d.get("_id")
+        ]
+        if filas:
+            with self._conectar() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO terminos (id, term_parent, term_child, tokens, actualizado) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    filas,
+                )
+        return len(filas)
+
+    def contar(self) -> int:
+        with self._conectar() as conn:
+            return conn.execute("SELECT COUNT(*) FROM terminos").fetchone()[0]
+
+    def marca(self) -> str:
+        """
+        Cambia con cada alta, modificación o vaciado del corpus: si coincide con
+        la de la versión publicada no hace falta reconstruir.
+        """
+        with self._conectar() as conn:
+            n, ultimo = conn.execute("SELECT COUNT(*), MAX(actualizado) FROM terminos").fetchone()
+        return f"{n}:{ultimo!r}"
+
+    def vaciar(self):
+        with self._conectar() as conn:
+            conn.execute("DELETE FROM terminos")
+
+    def filas(self) -> List[Tuple[str, Optional[str], Optional[str], str]]:
+        with self._conectar() as conn:
+            return conn.execute(
+                "SELECT id, term_parent, term_child, tokens FROM terminos ORDER BY id"
+            ).fetchall()
+
+
+# ----------------------------------------------------------------------
+# Matriz TF-IDF
+# ----------------------------------------------------------------------
+def _suma_por_fila(valores: np.ndarray, indptr: np.ndarray) -> np.ndarray:
+    """
+    Suma de `valores` por fila CSR (las filas vacías quedan en 0).
+    """
+    n_filas = len(indptr) - 1
+    resultado = np.zeros(n_filas, dtype=np.float32)
+    if len(valores) == 0:
+        return resultado
+    largos = np.diff(indptr)
+    con_datos = largos > 0
+    resultado[con_datos] = np.add.reduceat(valores, indptr[:-1][con_datos])
+    return resultado
+
+
+# Se llaman con (IndiceSimilares, carpeta de la versión nueva, filas del corpus)
+# antes de publicarla: correccion.py guarda ahí su diccionario ya armado, así
+# los lectores lo encuentran junto con la matriz
+_al_construir: List[Callable[["IndiceSimilares", str, list], None]] = []
+
+
+def registrar_al_construir(funcion: Callable[["IndiceSimilares", str, list], None]):
+    if funcion not in _al_construir:
+        _al_construir.append(funcion)
+
+
+@contextmanager
+def _bloqueo_archivo(ruta: str, lock_hilos: threading.Lock) -> Iterator[None]:
+    """
+    Exclusión entre hilos (lock) y entre procesos (flock sobre `ruta`): dos
+    ingestas, o la app y vocabulario.py, pueden reconstruir a la vez.
+    """
+    with lock_hilos:
+        if fcntl is None:
+            yield
+            return
+        with open(ruta, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _numero_version(nombre: str) -> Optional[int]:
+    try:
+        return int(nombre[1:]) if nombre.startswith("v") else None
+    except ValueError:
+        return None
+
+
+class IndiceSimilares:
+    """
+    Matriz TF-IDF del vocabulario de un índice + consultas top-k por coseno.
+    """
+
+    ARCHIVOS = ("indptr.npy", "indices.npy", "datos.npy", "idf.npy")
+
+    def __init__(self, carpeta: str):
+        self.carpeta = carpeta
+        self.corpus = CorpusTerminos(carpeta)
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+        self._lock_construir = threading.Lock()
+        self._lock_pendiente = threading.Lock()
+        self._pendiente = False
+        self._hilo: Optional[threading.Thread] = None
+        self.indptr = self.indices = self.datos = self.idf = None
+        self.vocabulario: Dict[str, int] = {}
+        self.terminos: List[dict] = []
+        self._por_id: Dict[str, int] = {}
+        self._por_nombre: Dict[str, int] = {}
+
+    # ------------------------------------------------------------------
+    # Construcción
+    # ------------------------------------------------------------------
+    def construir(self, forzar: bool = False) -> int:
+        """
+        Arma la matriz desde el corpus y la publica en una carpeta versionada
+        (los lectores cambian de versión al ver el nuevo puntero ACTUAL).
+        Armar, publicar y limpiar van bajo un bloqueo entre procesos. Sin
+        `forzar` no se hace nada si el corpus no cambió desde la versión publicada
+        (otra reconstrucción ya incluyó estos términos).
+        """
+        with _bloqueo_archivo(os.path.join(self.carpeta, "construir.lock"), self._lock_construir):
+            n_docs = self._construir(forzar)
+        if n_docs is None:
+            return self.corpus.contar()
+        return n_docs
+
+    def _version_publicada(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.carpeta, "ACTUAL")) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return version if os.path.isdir(os.path.join(self.carpeta, version)) else None
+
+    def _construir(self, forzar: bool) -> Optional[int]:
+        """Devuelve el número de términos, o None si no hizo falta reconstruir."""
+        marca = self.corpus.marca()
+        publicada = self._version_publicada()
+        if publicada and not forzar:
+            try:
+                with open(os.path.join(self.carpeta, publicada, "marca")) as f:
+                    if f.read() == marca:
+                        return None
+            except FileNotFoundError:
+                pass
+
+        filas = self.corpus.filas()
+        vocabulario: Dict[str, int] = {}
+        indptr = [0]
+        indices: List[int] = []
+        conteos: List[int] = []
+        terminos = []
+        for doc_id, padre, hijo, tokens in filas:
+            frecuencias: Dict[int, int] = {}
+            for t in tokens.split():
+                col = vocabulario.setdefault(t, len(vocabulario))
+                frecuencias[col] = frecuencias.get(col, 0) + 1
+            indices.extend(frecuencias.keys())
+            conteos.extend(frecuencias.values())
+            indptr.append(len(indices))
+            terminos.append({"id": doc_id, "term_parent": padre, "term_child": hijo})
+
+        indptr_a = np.asarray(indptr, dtype=np.int64)
+        indices_a = np.asarray(indices, dtype=np.int32)
+        n_docs = len(filas)
+        df = np.bincount(indices_a, minlength=len(vocabulario)).astype(np.float32)
+        idf = (np.log((1 + n_docs) / (1 + df)) + 1).astype(np.float32)
+        datos = (1 + np.log(np.asarray(conteos, dtype=np.float32))) * idf[indices_a]
+        normas = np.sqrt(_suma_por_fila(datos * datos, indptr_a))
+        normas[normas == 0] = 1
+        datos = (datos / np.repeat(normas, np.diff(indptr_a))).astype(np.float32)
+
+        version = f"v{time.time_ns()}"
+        destino = os.path.join(self.carpeta, version)
+        os.makedirs(destino)
+        np.save(os.path.join(destino, "indptr.npy"), indptr_a)
+        np.save(os.path.join(destino, "indices.npy"), indices_a)
+        np.save(os.path.join(destino, "datos.npy"), datos)
+        np.save(os.path.join(destino, "idf.npy"), idf)
+        with open(os.path.join(destino, "vocabulario.json"), "w", encoding="utf-8") as f:
+            json.dump(vocabulario, f, ensure_ascii=False)
+        with open(os.path.join(destino, "terminos.json"), "w", encoding="utf-8") as f:
+            json.dump(terminos, f, ensure_ascii=False)
+        # La marca se toma antes de leer las filas: si entraron términos mientras
+        # tanto, la próxima reconstrucción no se salta
+        with open(os.path.join(destino, "marca"), "w") as f:
+            f.write(marca)
+
+        for funcion in _al_construir:
+            try:
+                funcion(self, destino, filas)
+            except Exception as e:
+                print("[SIMILARES] Error preparando la versión nueva:", repr(e))
+
+        puntero = os.path.join(self.carpeta, "ACTUAL")
+        with open(puntero + ".tmp", "w") as f:
+            f.write(version)
+        os.replace(puntero + ".tmp", puntero)
+
+        # Versiones anteriores a la publicada: los procesos que aún las tengan
+        # abiertas con mmap siguen leyendo bien (en Linux el archivo vive hasta
+        # que se cierra). Nunca se borra una más nueva que la propia.
+        numero = _numero_version(version)
+        for nombre in os.listdir(self.carpeta):
+            otra = _numero_version(nombre)
+            if otra is not None and otra < numero:
+                shutil.rmtree(os.path.join(self.carpeta, nombre), ignore_errors=True)
+
+        print(f"[SIMILARES] Matriz TF-IDF: {n_docs} términos x {len(vocabulario)} tokens "
+              f"({len(indices_a)} no nulos) en {self.carpeta}")
+        return n_docs
+
+    def actualizar(self, documentos: Iterable[dict], esperar: bool = False) -> int:
+        """
+        Tras una ingesta: guarda los términos nuevos o modificados y pide una
+        reconstrucción. Con `esperar` se reconstruye aquí mismo (scripts); si
+        no, la hace el hilo de `programar_reconstruccion`.
+        """
+        n = self.corpus.actualizar(documentos)
+        if n:
+            if esperar:
+                self.construir()
+            else:
+                self.programar_reconstruccion()
+        return n
+
+    def programar_reconstruccion(self):
+        """
+        Marca la matriz como pendiente y arranca (si no está corriendo) el hilo
+        que la reconstruye: varias ingestas seguidas quedan en una sola pasada.
+        """
+        with self._lock_pendiente:
+            self._pendiente = True
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._reconstructor, daemon=True,
+                                              name=f"similares-{os.path.basename(self.carpeta)}")
+                self._hilo.start()
+
+    def _reconstructor(self):
+        while True:
+            time.sleep(SIMILARES_ESPERA)
+            with self._lock_pendiente:
+                if not self._pendiente:
+                    self._hilo = None
+                    return
+                self._pendiente = False
+            try:
+                self.construir()
+            except Exception as e:
+                print("[SIMILARES] Error reconstruyendo la matriz:", repr(e))
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+    def _cargar(self) -> bool:
+        try:
+            with open(os.path.join(self.carpeta, "ACTUAL")) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return False
+        if version == self._version:
+            return True
+
+        with self._lock:
+            if version == self._version:
+                return True
+            origen = os.path.join(self.carpeta, version)
+            try:
+                indptr, indices, datos, idf = (
+                    np.load(os.path.join(origen, a), mmap_mode="r") for a in self.ARCHIVOS
+                )
+                with open(os.path.join(origen, "vocabulario.json"), encoding="utf-8") as f:
+                    vocabulario = json.load(f)
+                with open(os.path.join(origen, "terminos.json"), encoding="utf-8") as f:
+                    terminos = json.load(f)
+            except FileNotFoundError:
+                # Otra reconstrucción la reemplazó mientras se leía
+                return self._version is not None
+
+            self.indptr, self.indices, self.datos, self.idf = indptr, indices, datos, idf
+            self.vocabulario = vocabulario
+            self.terminos = terminos
+            self._por_id = {t["id"]: i for i, t in enumerate(terminos)}
+            self._por_nombre = {}
+            for i, t in enumerate(terminos):
+                self._por_nombre.setdefault(nombre_termino(t), i)
+            self._version = version
+        return True
+
+    def _vector_texto(self, texto: str) -> Tuple[np.ndarray, np.ndarray]:
+        frecuencias: Dict[int, int] = {}
+        for t in tokenizar(texto, 2):
+            col = self.vocabulario.get(t)
+            if col is not None and t not in STOPWORDS:
+                frecuencias[col] = frecuencias.get(col, 0) + 1
+        cols = np.fromiter(frecuencias.keys(), dtype=np.int64, count=len(frecuencias))
+        vals = (1 + np.log(np.fromiter(frecuencias.values(), dtype=np.float32,
+                                       count=len(frecuencias)))) * self.idf[cols]
+        norma = float(np.sqrt(np.dot(vals, vals))) or 1.0
+        return cols, (vals / norma).astype(np.float32)
+
+    def similares(self, termino: str, k: int = 10) -> Optional[Dict]:
+        """
+        Los `k` términos más parecidos a `termino` (id, nombre exacto sin
+        tildes, o texto libre). None si la matriz aún no se ha construido.
+        """
+        if not self._cargar():
+            return None
+
+        fila = self._por_id.get(termino)
+        if fila is None:
+            fila = self._por_nombre.get(plegar_acentos(termino).strip())
+        if fila is not None:
+            ini, fin = int(self.indptr[fila]), int(self.indptr[fila + 1])
+            cols, vals = np.asarray(self.indices[ini:fin]), np.asarray(self.datos[ini:fin])
+            buscado_por = "termino"
+        else:
+            cols, vals = self._vector_texto(termino)
+            buscado_por = "texto"
+
+        consulta = np.zeros(len(self.vocabulario), dtype=np.float32)
+        consulta[cols] = vals
+        puntajes = _suma_por_fila(self.datos * consulta[self.indices], self.indptr)
+        if fila is not None:
+            puntajes[fila] = 0
+
+        k = max(1, min(k, len(puntajes)))
+        candidatos = np.argpartition(-puntajes, k - 1)[:k] if len(puntajes) > k else np.arange(len(puntajes))
+        candidatos = candidatos[np.argsort(-puntajes[candidatos])]
+        return {
+            "termino": self.terminos[fila] if fila is not None else {"texto": termino},
+            "buscado_por": buscado_por,
+            "similares": [
+                {**self.terminos[i], "score": round(float(puntajes[i]), 4)}
+                for i in candidatos if puntajes[i] > 0
+            ],
+        }
+
+
+_indices: Dict[str, IndiceSimilares] = {}
+
+
+def indice_similares(indice: str) -> IndiceSimilares:
+    if indice not in _indices:
+        # El nombre se vuelve una carpeta: nada de rutas relativas ni separadores
+        if not nombre_indice_valido(indice):
+            raise ValueError(f"Nombre de índice no válido: {indice!r}")
+        _indices[indice] = IndiceSimilares(os.path.join(SIMILARES_DIR, indice))
+    return _indices[indice]
+
+
+def reconstruir_desde_elastic(elastic, indice: str) -> int:
+    """
+    Reconstrucción completa (offline): lee todos los términos del índice.
+    """
+    similar = indice_similares(indice)
+    similar.corpus.vaciar()
+    lote = []
+    for doc in elastic.recorrer_documentos(indice, campos=list(CAMPOS_TERMINO)):
+        lote.append(doc)
+        if len(lote) >= 1000:
+            similar.corpus.actualizar(lote)
+            lote = []
+    similar.corpus.actualizar(lote)
+    return similar.construir(forzar=True)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from elastic import ElasticSearch
+
+    import correccion  # noqa: F401  (guarda el diccionario junto a la matriz)
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Reconstruye la matriz TF-IDF de términos similares")
+    parser.add_argument("--indice", default="lenguaje_controlado")
+    args = parser.parse_args()
+    t0 = time.perf_counter()
+    n = reconstruir_desde_elastic(ElasticSearch(), args.indice)
+    print(f"{n} términos en {time.perf_counter() - t0:.1f}s")
@@ -0,0 +1,32 @@
+# texto.py
+"""
+Normalización de texto compartida (deduplicación, similares, corrección).
+
+Las búsquedas en español llegan con y sin tildes ("genero" / "género"), así
+que todo lo que compara texto por fuera de Elastic usa la misma forma plegada:
+minúsculas, sin tildes ni diéresis, y solo letras y dígitos.
+"""
+import re
+import unicodedata
+from typing import List
+
+_NO_ALFANUMERICO = re.compile(r"[^0-9a-zñ]+")
+
+
+def plegar_acentos(texto: str) -> str:
+    """
+    "Género Niñez" -> "genero niñez" (la ñ se conserva: cambia la palabra).
+    """
+    texto = (texto or "").lower().replace("ñ", "\0")
+    sin_tildes = "".join(
+        c for c in unicodedata.normalize("NFD", texto)
+        if unicodedata.category(c) != "Mn"
+    )
+    return sin_tildes.replace("\0", "ñ")
+
+
+def tokenizar(texto: str, min_largo: int = 1) -> List[str]:
+    """
+    Palabras plegadas de un texto.
+    """
+    return [t for t in _NO_ALFANUMERICO.split(plegar_acentos(texto)) if len(t) >= min_largo]
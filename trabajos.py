@@ -0,0 +1,248 @@
+# trabajos.py
+"""
+Cola local de trabajos de ingesta en segundo plano.
+
+La carga de archivos y el web scraping pueden tardar minutos, así que en vez
+de hacerlos dentro del POST se envían como trabajos a un pool de hilos del
+propio worker. El estado y el progreso de cada trabajo se guardan en SQLite
+para poder consultarlos desde /api/jobs/<id> (desde cualquier worker).
+"""
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+TRABAJOS_DB = os.getenv("TRABAJOS_DB", os.path.join("/tmp", "trabajos_ingesta.sqlite"))
+MAX_TRABAJOS_SIMULTANEOS = int(os.getenv("INGESTA_MAX_TRABAJOS", "2"))
+# Cada cuántos segundos se guarda el progreso en SQLite mientras corre el trabajo
+INTERVALO_GUARDADO = 1.0
+
+CONTADORES = (
+    "archivos_total",
+    "archivos_procesados",
+    "docs_parseados",
+    "docs_indexados",
+    "docs_omitidos",
+    "docs_duplicados",
+    "errores",
+)
+
+_SQL_CREAR = """
+CREATE TABLE IF NOT EXISTS trabajos (
+    id TEXT PRIMARY KEY,
+    tipo TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    usuario TEXT,
+    indice TEXT,
+    pid INTEGER,
+    creado REAL NOT NULL,
+    iniciado REAL,
+    terminado REAL,
+    archivos_total INTEGER DEFAULT 0,
+    archivos_procesados INTEGER DEFAULT 0,
+    docs_parseados INTEGER DEFAULT 0,
+    docs_indexados INTEGER DEFAULT 0,
+    docs_omitidos INTEGER DEFAULT 0,
+    docs_duplicados INTEGER DEFAULT 0,
+    errores INTEGER DEFAULT 0,
+    mensaje TEXT
+)
+"""
+
+
+class Progreso:
+    """
+    Contadores de un trabajo en curso. Se acumulan en memoria y se guardan en
+    SQLite como mucho una vez por INTERVALO_GUARDADO para no escribir por documento.
+    """
+
+    def __init__(self, gestor: "GestorTrabajos", job_id: str):
+        self.gestor = gestor
+        self.job_id = job_id
+        self.valores = {c: 0 for c in CONTADORES}
+        self.mensaje: Optional[str] = None
+        self._ultimo_guardado = 0.0
+        self._lock = threading.Lock()
+
+    def sumar(self, campo: str, n: int = 1):
+        with self._lock:
+            self.valores[campo] += n
+        self._guardar_si_toca()
+
+    def fijar(self, campo: str, valor: int):
+        with self._lock:
+            self.valores[campo] = valor
+        self._guardar_si_toca()
+
+    def nota(self, mensaje: str):
+        self.mensaje = mensaje
+        self._guardar_si_toca()
+
+    def _guardar_si_toca(self):
+        ahora = time.monotonic()
+        if ahora - self._ultimo_guardado >= INTERVALO_GUARDADO:
+            self._ultimo_guardado = ahora
+            self.guardar()
+
+    def guardar(self, **campos):
+        with self._lock:
+            datos = dict(self.valores)
+        if self.mensaje is not None:
+            datos["mensaje"] = self.mensaje
+        datos.update(campos)
+        self.gestor._actualizar(self.job_id, **datos)
+
+
+class GestorTrabajos:
+    """
+    Pool de hilos para trabajos de ingesta + estado persistido en SQLite.
+    """
+
+    def __init__(self, ruta_db: str = TRABAJOS_DB,
+                 max_trabajos: int = MAX_TRABAJOS_SIMULTANEOS):
+        self.ruta_db = ruta_db
+        self.max_trabajos = max_trabajos
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._crear_tabla()
+
+    # ------------------------------------------------------------------
+    # SQLite
+    # ------------------------------------------------------------------
+    @contextmanager
+    def _conectar(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.ruta_db, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:  # commit / rollback
+                yield conn
+        finally:
+            conn.close()
+
+    def _crear_tabla(self):
+        with self._conectar() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SQL_CREAR)
+            # Bases creadas con versiones anteriores: agregar contadores nuevos
+            existentes = {fila["name"] for fila in conn.execute("PRAGMA table_info(trabajos)")}
+            for columna in CONTADORES:
+                if columna not in existentes:
+                    conn.execute(f"ALTER TABLE trabajos ADD COLUMN {columna} INTEGER DEFAULT 0")
+
+    def _actualizar(self, job_id: str, **campos):
+        if not campos:
+            return
+        columnas = ", ".join(f"{c}=?" for c in campos)
+        with self._conectar() as conn:
+            conn.execute(
+                f"UPDATE trabajos SET {columnas} WHERE id=?",
+                (*campos.values(), job_id),
+            )
+
+    # ------------------------------------------------------------------
+    # Pool (uno por proceso: tras el fork de gunicorn se crea de nuevo)
+    # ------------------------------------------------------------------
+    def _obtener_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pid != os.getpid():
+                    self._pool = ThreadPoolExecutor(
+                        max_workers=self.max_trabajos,
+                        thread_name_prefix="ingesta",
+                    )
+                    self._pid = os.getpid()
+        return self._pool
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+    def enviar(self, tipo: str, funcion: Callable[..., Optional[str]],
+               usuario: Optional[str] = None, indice: Optional[str] = None,
+               **parametros) -> str:
+        """
+        Registra un trabajo y lo pone en la cola. Devuelve su id de inmediato.
+
+        `funcion(progreso, **parametros)` corre en el pool; puede devolver un
+        mensaje final para mostrar al usuario.
+        """
+        job_id = uuid.uuid4().hex
+        with self._conectar() as conn:
+            conn.execute(
+                "INSERT INTO trabajos (id, tipo, estado, usuario, indice, pid, creado) "
+                "VALUES (?, ?, 'pendiente', ?, ?, ?, ?)",
+                (job_id, tipo, usuario, indice, os.getpid(), time.time()),
+            )
+        self._obtener_pool().submit(self._ejecutar, job_id, funcion, parametros)
+        return job_id
+
+    def _ejecutar(self, job_id: str, funcion: Callable, parametros: Dict):
+        progreso = Progreso(self, job_id)
+        self._actualizar(job_id, estado="en_proceso", iniciado=time.time())
+        try:
+            mensaje = funcion(progreso, **parametros)
+            if mensaje:
+                progreso.mensaje = mensaje
+            estado = "terminado_con_errores" if progreso.valores["errores"] else "terminado"
+            progreso.guardar(estado=estado, terminado=time.time())
+        except Exception as e:
+            print(f"[TRABAJOS] Error en trabajo {job_id}:", repr(e))
+            traceback.print_exc()
+            progreso.mensaje = f"Error: {e}"
+            progreso.guardar(estado="fallido", terminado=time.time())
+
+    def obtener(self, job_id: str) -> Optional[Dict]:
+        """
+        Estado de un trabajo, con la tasa de documentos indexados por segundo.
+        """
+        with self._conectar() as conn:
+            fila = conn.execute("SELECT * FROM trabajos WHERE id=?", (job_id,)).fetchone()
+        if fila is None:
+            return None
+
+        trabajo = dict(fila)
+        if trabajo["estado"] in ("pendiente", "en_proceso") and not _proceso_vivo(trabajo["pid"]):
+            # El worker que lo corría se reinició: el trabajo quedó a medias
+            trabajo["estado"] = "interrumpido"
+            self._actualizar(job_id, estado="interrumpido")
+
+        inicio = trabajo.get("iniciado")
+        fin = trabajo.get("terminado") or time.time()
+        duracion = (fin - inicio) if inicio else 0.0
+        trabajo["duracion_s"] = round(duracion, 2)
+        trabajo["docs_por_segundo"] = (
+            round(trabajo["docs_indexados"] / duracion, 2) if duracion > 0 else 0.0
+        )
+        trabajo["activo"] = trabajo["estado"] in ("pendiente", "en_proceso")
+        return trabajo
+
+    def listar(self, limite: int = 20, usuario: Optional[str] = None):
+        """
+        Últimos trabajos registrados (opcionalmente de un usuario).
+        """
+        sql = "SELECT id FROM trabajos"
+        params = ()
+        if usuario:
+            sql += " WHERE usuario=?"
+            params = (usuario,)
+        sql += " ORDER BY creado DESC LIMIT ?"
+        with self._conectar() as conn:
+            ids = [r["id"] for r in conn.execute(sql, (*params, int(limite)))]
+        return [self.obtener(i) for i in ids]
+
+
+def _proceso_vivo(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+        return True
+    except PermissionError:
+        return True
+    except OSError:
+        return False
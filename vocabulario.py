@@ -0,0 +1,210 @@
+# vocabulario.py
+"""
+Carga del lenguaje controlado desde la hoja "Diccionario" del Excel de SDMujer.
+
+Antes el índice se armaba en un cuaderno (iterrows sobre link_1/link_2/link_3
+y parsing de URLs fila por fila) y el JSON resultante se subía a mano por
+admin_carga_archivos. Aquí todo es un comando: la hoja se lee con pandas, las
+URLs se separan y normalizan con operaciones vectorizadas (str.split + explode)
+y cada término sale con la forma term_parent / term_child / related_terms /
+definition directo a Elastic por _bulk, como actualización parcial: los campos
+que agrega la ingesta web (pdf_text, pasajes, duplicados) no se pierden.
+
+Los ids son los mismos de la carga web (ingesta.id_documento) y el manifiesto
+evita reenviar términos que no cambiaron, así que se puede correr cuantas
+veces se quiera:
+    python vocabulario.py "Lenguaje controlado.xlsx" --indice lenguaje_controlado
+    python vocabulario.py "Lenguaje controlado.xlsx" --salida terminos.jsonl
+"""
+import argparse
+import json
+import os
+import time
+from typing import Iterator, List
+
+import pandas as pd
+
+import correccion  # noqa: F401  (rehace el corrector al publicar la matriz)
+import ingesta
+import respuestas
+import similares
+
+HOJA_DICCIONARIO = "Diccionario"
+TAMANO_LOTE_BULK = int(os.getenv("TAMANO_LOTE_BULK", "500"))
+
+# Encabezados de la hoja -> nombres cortos (como en el cuaderno de SDMujer)
+RENOMBRAR_COLUMNAS = {
+    "definicion_termino": "definicion_1",
+    "fuente_termino": "fuente_1",
+    "link_fuente_termino_": "link_1",
+    "definicion_termino2": "definicion_2",
+    "fuente_termino_2": "fuente_2",
+    "link_fuente_termino_2": "link_2",
+    "definicion_termino3": "definicion_3",
+    "fuente_termino_3": "fuente_3",
+    "link_fuente_termino_3": "link_3",
+}
+COLUMNAS_LINK = ["link_1", "link_2", "link_3"]
+COLUMNAS_DEFINICION = ["definicion_1", "definicion_2", "definicion_3"]
+COLUMNAS_FUENTE = ["fuente_1", "fuente_2", "fuente_3"]
+COLUMNAS_DOCUMENTO = {
+    "termino_padre": "term_parent",
+    "termino_hijo": "term_child",
+    "terminos_relacionados": "related_terms",
+}
+# Campos del documento que salen del Excel (el resto los pone la ingesta web)
+CAMPOS_VOCABULARIO = [
+    *COLUMNAS_DOCUMENTO.values(), *COLUMNAS_DEFINICION, *COLUMNAS_FUENTE,
+    "definition", "source_urls", "source_fields",
+]
+
+
+def leer_diccionario(ruta: str, hoja: str = HOJA_DICCIONARIO) -> pd.DataFrame:
+    """
+    Hoja del vocabulario con columnas renombradas. Acepta también un CSV
+    exportado de la misma hoja.
+    """
+    if ruta.lower().endswith(".csv"):
+        df = pd.read_csv(ruta, dtype=str)
+    else:
+        df = pd.read_excel(ruta, sheet_name=hoja, dtype=str)
+    df = df.rename(columns=lambda c: str(c).strip()).rename(columns=RENOMBRAR_COLUMNAS)
+    for columna in [*COLUMNAS_DOCUMENTO, *COLUMNAS_LINK, *COLUMNAS_DEFINICION, *COLUMNAS_FUENTE]:
+        if columna not in df.columns:
+            df[columna] = pd.NA
+    return df
+
+
+def _limpiar(serie: pd.Series) -> pd.Series:
+    """Texto sin espacios repetidos; vacío -> NA."""
+    limpia = serie.astype("string").str.replace(r"\s+", " ", regex=True).str.strip()
+    return limpia.mask(limpia == "")
+
+
+def urls_pdf(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Una fila por (término, URL de PDF) encontrada en link_1..link_3, con
+    `origen_link`. Una celda puede traer varias URLs separadas por espacios
+    o saltos de línea. Vale como PDF lo que termina en .pdf (sin ?/#) y las
+    normas del gestor normativo de Función Pública (norma.php / norma_pdf.php).
+    """
+    largo = df[COLUMNAS_LINK].reset_index(names="fila").melt(
+        id_vars="fila", var_name="origen_link", value_name="url"
+    )
+    largo["url"] = largo["url"].astype("string").str.split()
+    largo = largo.explode("url").dropna(subset=["url"])
+    largo["url"] = largo["url"].str.strip("\"',;")
+
+    base = largo["url"].str.replace(r"[?#].*$", "", regex=True).str.lower()
+    es_http = largo["url"].str.match(r"https?://")
+    es_pdf = base.str.endswith(".pdf")
+    es_norma = (
+        base.str.contains("funcionpublica.gov.co", regex=False)
+        & base.str.contains("/eva/gestornormativo/", regex=False)
+        & base.str.contains(r"norma(?:_pdf)?\.php", regex=True)
+    )
+    largo = largo[es_http & (es_pdf | es_norma)]
+    return largo.drop_duplicates(["fila", "url"]).sort_values(["fila", "origen_link"])
+
+
+def documentos_vocabulario(df: pd.DataFrame) -> Iterator[dict]:
+    """
+    Un documento por término, con la definición unificada y las URLs de sus
+    fuentes (`source_urls`, `source_fields`). Las filas sin nombre de término
+    se descartan.
+    """
+    base = pd.DataFrame(index=df.index)
+    for origen, destino in COLUMNAS_DOCUMENTO.items():
+        base[destino] = _limpiar(df[origen])
+    for columna in COLUMNAS_DEFINICION + COLUMNAS_FUENTE:
+        base[columna] = _limpiar(df[columna])
+    base["definition"] = (
+        base[COLUMNAS_DEFINICION].fillna("").agg(" ".join, axis=1)
+        .str.replace(r"\s+", " ", regex=True).str.strip()
+    )
+    base = base[base["term_parent"].notna() | base["term_child"].notna()]
+
+    urls = urls_pdf(df.loc[base.index])
+    agrupadas = urls.groupby("fila").agg(source_urls=("url", list), source_fields=("origen_link", list))
+    base = base.join(agrupadas)
+
+    for fila in base.to_dict("records"):
+        # NaN/NA de pandas no son JSON válido: esos campos no se envían
+        yield {k: v for k, v in fila.items() if isinstance(v, list) or not pd.isna(v)}
+
+
+def como_actualizacion(documentos: Iterator[dict]) -> Iterator[dict]:
+    """
+    Cada término como actualización parcial con upsert: se reemplazan solo los
+    campos del Excel (los que quedaron vacíos van en null para borrar el valor
+    anterior) y se conservan pdf_text, pdf_resumen, num_pasajes y duplicados.
+    """
+    for doc in documentos:
+        actualizacion = dict.fromkeys(CAMPOS_VOCABULARIO)
+        actualizacion.update(doc)
+        actualizacion["_op"] = "upsert"
+        yield actualizacion
+
+
+def indexar_vocabulario(elastic, documentos, indice: str, forzar: bool = False) -> dict:
+    """
+    Envía los términos por _bulk (solo los nuevos o modificados según el
+    manifiesto, ver `como_actualizacion`) y actualiza la matriz de similares y
+    el corrector.
+    """
+    sesion = ingesta.ManifiestoIngesta().sesion(indice, forzar=forzar)
+    terminos: List[dict] = []
+
+    def anotar_terminos(docs):
+        for doc in docs:
+            terminos.append({c: doc.get(c) for c in ("_id",) + similares.CAMPOS_TERMINO})
+            yield doc
+
+    def al_enviar_lote(n_docs, errores):
+        print(f"[VOCABULARIO] Lote de {n_docs} términos ({errores} con error)")
+
+    elastic.crear_indice(indice)
+    resultado = elastic.indexar_en_lotes(
+        indice,
+        como_actualizacion(anotar_terminos(sesion.filtrar(documentos))),
+        tamano_lote=TAMANO_LOTE_BULK,
+        al_enviar_lote=al_enviar_lote,
+        al_confirmar_ids=sesion.confirmar,
+    )
+    # Las búsquedas cacheadas en el navegador (ETag) dejan de valer
+    if resultado["enviados"]:
+        respuestas.nueva_generacion(indice)
+    if terminos:
+        # Script de una pasada: se reconstruye aquí (el corrector se rehace al publicar)
+        similares.indice_similares(indice).actualizar(terminos, esperar=True)
+    resultado["omitidos"] = sesion.omitidos
+    return resultado
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Carga el lenguaje controlado desde el Excel a Elastic")
+    parser.add_argument("ruta", help="Excel (o CSV) con la hoja del diccionario")
+    parser.add_argument("--hoja", default=HOJA_DICCIONARIO)
+    parser.add_argument("--indice", default="lenguaje_controlado")
+    parser.add_argument("--forzar", action="store_true", help="reenviar aunque no hayan cambiado")
+    parser.add_argument("--salida", help="escribir JSON Lines en vez de enviar a Elastic")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    docs = documentos_vocabulario(leer_diccionario(args.ruta, args.hoja))
+    if args.salida:
+        n = 0
+        with open(args.salida, "w", encoding="utf-8") as f:
+            for doc in docs:
+                f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+                n += 1
+        print(f"{n} términos escritos en {args.salida} en {time.perf_counter() - t0:.1f}s")
+    else:
+        from elastic import ElasticSearch
+
+        resultado = indexar_vocabulario(ElasticSearch(), docs, args.indice, forzar=args.forzar)
+        print(f"{resultado['enviados']} términos enviados, {resultado['omitidos']} sin cambios, "
+              f"{resultado['errores']} con error en {time.perf_counter() - t0:.1f}s")
@@ -1,116 +1,466 @@
 # webscraping_helper.py
+import hashlib
+import io
+import itertools
 import os
 import tempfile
-from typing import List
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import Dict, Iterable, Iterator, List, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin
-from PyPDF2 import PdfReader
+from urllib.parse import urljoin, urlparse, unquote
+
+from cache_http import CacheHTTP, cache_global
+from crawler import CRAWLER_MAX_PAGINAS, CRAWLER_MAX_PROFUNDIDAD, Crawler
+from extraccion_pdf import PDF_MEMORIA_MAX, documentos_desde_pdfs
+
+# ================== DESCARGAS CONCURRENTES ==================
+DESCARGA_MAX_HILOS = int(os.getenv("DESCARGA_MAX_HILOS", "8"))
+DESCARGA_MAX_POR_HOST = int(os.getenv("DESCARGA_MAX_POR_HOST", "4"))
+DESCARGA_MAX_BYTES = int(os.getenv("DESCARGA_MAX_MB", "50")) * 1024 * 1024
+# Límites de la carpeta de descargas permanentes (ver `podar_descargas`)
+DESCARGA_CARPETA_MAX_BYTES = int(os.getenv("DESCARGA_CARPETA_MAX_MB", "2048")) * 1024 * 1024
+DESCARGA_RETENER_DIAS = float(os.getenv("DESCARGA_RETENER_DIAS", "30"))
+TAMANO_CHUNK = 64 * 1024
+
+# Content-Type aceptados por extensión. Muchos servidores públicos responden
+# octet-stream para todo, así que ese también se acepta.
+CONTENT_TYPES = {
+    "pdf": ("application/pdf", "application/x-pdf"),
+    "docx": ("application/vnd.openxmlformats-officedocument.wordprocessingml.document",),
+    "doc": ("application/msword",),
+    "txt": ("text/plain",),
+}
+CONTENT_TYPES_GENERICOS = ("application/octet-stream", "binary/octet-stream", "application/download")
+
+HEADERS_DESCARGA = {
+    "User-Agent": "Mozilla/5.0 (compatible; LenguajeControladoBot/1.0)",
+}
+
+
+def crear_sesion(max_conexiones: int = DESCARGA_MAX_HILOS) -> requests.Session:
+    """
+    Sesión HTTP compartida (keep-alive) con un pool de conexiones del tamaño
+    del pool de hilos, para no abrir una conexión TLS nueva por archivo.
+    """
+    sesion = requests.Session()
+    adaptador = HTTPAdapter(pool_connections=max_conexiones, pool_maxsize=max_conexiones)
+    sesion.mount("http://", adaptador)
+    sesion.mount("https://", adaptador)
+    sesion.headers.update(HEADERS_DESCARGA)
+    return sesion
+
+
+def nombre_desde_url(url: str, por_defecto: str = "documento.pdf") -> str:
+    """
+    Nombre de archivo a partir de la URL (sin query string y decodificado).
+    """
+    nombre = unquote(urlparse(url).path.rsplit("/", 1)[-1])
+    nombre = nombre.replace(os.sep, "_").strip()
+    return nombre or por_defecto
+
+
+def archivo_para_url(url: str, nombre: Optional[str] = None) -> str:
+    """
+    Nombre en disco para la descarga de una URL: un hash de la URL completa
+    más su nombre legible. Dos sitios con el mismo `informe.pdf` no se pisan y
+    la misma URL cae siempre en el mismo archivo (para revalidarla con 304).
+    """
+    clave = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+    # Los sistemas de archivos limitan el nombre a 255 bytes: se conserva el final (extensión)
+    return f"{clave}_{(nombre or nombre_desde_url(url))[-120:]}"
+
+
+def podar_descargas(carpeta: str, max_bytes: int = DESCARGA_CARPETA_MAX_BYTES,
+                    retener_dias: float = DESCARGA_RETENER_DIAS) -> int:
+    """
+    Borra de la carpeta de descargas los archivos sin usar hace más de
+    `retener_dias` y, si aún supera `max_bytes`, los usados hace más tiempo.
+    Un archivo borrado solo obliga a descargarlo completo la próxima vez (la
+    caché HTTP revisa que exista). Devuelve cuántos se borraron.
+    """
+    archivos = []
+    with os.scandir(carpeta) as entradas:
+        for entrada in entradas:
+            if entrada.is_file():
+                info = entrada.stat()
+                archivos.append((info.st_mtime, info.st_size, entrada.path))
+    archivos.sort()
+    limite = time.time() - retener_dias * 86400
+    total = sum(tam for _, tam, _ in archivos)
+    borrados = 0
+    for usado, tam, ruta in archivos:
+        if usado >= limite and total <= max_bytes:
+            break
+        try:
+            os.remove(ruta)
+        except OSError:
+            continue
+        total -= tam
+        borrados += 1
+    return borrados
+
+
+class DescargadorArchivos:
+    """
+    Descarga archivos en paralelo con un pool de hilos acotado.
+
+    - Una sola sesión HTTP compartida.
+    - Límite de descargas simultáneas por host (para no tumbar al servidor).
+    - Lee por chunks: los archivos pequeños se quedan en memoria y los grandes
+      se van escribiendo a disco, nunca se cargan completos en RAM.
+    - Aborta apenas el tamaño supera `max_bytes` (por Content-Length o al ir leyendo).
+    - Rechaza respuestas cuyo Content-Type no corresponde (p. ej. una página HTML de error).
+    - Con `cache` (CacheHTTP) revalida con ETag / Last-Modified en vez de
+      volver a descargar lo que no cambió.
+    """
+
+    def __init__(self, max_hilos: int = DESCARGA_MAX_HILOS,
+                 max_por_host: int = DESCARGA_MAX_POR_HOST,
+                 max_bytes: int = DESCARGA_MAX_BYTES,
+                 timeout: float = 40,
+                 sesion: Optional[requests.Session] = None,
+                 cache: Optional[CacheHTTP] = None):
+        self.max_hilos = max_hilos
+        self.max_por_host = max_por_host
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.sesion = sesion or crear_sesion(max_hilos)
+        self.cache = cache
+        self._semaforos: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _semaforo_host(self, url: str) -> threading.BoundedSemaphore:
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            if host not in self._semaforos:
+                self._semaforos[host] = threading.BoundedSemaphore(self.max_por_host)
+            return self._semaforos[host]
+
+    def _content_type_valido(self, url: str, content_type: str) -> bool:
+        content_type = (content_type or "").split(";")[0].strip().lower()
+        if not content_type or content_type in CONTENT_TYPES_GENERICOS:
+            return True
+        ext = urlparse(url).path.rsplit(".", 1)[-1].lower()
+        esperados = CONTENT_TYPES.get(ext)
+        if esperados is None:
+            return not content_type.startswith("text/html")
+        return content_type in esperados
+
+    def descargar(self, url: str, carpeta_destino: str,
+                  nombre: Optional[str] = None,
+                  en_memoria_hasta: int = 0,
+                  saltar_sin_cambios: bool = False) -> dict:
+        """
+        Descarga una URL. Devuelve un dict con url, nombre, ruta, contenido,
+        bytes, sha256, content_type, no_modificado y error (None si todo salió bien).
+
+        Si el archivo mide hasta `en_memoria_hasta` bytes se queda en memoria
+        (`contenido`) y no se escribe a disco; si es más grande se vuelca a
+        `carpeta_destino` (`ruta`) a medida que llega.
+
+        Con caché HTTP la descarga es condicional (If-None-Match / If-Modified-Since):
+          - saltar_sin_cambios=False: si el servidor responde 304 se devuelve la
+            ruta del archivo guardado la vez anterior (no_modificado=True).
+          - saltar_sin_cambios=True: si el documento no cambió desde la última vez
+            que se procesó (304 o mismo hash) se devuelve no_modificado=True sin
+            contenido, para no volver a extraerlo ni indexarlo.
+        """
+        nombre = nombre or nombre_desde_url(url)
+        resultado = {"url": url, "nombre": nombre, "ruta": None, "contenido": None,
+                     "bytes": 0, "sha256": None, "content_type": None,
+                     "no_modificado": False, "error": None}
+        ruta = os.path.join(carpeta_destino, archivo_para_url(url, nombre))
+        archivo = None
+
+        headers = {}
+        entrada = None
+        if self.cache is not None:
+            entrada = self.cache.obtener(url)
+            if saltar_sin_cambios:
+                if entrada and entrada.get("procesado_sha256") == entrada.get("sha256"):
+                    headers = self.cache.headers_condicionales(url)
+            else:
+                headers = self.cache.headers_condicionales(url, requiere_ruta=True)
+
+        with self._semaforo_host(url):
+            try:
+                with self.sesion.get(url, stream=True, timeout=self.timeout, headers=headers) as resp:
+                    if resp.status_code == 304 and entrada:
+                        self.cache.tocar(url)
+                        resultado["no_modificado"] = True
+                        resultado["sha256"] = entrada.get("sha256")
+                        resultado["bytes"] = entrada.get("bytes") or 0
+                        if not saltar_sin_cambios:
+                            resultado["ruta"] = entrada.get("ruta")
+                            # Sigue en uso: que `podar_descargas` no lo borre
+                            try:
+                                os.utime(resultado["ruta"])
+                            except (OSError, TypeError):
+                                pass
+                        return resultado
+
+                    resp.raise_for_status()
+                    content_type = resp.headers.get("Content-Type", "")
+                    resultado["content_type"] = content_type
+                    if not self._content_type_valido(url, content_type):
+                        resultado["error"] = f"Content-Type no esperado: {content_type}"
+                        return resultado
+
+                    declarado = int(resp.headers.get("Content-Length") or 0)
+                    if declarado > self.max_bytes:
+                        resultado["error"] = f"Archivo demasiado grande ({declarado} bytes)"
+                        return resultado
+
+                    buffer: Optional[io.BytesIO] = io.BytesIO()
+                    if declarado > en_memoria_hasta:
+                        archivo, buffer = open(ruta, "wb"), None
+
+                    hasher = hashlib.sha256()
+                    total = 0
+                    for chunk in resp.iter_content(chunk_size=TAMANO_CHUNK):
+                        total += len(chunk)
+                        if total > self.max_bytes:
+                            break
+                        hasher.update(chunk)
+                        if buffer is not None and total > en_memoria_hasta:
+                            # Supera el umbral: lo que ya llegó pasa a disco
+                            archivo = open(ruta, "wb")
+                            archivo.write(buffer.getvalue())
+                            buffer = None
+                        (buffer or archivo).write(chunk)
+
+                    if archivo is not None:
+                        archivo.close()
+
+                    if total > self.max_bytes:
+                        if archivo is not None:
+                            os.remove(ruta)
+                        resultado["error"] = f"Archivo supera el máximo de {self.max_bytes} bytes"
+                        return resultado
+
+                    if total == 0:
+                        if archivo is not None:
+                            os.remove(ruta)
+                        resultado["error"] = "Archivo vacío (0 bytes)"
+                        return resultado
+
+                    resultado["bytes"] = total
+                    resultado["sha256"] = hasher.hexdigest()
+
+                    if self.cache is not None:
+                        # La ruta solo se recuerda si el archivo es permanente
+                        self.cache.registrar(
+                            url, resp.headers, resultado["sha256"], total,
+                            ruta=None if saltar_sin_cambios or archivo is None else ruta,
+                        )
+                        if (saltar_sin_cambios and entrada
+                                and entrada.get("procesado_sha256") == resultado["sha256"]):
+                            # Servidor sin validadores pero mismo contenido
+                            if archivo is not None:
+                                os.remove(ruta)
+                            resultado["no_modificado"] = True
+                            return resultado
+
+                    if buffer is not None:
+                        resultado["contenido"] = buffer.getvalue()
+                    else:
+                        resultado["ruta"] = ruta
+            except Exception as e:
+                if archivo is not None:
+                    archivo.close()
+                    if os.path.exists(ruta):
+                        os.remove(ruta)
+                resultado["error"] = str(e)
+
+        return resultado
+
+    def descargar_varios(self, urls: Iterable[str], carpeta_destino: str,
+                         en_memoria_hasta: int = 0,
+                         saltar_sin_cambios: bool = False) -> Iterator[dict]:
+        """
+        Descarga varias URLs en paralelo y entrega cada resultado apenas termina
+        (el tiempo total es cercano al de la descarga más lenta).
+
+        Como mucho hay 2 x max_hilos descargas sin consumir a la vez, así que lo
+        que se guarda en memoria queda acotado aunque el consumidor sea lento.
+        Cada URL se guarda con su propio nombre en disco (ver `archivo_para_url`);
+        las URLs repetidas se descargan una sola vez.
+        """
+        ventana = self.max_hilos * 2
+        pendientes = set()
+        vistas = set()
+        with ThreadPoolExecutor(max_workers=self.max_hilos, thread_name_prefix="descarga") as ex:
+            for url in urls:
+                if url in vistas:
+                    continue
+                vistas.add(url)
+                pendientes.add(ex.submit(
+                    self.descargar, url, carpeta_destino, None,
+                    en_memoria_hasta, saltar_sin_cambios,
+                ))
+                if len(pendientes) >= ventana:
+                    listos, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+                    for futuro in listos:
+                        yield futuro.result()
+            for futuro in as_completed(pendientes):
+                yield futuro.result()
+
+
+def obtener_html(url: str, timeout: float = 20,
+                 sesion: Optional[requests.Session] = None,
+                 cache: Optional[CacheHTTP] = None) -> str:
+    """
+    Descarga una página HTML (para extraer enlaces) y devuelve su texto.
+    Con `cache` la página se revalida y un 304 se responde desde disco.
+    """
+    headers = dict(HEADERS_DESCARGA)
+    if cache is not None:
+        headers.update(cache.headers_condicionales(url, requiere_ruta=True))
+
+    resp = (sesion or requests).get(url, timeout=timeout, headers=headers)
+    if resp.status_code == 304 and cache is not None:
+        cuerpo = cache.leer_cuerpo(url)
+        entrada = cache.obtener(url) or {}
+        if cuerpo is not None:
+            cache.tocar(url)
+            return cuerpo.decode(entrada.get("encoding") or "utf-8", errors="replace")
+        # El cuerpo guardado desapareció: pedir la página completa
+        resp = (sesion or requests).get(url, timeout=timeout, headers=HEADERS_DESCARGA)
+
+    resp.raise_for_status()
+    if cache is not None:
+        cache.registrar(
+            url, resp.headers, hashlib.sha256(resp.content).hexdigest(), len(resp.content),
+            ruta=cache.guardar_cuerpo(resp.content), encoding=resp.encoding or resp.apparent_encoding,
+        )
+    return resp.text
+
+
+def extraer_links(html: str, url_base: str) -> List[str]:
+    """
+    Enlaces (<a href>) de una página como URLs absolutas, sin repetir y
+    ordenadas. Se omiten las anclas internas (#...).
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    links = set()
+    for a in soup.find_all("a", href=True):
+        href = a["href"]
+        if not href or href.startswith("#"):
+            continue
+        links.add(urljoin(url_base, href))
+    return sorted(links)
+
+
+def marcar_pdfs_procesados(urls: Iterable[str], cache: Optional[CacheHTTP] = None):
+    """
+    Marca como procesados (con el hash de su última descarga) los PDFs que ya
+    están en Elastic: la próxima pasada los salta si no cambiaron.
+    """
+    cache = cache or cache_global()
+    for url in urls:
+        cache.marcar_procesado(url)
 
 
 def descargar_pdfs_desde_url(
     url_inicial: str,
     tipos_archivos: str = "pdf",
     max_pdfs: int = 5,
-    max_paginas_por_pdf: int = 5,
+    max_paginas_por_pdf: Optional[int] = None,
+    extensiones: str = "",
+    max_profundidad: Optional[int] = None,
+    max_paginas: Optional[int] = None,
+    forzar: bool = False,
 ) -> List[dict]:
     """
     Desde una URL inicial:
-      - Busca enlaces que apunten a PDFs (u otras extensiones indicadas).
-      - Descarga hasta `max_pdfs` archivos.
-      - Extrae texto (hasta `max_paginas_por_pdf` páginas) con PyPDF2.
+      - Busca enlaces que apunten a PDFs (u otras extensiones indicadas). Si se
+        dan `extensiones` de página (aspx, php, html) recorre además las páginas
+        del mismo sitio hasta `max_profundidad` niveles (crawler.Crawler).
+      - Descarga hasta `max_pdfs` archivos en paralelo (DescargadorArchivos).
+      - Extrae texto con PyPDF2 en un pool de procesos (extraccion_pdf). Si no
+        se indica `max_paginas_por_pdf` se usa PDF_MAX_PAGINAS (0 = todas).
       - Devuelve una lista de documentos listos para indexar en Elastic.
 
+    Los PDFs que no cambiaron desde que se indexaron se saltan, salvo con
+    `forzar`. Aquí no se marca nada como procesado: eso lo hace quien indexa,
+    con marcar_pdfs_procesados, cuando Elastic ya aceptó los documentos.
+
     Cada documento tiene campos:
       - source
       - url_pdf
       - titulo
       - contenido
+      - num_paginas
+      - paginas (texto por página, para partirlo en pasajes al indexar)
     """
     docs: List[dict] = []
-
-    try:
-        resp = requests.get(url_inicial, timeout=20)
-        resp.raise_for_status()
-    except Exception as e:
-        print(f"[WEB] Error al acceder a la URL inicial: {e}")
-        return docs
-
-    soup = BeautifulSoup(resp.text, "lxml")
+    descargador = DescargadorArchivos(cache=cache_global())
 
     # Normalizar tipos de archivo (pdf, docx, etc.)
     tipos = [t.strip().lower() for t in tipos_archivos.split(",") if t.strip()]
     if not tipos:
         tipos = ["pdf"]
 
-    # Buscar enlaces
-    links_encontrados = []
-    for a in soup.find_all("a", href=True):
-        href = a["href"]
-        href_lower = href.lower()
-        if any(href_lower.endswith("." + ext) for ext in tipos):
-            full_url = urljoin(url_inicial, href)
-            if full_url not in links_encontrados:
-                links_encontrados.append(full_url)
+    # Sin extensiones de página solo se revisa la URL inicial (comportamiento
+    # anterior); con extensiones se recorren las páginas del sitio en anchura.
+    paginas = [e.strip() for e in (extensiones or "").split(",") if e.strip()]
+    if max_profundidad is None:
+        max_profundidad = CRAWLER_MAX_PROFUNDIDAD if paginas else 0
 
-    if not links_encontrados:
-        print("[WEB] No se encontraron enlaces a archivos con las extensiones indicadas.")
-        return docs
+    crawler = Crawler(
+        extensiones_pagina=paginas,
+        tipos_documento=tipos,
+        max_profundidad=max_profundidad,
+        max_paginas=max_paginas or CRAWLER_MAX_PAGINAS,
+        sesion=descargador.sesion,
+        obtener_pagina=lambda u: obtener_html(u, sesion=descargador.sesion, cache=descargador.cache),
+    )
+    # Los enlaces se consumen a medida que el crawler los encuentra: la descarga
+    # del primer PDF empieza mientras se siguen recorriendo páginas.
+    encontrados = 0
 
-    # Limitar cantidad de PDFs a descargar
-    links_encontrados = links_encontrados[:max_pdfs]
+    def links_encontrados():
+        nonlocal encontrados
+        for url_doc in itertools.islice(crawler.recorrer(url_inicial), max_pdfs):
+            encontrados += 1
+            yield url_doc
 
     # Carpeta temporal para los PDFs
     tmp_dir = tempfile.mkdtemp(prefix="webpdf_", dir="/tmp")
 
-    try:
-        for url_pdf in links_encontrados:
-            try:
-                print(f"[WEB] Descargando {url_pdf}")
-                pdf_resp = requests.get(url_pdf, timeout=40)
-                pdf_resp.raise_for_status()
-            except Exception as e:
-                print(f"[WEB] Error descargando PDF {url_pdf}: {e}")
-                continue
-
-            nombre_pdf = url_pdf.split("/")[-1] or "documento.pdf"
-            ruta_pdf = os.path.join(tmp_dir, nombre_pdf)
-
-            try:
-                with open(ruta_pdf, "wb") as f:
-                    f.write(pdf_resp.content)
-            except Exception as e:
-                print(f"[WEB] Error guardando PDF {nombre_pdf}: {e}")
-                continue
+    sin_cambios = 0
 
-            # Extraer texto con PyPDF2
-            texto = ""
-            try:
-                with open(ruta_pdf, "rb") as f:
-                    reader = PdfReader(f)
-                    num_pages = min(len(reader.pages), max_paginas_por_pdf)
-                    for i in range(num_pages):
-                        try:
-                            texto += reader.pages[i].extract_text() or ""
-                            texto += "\n"
-                        except Exception:
-                            continue
-            except Exception as e:
-                print(f"[WEB] Error leyendo PDF {nombre_pdf}: {e}")
+    def pdfs_descargados():
+        nonlocal sin_cambios
+        # Los PDFs pequeños se quedan en memoria: no se escriben y releen de disco.
+        # Los que no cambiaron desde la última pasada (304) ni se extraen.
+        for resultado in descargador.descargar_varios(
+            links_encontrados(), tmp_dir,
+            en_memoria_hasta=PDF_MEMORIA_MAX, saltar_sin_cambios=not forzar,
+        ):
+            url_pdf = resultado["url"]
+            if resultado["error"]:
+                print(f"[WEB] Error descargando PDF {url_pdf}: {resultado['error']}")
                 continue
-
-            texto = texto.strip()
-            if not texto:
-                print(f"[WEB] PDF sin texto legible: {nombre_pdf}")
+            if resultado["no_modificado"] and not resultado["ruta"]:
+                sin_cambios += 1
                 continue
-
-            doc = {
+            meta = {
                 "source": "web_scraping",
                 "url_pdf": url_pdf,
-                "titulo": nombre_pdf,
-                "contenido": texto,
+                "titulo": resultado["nombre"],
             }
+            yield resultado["contenido"] or resultado["ruta"], meta
+
+    try:
+        # Cada PDF pasa al pool de procesos apenas termina de descargarse
+        for doc in documentos_desde_pdfs(pdfs_descargados(), max_paginas=max_paginas_por_pdf,
+                                         con_paginas=True):
             docs.append(doc)
 
     finally:
@@ -121,5 +471,9 @@ def descargar_pdfs_desde_url(
         except Exception:
             pass
 
-    print(f"[WEB] Se generaron {len(docs)} documentos desde {url_inicial}")
+    if not encontrados:
+        print("[WEB] No se encontraron enlaces a archivos con las extensiones indicadas.")
+
+    print(f"[WEB] Se generaron {len(docs)} documentos desde {url_inicial} "
+          f"({sin_cambios} PDFs sin cambios desde la última pasada)")
     return docs